@@ -0,0 +1,163 @@
+from datetime import date
+import numbers
+import operator
+
+from approx_dates.models import ApproxDate
+import six
+
+from .graph import RELATIONS
+
+
+# The Popolo array that each foreign key field refers to; a field of
+# a joined record is named after the foreign key without its '_id',
+# e.g. 'person.gender' or 'on_behalf_of.name'.
+JOIN_TARGETS = dict(
+    RELATIONS, person_id='persons', parent_id='organizations')
+
+
+def _data_by_id(all_popolo, popolo_array):
+    return dict(
+        (data.get('id'), data)
+        for data in getattr(all_popolo, popolo_array).data_list)
+
+
+def field_getter(all_popolo, field):
+    '''Return a function that gets the value of field from a record's data
+
+    field can be the name of a field (e.g. 'role'), a field of a
+    joined record (e.g. 'person.gender'), or a function that's
+    passed the record's data. Missing values are None.'''
+    if callable(field):
+        return field
+    if '.' not in field:
+        return operator.methodcaller('get', field)
+    relation, joined_field = field.split('.', 1)
+    foreign_key = relation + '_id'
+    if foreign_key not in JOIN_TARGETS:
+        raise ValueError("Unknown relation {0} in {1}".format(
+            relation, field))
+    joined = _data_by_id(all_popolo, JOIN_TARGETS[foreign_key])
+
+    def get(data):
+        joined_data = joined.get(data.get(foreign_key))
+        if joined_data is None:
+            return None
+        return joined_data.get(joined_field)
+    return get
+
+
+def _parse_date(field, value):
+    if not isinstance(value, six.string_types):
+        raise TypeError("{0} should be a date, not {1!r}".format(
+            field, value))
+    return ApproxDate.from_iso8601(value)
+
+
+class GroupBy(object):
+    '''Aggregates the records of a collection grouped by some fields
+
+    This is returned by PopoloCollection.group_by. Each method makes a
+    single pass over the collection's data (not its Popolo objects)
+    and returns a dict mapping each group to the result. Groups are
+    identified by a tuple of the values of the fields, or just the
+    value if there's only one field. Fields are specified as for
+    field_getter.'''
+
+    def __init__(self, collection, fields):
+        if not fields:
+            raise ValueError("group_by needs at least one field")
+        self.collection = collection
+        self.fields = fields
+        getters = [field_getter(collection.all_popolo, f) for f in fields]
+        if len(getters) == 1:
+            self.group_of = getters[0]
+        else:
+            self.group_of = lambda data: tuple(g(data) for g in getters)
+
+    def count(self):
+        '''Return the number of records in each group'''
+        counts = {}
+        group_of = self.group_of
+        for data in self.collection.data_list:
+            group = group_of(data)
+            counts[group] = counts.get(group, 0) + 1
+        return counts
+
+    def _aggregate(self, field, combine):
+        value_of = field_getter(self.collection.all_popolo, field)
+        group_of = self.group_of
+        result = {}
+        for data in self.collection.data_list:
+            value = value_of(data)
+            if value is None:
+                continue
+            group = group_of(data)
+            if group in result:
+                result[group] = combine(result[group], value)
+            else:
+                result[group] = value
+        return result
+
+    def sum(self, field):
+        '''Return the total of field over each group
+
+        Records where field is missing are ignored, and groups with no
+        values of field are left out. Every value must be a number;
+        to add up how long each record lasted, use sum_days.'''
+        value_of = field_getter(self.collection.all_popolo, field)
+
+        def number_of(data):
+            value = value_of(data)
+            if value is not None and (
+                    isinstance(value, bool) or
+                    not isinstance(value, numbers.Number)):
+                raise TypeError(
+                    "Can't sum {0}: {1!r} isn't a number".format(
+                        field, value))
+            return value
+        return self._aggregate(number_of, operator.add)
+
+    def sum_days(self, start_field='start_date', end_field='end_date',
+                 as_of=None):
+        '''Return the total number of days the records in each group lasted
+
+        Each record counts from its start date to its end date
+        inclusive. Partial dates count from the earliest possible
+        start to the latest possible end, as in current_at, and a
+        missing end date counts as as_of (by default, today). Records
+        with no start date, or that start after they end, are
+        ignored. Overlapping records are each counted in full; see
+        Popolo.careers for the time each person actually served.'''
+        if as_of is None:
+            as_of = date.today()
+        all_popolo = self.collection.all_popolo
+        start_of = field_getter(all_popolo, start_field)
+        end_of = field_getter(all_popolo, end_field)
+
+        def days_of(data):
+            start_date = start_of(data)
+            if not start_date:
+                return None
+            start = _parse_date(start_field, start_date).earliest_date
+            end = as_of
+            end_date = end_of(data)
+            if end_date:
+                end = min(_parse_date(end_field, end_date).latest_date, as_of)
+            if start > end:
+                return None
+            return (end - start).days + 1
+        return self._aggregate(days_of, operator.add)
+
+    def min(self, field):
+        '''Return the smallest value of field in each group
+
+        Dates are compared as ISO 8601 strings, so e.g. min('start_date')
+        gives the earliest start date. Missing values are ignored, as
+        for sum.'''
+        return self._aggregate(field, min)
+
+    def max(self, field):
+        '''Return the largest value of field in each group
+
+        Missing values are ignored, as for sum.'''
+        return self._aggregate(field, max)
@@ -1,12 +1,73 @@
+from bisect import bisect_right
 from datetime import date
+import hashlib
 import json
 import re
+import threading
+import unicodedata
+import weakref
 
 
 from approx_dates.models import ApproxDate
 from six.moves.urllib_parse import urlsplit
 import six
 
+from .aggregate import GroupBy
+from .references import all_popolo_property
+
+
+class BuildCache(dict):
+    '''A dict of lazily built values, such as indexes (see build_once)
+
+    Each key being built has its own lock, so building one value
+    never waits for a different one to be built, whether in this
+    cache or in another dataset's. Values are built in full before
+    being stored, so reads never need to take a lock.'''
+
+    def __init__(self, *args, **kwargs):
+        super(BuildCache, self).__init__(*args, **kwargs)
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def lock_for(self, key):
+        '''Return the lock that is held while the value of key is built'''
+        with self._locks_lock:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.RLock()
+            return lock
+
+    def _release_lock(self, key):
+        with self._locks_lock:
+            self._locks.pop(key, None)
+
+
+def build_once(cache, key, build):
+    '''Return cache[key], calling build() to create it if it's missing
+
+    cache is a BuildCache. This is double-checked locking: once the
+    value exists it's returned without taking a lock, and if several
+    threads need it at once only one builds it while the others wait.'''
+    try:
+        return cache[key]
+    except KeyError:
+        pass
+    with cache.lock_for(key):
+        try:
+            return cache[key]
+        except KeyError:
+            pass
+        try:
+            value = build()
+            cache[key] = value
+        finally:
+            # Once the value is stored the lock isn't needed, and
+            # dropping it stops locks piling up for old keys:
+            cache._release_lock(key)
+        # The value is returned rather than read back, since another
+        # thread may already have dropped it from the cache:
+        return value
+
 
 class ObjectDoesNotExist(Exception):
     pass
@@ -16,19 +77,137 @@ class MultipleObjectsReturned(Exception):
     pass
 
 
-def _is_name_current_at(name_object, date_string):
-    start_range = name_object.get('start_date') or '0001-01-01'
-    end_range = name_object.get('end_date') or '9999-12-31'
-    return date_string >= start_range and date_string <= end_range
+class FieldNotLoaded(Exception):
+    pass
+
+
+class ProjectedData(dict):
+    '''The data of a record that was loaded with only some of its fields
+
+    This is an ordinary dict, so code working with the data directly
+    sees any other field as missing, but the properties of Popolo
+    objects (through PopoloObject.get_field) raise FieldNotLoaded
+    instead. Use projected_data_class to get a subclass for a set of
+    fields.'''
+
+    __slots__ = ()
+    loaded_fields = frozenset()
+
+
+# Fields that are always loaded, since records are looked up by them.
+ALWAYS_LOADED_FIELDS = frozenset(['id'])
+
+_projected_data_classes = {}
+
+
+def projected_data_class(fields):
+    '''Return the ProjectedData subclass for records with these fields'''
+    fields = frozenset(fields) | ALWAYS_LOADED_FIELDS
+    try:
+        return _projected_data_classes[fields]
+    except KeyError:
+        data_class = type(str('ProjectedData'), (ProjectedData,), {
+            '__slots__': (), 'loaded_fields': fields})
+        return _projected_data_classes.setdefault(fields, data_class)
+
+
+def project_records(records, fields, popolo_array=None):
+    '''Return copies of records with only the given fields
+
+    The copies are ProjectedData, so getting any other field through a
+    property of a Popolo object raises FieldNotLoaded. If popolo_array
+    is 'memberships', the fields in MEMBERSHIP_IDENTITY_FIELDS are
+    kept too, so that each copy has the same fingerprint as the full
+    record (which diff, update and in_bulk rely on).'''
+    if popolo_array == 'memberships':
+        fields = frozenset(fields) | frozenset(MEMBERSHIP_IDENTITY_FIELDS)
+    data_class = projected_data_class(fields)
+    loaded = data_class.loaded_fields
+    return [
+        data_class((k, data[k]) for k in loaded if k in data)
+        for data in records]
+
+
+# The fields that identify a membership: two memberships that only
+# differ in other fields (e.g. end_date) are different versions of
+# the same membership.
+MEMBERSHIP_IDENTITY_FIELDS = (
+    'person_id', 'organization_id', 'on_behalf_of_id', 'post_id',
+    'area_id', 'legislative_period_id', 'role', 'start_date',
+)
+
+
+def membership_fingerprint(membership_data):
+    '''Return a stable identifier for the data of a membership
+
+    Memberships in Popolo don't usually have an id, so this is used
+    to refer to them instead.'''
+    if membership_data.get('id'):
+        return membership_data['id']
+    values = [membership_data.get(f) for f in MEMBERSHIP_IDENTITY_FIELDS]
+    serialized = json.dumps(values, separators=(',', ':'))
+    return hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+
+
+_WHITESPACE_RE = re.compile(r'\s+', re.UNICODE)
+
+
+def normalize_name(name):
+    '''Return a version of name for comparisons ignoring case and accents
+
+    The name is decomposed (Unicode NFKD), combining characters like
+    accents are removed, it's case folded and runs of whitespace are
+    collapsed to a single space.'''
+    if name is None:
+        return None
+    decomposed = unicodedata.normalize('NFKD', six.text_type(name))
+    stripped = u''.join(c for c in decomposed if not unicodedata.combining(c))
+    if hasattr(stripped, 'casefold'):
+        folded = stripped.casefold()
+    else:
+        folded = stripped.lower()
+    return _WHITESPACE_RE.sub(u' ', folded).strip()
+
+
+_TWITTER_PATH_RE = re.compile(r'^/([^/]+).*')
 
 
 def extract_twitter_username(username_or_url):
-    split_url = urlsplit(username_or_url)
-    if split_url.netloc == 'twitter.com':
-        return re.sub(r'^/([^/]+).*', r'\1', split_url.path)
+    # Most values are plain usernames, so avoid parsing them as URLs:
+    if 'twitter.com' in username_or_url:
+        split_url = urlsplit(username_or_url)
+        if split_url.netloc == 'twitter.com':
+            return _TWITTER_PATH_RE.sub(r'\1', split_url.path)
     return username_or_url.strip().lstrip('@')
 
 
+# Where each kind of contact value is found on a person: the
+# 'type' of their contact_details and the 'note' of their links.
+CONTACT_DETAIL_TYPES = ('twitter', 'phone', 'fax')
+LINK_NOTES = ('twitter', 'facebook')
+CONTACT_KINDS = ('twitter', 'facebook', 'phone', 'fax')
+
+
+def contact_values_from_data(person_data):
+    '''Return a dict mapping each contact kind to a person's values
+
+    This looks through the person's contact_details and links once,
+    rather than once per kind. Values are in the same order as the
+    corresponding *_all properties of Person.'''
+    found = dict((kind, []) for kind in CONTACT_KINDS)
+    for contact_detail in person_data.get('contact_details', []):
+        kind = contact_detail.get('type')
+        if kind in CONTACT_DETAIL_TYPES:
+            found[kind].append(contact_detail['value'])
+    for link in person_data.get('links', []):
+        kind = link.get('note')
+        if kind in LINK_NOTES:
+            found[kind].append(link['url'])
+    found['twitter'] = unique_preserving_order(
+        extract_twitter_username(v) for v in found['twitter'])
+    return found
+
+
 def first(l):
     '''Return the first item of a list, or None if it's empty'''
     return l[0] if l else None
@@ -43,20 +222,63 @@ def unique_preserving_order(sequence):
     return [x for x in sequence if not (x in seen or seen_add(x))]
 
 
+NORMALIZED_SUFFIX = '__normalized'
+
+
 class PopoloObject(object):
 
+    all_popolo = all_popolo_property
+
     def __init__(self, data, all_popolo):
         self.data = data
         self.all_popolo = all_popolo
+        self._normalized = {}
+
+    def normalized(self, attr):
+        '''Return the value of attr passed through normalize_name
+
+        This is only worked out once for each attribute of an object.'''
+        try:
+            return self._normalized[attr]
+        except KeyError:
+            value = normalize_name(getattr(self, attr))
+            self._normalized[attr] = value
+            return value
+
+    @property
+    def normalized_names(self):
+        '''Return the set of normalized versions of all this object's names'''
+        try:
+            return self._normalized[None]
+        except KeyError:
+            other_names = self.get_field('other_names', [])
+            names = [self.get_field('name')]
+            names.extend(n.get('name') for n in other_names)
+            value = frozenset(normalize_name(n) for n in names if n)
+            self._normalized[None] = value
+            return value
+
+    def get_field(self, field, default=None):
+        '''Return the value of field in the record, or default if it's unset
+
+        If the record was loaded with only some of its fields (see
+        projection), getting any other field raises FieldNotLoaded
+        rather than looking as if the record just doesn't have it.'''
+        loaded_fields = getattr(self.data, 'loaded_fields', None)
+        if loaded_fields is not None and field not in loaded_fields:
+            raise FieldNotLoaded(
+                "The field {0!r} wasn't loaded; loaded fields are: {1}".format(
+                    field, ', '.join(sorted(loaded_fields))))
+        return self.data.get(field, default)
 
     def get_date(self, attr, default):
-        d = self.data.get(attr)
+        d = self.get_field(attr)
         if d:
             return ApproxDate.from_iso8601(d)
         return default
 
     def get_related_object_list(self, popolo_array):
-        return self.data.get(popolo_array, [])
+        return self.get_field(popolo_array, [])
 
     def get_related_values(
             self, popolo_array, info_type_key, info_type, info_value_key):
@@ -156,49 +378,53 @@ class Person(PopoloObject):
     class MultipleObjectsReturned(MultipleObjectsReturned):
         pass
 
+    def __init__(self, data, all_popolo):
+        super(Person, self).__init__(data, all_popolo)
+        self._name_timeline = None
+
     @property
     def id(self):
-        return self.data.get('id')
+        return self.get_field('id')
 
     @property
     def email(self):
-        return self.data.get('email')
+        return self.get_field('email')
 
     @property
     def gender(self):
-        return self.data.get('gender')
+        return self.get_field('gender')
 
     @property
     def honorific_prefix(self):
-        return self.data.get('honorific_prefix')
+        return self.get_field('honorific_prefix')
 
     @property
     def honorific_suffix(self):
-        return self.data.get('honorific_suffix')
+        return self.get_field('honorific_suffix')
 
     @property
     def image(self):
-        return self.data.get('image')
+        return self.get_field('image')
 
     @property
     def name(self):
-        return self.data.get('name')
+        return self.get_field('name')
 
     @property
     def sort_name(self):
-        return self.data.get('sort_name')
+        return self.get_field('sort_name')
 
     @property
     def national_identity(self):
-        return self.data.get('national_identity')
+        return self.get_field('national_identity')
 
     @property
     def summary(self):
-        return self.data.get('summary')
+        return self.get_field('summary')
 
     @property
     def biography(self):
-        return self.data.get('biography')
+        return self.get_field('biography')
 
     @property
     def birth_date(self):
@@ -210,11 +436,11 @@ class Person(PopoloObject):
 
     @property
     def family_name(self):
-        return self.data.get('family_name')
+        return self.get_field('family_name')
 
     @property
     def given_name(self):
-        return self.data.get('given_name')
+        return self.get_field('given_name')
 
     @property
     def wikidata(self):
@@ -264,20 +490,41 @@ class Person(PopoloObject):
     def __repr__(self):
         return self.repr_helper(self.name)
 
+    @property
+    def name_timeline(self):
+        '''Historic names (those with an end date) sorted by start date
+
+        Each entry is a (start_date, end_date, name) tuple, where the
+        dates are ISO 8601 strings. This is only worked out once for
+        each Person object.'''
+        return self._timeline_and_starts()[0]
+
+    def _timeline_and_starts(self):
+        # The timeline and its start dates are published together, so
+        # other threads never see one without the other.
+        if self._name_timeline is None:
+            timeline = sorted(
+                (n.get('start_date') or '0001-01-01', n['end_date'], n['name'])
+                for n in self.other_names if n.get('end_date'))
+            self._name_timeline = (timeline, [t[0] for t in timeline])
+        return self._name_timeline
+
+    def historic_names_at(self, particular_date):
+        '''Return a list of the historic names current at particular_date'''
+        timeline, starts = self._timeline_and_starts()
+        date_string = str(particular_date)
+        # Only names starting on or before the date can be current:
+        n = bisect_right(starts, date_string)
+        return [name for _, end, name in timeline[:n] if date_string <= end]
+
     def name_at(self, particular_date):
-        historic_names = [n for n in self.other_names if n.get('end_date')]
-        if not historic_names:
-            return self.name
-        names_at_date = [
-            n for n in historic_names
-            if _is_name_current_at(n, str(particular_date))
-        ]
+        names_at_date = self.historic_names_at(particular_date)
         if not names_at_date:
             return self.name
         if len(names_at_date) > 1:
             msg = "Multiple names for {0} found at date {1}"
             raise Exception(msg.format(self, particular_date))
-        return names_at_date[0]['name']
+        return names_at_date[0]
 
     @property
     def links(self):
@@ -305,11 +552,7 @@ class Person(PopoloObject):
 
     @property
     def memberships(self):
-        memberships_list = [
-            m.data for m in self.all_popolo.memberships
-            if m.person_id == self.id
-        ]
-        return MembershipCollection(memberships_list, self.all_popolo)
+        return self.all_popolo.memberships.filter(person_id=self.id)
 
     __hash__ = PopoloObject.__hash__
 
@@ -324,11 +567,11 @@ class Organization(PopoloObject):
 
     @property
     def id(self):
-        return self.data.get('id')
+        return self.get_field('id')
 
     @property
     def name(self):
-        return self.data.get('name')
+        return self.get_field('name')
 
     @property
     def wikidata(self):
@@ -336,11 +579,11 @@ class Organization(PopoloObject):
 
     @property
     def classification(self):
-        return self.data.get('classification')
+        return self.get_field('classification')
 
     @property
     def image(self):
-        return self.data.get('image')
+        return self.get_field('image')
 
     @property
     def founding_date(self):
@@ -352,11 +595,16 @@ class Organization(PopoloObject):
 
     @property
     def seats(self):
-        return self.data.get('seats')
+        return self.get_field('seats')
 
     @property
     def other_names(self):
-        return self.data.get('other_names', [])
+        return self.get_field('other_names', [])
+
+    @property
+    def composition(self):
+        '''Return the CompositionTimeline of this organization'''
+        return self.all_popolo.composition(self.id)
 
     def __repr__(self):
         return self.repr_helper(self.name)
@@ -380,11 +628,11 @@ class Membership(CurrentMixin, PopoloObject):
 
     @property
     def role(self):
-        return self.data.get('role')
+        return self.get_field('role')
 
     @property
     def person_id(self):
-        return self.data.get('person_id')
+        return self.get_field('person_id')
 
     @property
     def person(self):
@@ -392,7 +640,7 @@ class Membership(CurrentMixin, PopoloObject):
 
     @property
     def organization_id(self):
-        return self.data.get('organization_id')
+        return self.get_field('organization_id')
 
     @property
     def organization(self):
@@ -401,7 +649,7 @@ class Membership(CurrentMixin, PopoloObject):
 
     @property
     def area_id(self):
-        return self.data.get('area_id')
+        return self.get_field('area_id')
 
     @property
     def area(self):
@@ -409,7 +657,7 @@ class Membership(CurrentMixin, PopoloObject):
 
     @property
     def legislative_period_id(self):
-        return self.data.get('legislative_period_id')
+        return self.get_field('legislative_period_id')
 
     @property
     def legislative_period(self):
@@ -418,7 +666,7 @@ class Membership(CurrentMixin, PopoloObject):
 
     @property
     def on_behalf_of_id(self):
-        return self.data.get('on_behalf_of_id')
+        return self.get_field('on_behalf_of_id')
 
     @property
     def on_behalf_of(self):
@@ -427,7 +675,7 @@ class Membership(CurrentMixin, PopoloObject):
 
     @property
     def post_id(self):
-        return self.data.get('post_id')
+        return self.get_field('post_id')
 
     @property
     def post(self):
@@ -441,6 +689,10 @@ class Membership(CurrentMixin, PopoloObject):
     def end_date(self):
         return self.get_date('end_date', ApproxDate.FUTURE)
 
+    @property
+    def fingerprint(self):
+        return membership_fingerprint(self.data)
+
     def __repr__(self):
         enclosed = u"'{0}' at '{1}'".format(
             self.person_id, self.organization_id)
@@ -468,15 +720,15 @@ class Area(PopoloObject):
 
     @property
     def id(self):
-        return self.data.get('id')
+        return self.get_field('id')
 
     @property
     def name(self):
-        return self.data.get('name')
+        return self.get_field('name')
 
     @property
     def type(self):
-        return self.data.get('type')
+        return self.get_field('type')
 
     @property
     def identifiers(self):
@@ -498,15 +750,15 @@ class Post(PopoloObject):
 
     @property
     def id(self):
-        return self.data.get('id')
+        return self.get_field('id')
 
     @property
     def label(self):
-        return self.data.get('label')
+        return self.get_field('label')
 
     @property
     def organization_id(self):
-        return self.data.get('organization_id')
+        return self.get_field('organization_id')
 
     @property
     def organization(self):
@@ -521,15 +773,15 @@ class Event(CurrentMixin, PopoloObject):
 
     @property
     def id(self):
-        return self.data.get('id')
+        return self.get_field('id')
 
     @property
     def name(self):
-        return self.data.get('name')
+        return self.get_field('name')
 
     @property
     def classification(self):
-        return self.data.get('classification')
+        return self.get_field('classification')
 
     @property
     def start_date(self):
@@ -541,7 +793,7 @@ class Event(CurrentMixin, PopoloObject):
 
     @property
     def organization_id(self):
-        return self.data.get('organization_id')
+        return self.get_field('organization_id')
 
     @property
     def organization(self):
@@ -557,26 +809,270 @@ class Event(CurrentMixin, PopoloObject):
 
     @property
     def memberships(self):
-        memberships_list = [
-            m.data for m in self.all_popolo.memberships
-            if m.legislative_period_id == self.id
-        ]
-        return MembershipCollection(memberships_list, self.all_popolo)
+        return self.all_popolo.memberships.filter(
+            legislative_period_id=self.id)
+
+
+def sort_key(value, descending=False):
+    '''Return a key for sorting objects by an attribute value
+
+    Approximate dates are compared by their midpoint, and missing
+    values always sort last.'''
+    if isinstance(value, ApproxDate):
+        value = value.midpoint_date
+    if descending:
+        return (value is not None, value)
+    return (value is None, value)
+
+
+class OrderedView(object):
+    '''The objects of a collection, sorted by one of their attributes
+
+    This is returned by PopoloCollection.order_by. Indexing or slicing
+    it (e.g. view[:10] for the first 10 objects) takes time in
+    proportion to the number of objects returned, and between finds a
+    range of values by binary search.'''
+
+    def __init__(self, objects, positions, keys, attr, descending):
+        self.objects = objects
+        self.positions = positions
+        self.keys = keys
+        self.attr = attr
+        self.descending = descending
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __iter__(self):
+        for i in self.positions:
+            yield self.objects[i]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.objects[i] for i in self.positions[index]]
+        return self.objects[self.positions[index]]
+
+    def __repr__(self):
+        return '<OrderedView: {0} objects by {1}{2}>'.format(
+            len(self), '-' if self.descending else '', self.attr)
+
+    @property
+    def first(self):
+        return self[0] if self.positions else None
+
+    def _bisect(self, value, right):
+        '''Find where value would be inserted, like bisect_left/right'''
+        key = sort_key(value, self.descending)
+        lo, hi = 0, len(self.keys)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            k = self.keys[mid]
+            if self.descending:
+                before = k > key or (right and k == key)
+            else:
+                before = k < key or (right and k == key)
+            if before:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def between(self, start=None, end=None):
+        '''Return the objects whose value is from start to end inclusive
+
+        For a descending view, start should be the larger value. Either
+        can be None to leave that end of the range open.'''
+        lo = 0 if start is None else self._bisect(start, False)
+        hi = len(self.keys) if end is None else self._bisect(end, True)
+        return [self.objects[i] for i in self.positions[lo:hi]]
+
+
+class IdentityMap(object):
+    '''Makes sure each record of a dataset has just one Popolo object
+
+    Objects are looked up by the identity of the record's data, so a
+    record whose data is replaced (e.g. by Popolo.update) gets a new
+    object. With the 'strong' policy every object created is kept
+    until the dataset is released; with 'weak', an object is only
+    kept while something else refers to it.'''
+
+    POLICIES = ('strong', 'weak')
+
+    def __init__(self, policy='strong'):
+        if policy == 'strong':
+            self.objects = {}
+        elif policy == 'weak':
+            self.objects = weakref.WeakValueDictionary()
+        else:
+            raise ValueError("Unknown identity map policy {0}".format(policy))
+        self.policy = policy
+
+    def __len__(self):
+        return len(self.objects)
+
+    def wrap(self, object_class, data, all_popolo):
+        '''Return the object wrapping data, creating it if necessary'''
+        o = self.objects.get(id(data))
+        if o is None:
+            o = self.objects.setdefault(
+                id(data), object_class(data, all_popolo))
+        return o
+
+    def discard(self, data):
+        '''Forget the object wrapping data, e.g. once it's been replaced'''
+        self.objects.pop(id(data), None)
+
+
+MISSING_OPTIONS = ('skip', 'none', 'raise')
+
+
+def find_in_bulk(ids, lookup, missing, object_class):
+    '''Return a dict mapping each of ids to lookup(id)
+
+    lookup returns None for an id with no object; missing says what to
+    do then, as for PopoloCollection.in_bulk.'''
+    if missing not in MISSING_OPTIONS:
+        raise ValueError("Unknown missing option {0}".format(missing))
+    found = {}
+    not_found = []
+    for key in ids:
+        o = lookup(key)
+        if o is not None:
+            found[key] = o
+        elif missing == 'none':
+            found[key] = None
+        else:
+            not_found.append(key)
+    if not_found and missing == 'raise':
+        exception_class = getattr(
+            object_class, 'DoesNotExist', ObjectDoesNotExist)
+        msg = "No {0} found with ids {1}"
+        raise exception_class(msg.format(object_class, not_found))
+    return found
 
 
 class PopoloCollection(object):
+    '''A collection of Popolo objects of one class
+
+    Normally this wraps each dict in data_list in an object_class
+    object, reusing existing objects from the dataset's identity map
+    if it has one. The objects are only created when they're first
+    needed, so anything that just uses data_list (like group_by)
+    doesn't create any. If objects is given instead, the collection
+    is a view of those existing objects (e.g. the result of filter),
+    so they keep their identity and nothing is wrapped again.'''
+
+    all_popolo = all_popolo_property
 
-    def __init__(self, data_list, object_class, all_popolo):
+    def __init__(self, data_list, object_class, all_popolo, objects=None):
         self.all_popolo = all_popolo
         self.object_class = object_class
-        self.object_list = \
-            [self.object_class(data, all_popolo) for data in data_list]
-        self.lookup_from_key = {}
-        for o in self.object_list:
-            self.lookup_from_key[o.key_for_hash] = o
+        if objects is None:
+            self._data_list = data_list
+            self._object_list_lock = threading.Lock()
+        else:
+            self._data_list = None
+        self._object_list = objects
+        self._lookup_from_key = None
+        self._normalized_indexes = BuildCache()
+
+    def _view(self, objects):
+        '''Return a collection of the same class with just these objects'''
+        return self.__class__(None, self.all_popolo, objects=objects)
+
+    @property
+    def object_list(self):
+        objects = self._object_list
+        if objects is None:
+            with self._object_list_lock:
+                objects = self._object_list
+                if objects is None:
+                    objects = self._wrap_all()
+                    self._object_list = objects
+        return objects
+
+    def _wrap_all(self):
+        object_class = self.object_class
+        all_popolo = self.all_popolo
+        identity_map = getattr(all_popolo, 'identity_map', None)
+        if identity_map is None:
+            return [object_class(data, all_popolo) for data in self._data_list]
+        wrap = identity_map.wrap
+        return [
+            wrap(object_class, data, all_popolo) for data in self._data_list]
+
+    def _wrap(self, data):
+        identity_map = getattr(self.all_popolo, 'identity_map', None)
+        if identity_map is None:
+            return self.object_class(data, self.all_popolo)
+        return identity_map.wrap(self.object_class, data, self.all_popolo)
+
+    def _record_changed(self, action, position, positions):
+        '''Update the collection after a record of its array changed
+
+        This is for collections of a whole Popolo array, whose
+        data_list is the dataset's own list and has already been
+        changed: action is 'add', 'update' or 'remove', position is
+        where the record was, and positions is the dataset's index of
+        record positions by key (see Popolo._array_positions).
+        lookup_from_key is updated in place if it's been built. The
+        list of objects is copied before it's changed, since anything
+        already using it (like an OrderedView) must keep seeing the
+        objects it was made with; copying a list of references is
+        cheap compared to wrapping every record again. Other indexes
+        are rebuilt when next needed.'''
+        self._normalized_indexes.clear()
+        objects = self._object_list
+        if objects is None:
+            return
+        objects = list(objects)
+        changed = []
+        if action == 'remove':
+            changed.append(objects.pop(position))
+        else:
+            o = self._wrap(self._data_list[position])
+            changed.append(o)
+            if action == 'add':
+                objects.append(o)
+            else:
+                changed.append(objects[position])
+                objects[position] = o
+        self._object_list = objects
+        lookup = self._lookup_from_key
+        if lookup is not None:
+            for key in set(self._key_of(o) for o in changed):
+                found = positions.get(key)
+                if found:
+                    lookup[key] = objects[max(found)]
+                else:
+                    lookup.pop(key, None)
+
+    @property
+    def data_list(self):
+        if self._data_list is None:
+            self._data_list = [o.data for o in self.object_list]
+        return self._data_list
+
+    @property
+    def lookup_from_key(self):
+        '''Return a dict mapping the key of each object to the object
+
+        The key is the id, or for memberships the fingerprint.'''
+        lookup = self._lookup_from_key
+        if lookup is None:
+            key_of = self._key_of
+            lookup = dict((key_of(o), o) for o in self.object_list)
+            self._lookup_from_key = lookup
+        return lookup
+
+    @staticmethod
+    def _key_of(o):
+        return o.key_for_hash
 
     def __len__(self):
-        return len(self.object_list)
+        if self._object_list is None:
+            return len(self._data_list)
+        return len(self._object_list)
 
     def __getitem__(self, index):
         return self.object_list[index]
@@ -585,12 +1081,105 @@ class PopoloCollection(object):
     def first(self):
         return first(self.object_list)
 
+    def normalized_index(self, attr):
+        '''Return a dict mapping normalized values of attr to objects
+
+        The 'names' attribute indexes objects by each of their
+        normalized_names.'''
+        return build_once(
+            self._normalized_indexes, attr,
+            lambda: self._build_normalized_index(attr))
+
+    def _build_normalized_index(self, attr):
+        index = {}
+        for o in self.object_list:
+            if attr == 'names':
+                keys = o.normalized_names
+            else:
+                keys = [o.normalized(attr)]
+            for key in keys:
+                index.setdefault(key, []).append(o)
+        return index
+
+    def order_by(self, attr):
+        '''Return an OrderedView of the objects sorted by attr
+
+        Prefix attr with '-' (e.g. '-start_date') to sort in descending
+        order; objects with equal values stay in their original order.
+        The sort order is cached on the Popolo object until the data
+        is next changed, so it's only worked out once for the whole
+        of each array.'''
+        descending = attr.startswith('-')
+        attr = attr.lstrip('-')
+        caches = getattr(self.all_popolo, '_caches', None)
+        cache_key = ('order_by', self.object_class.__name__, attr, descending)
+        cached = caches.get(cache_key) if caches is not None else None
+        if cached is not None and cached[0] is self.data_list:
+            positions, keys = cached[1:]
+        else:
+            keys = [
+                sort_key(getattr(o, attr), descending)
+                for o in self.object_list]
+            positions = sorted(
+                range(len(keys)), key=keys.__getitem__, reverse=descending)
+            keys = [keys[i] for i in positions]
+            # Each cache entry is for one list of data; the longest is
+            # kept, so that filtered collections don't replace the
+            # entry for the whole array:
+            if caches is not None and (
+                    cached is None or len(cached[0]) <= len(self.data_list)):
+                caches[cache_key] = (self.data_list, positions, keys)
+        return OrderedView(
+            self.object_list, positions, keys, attr, descending)
+
+    def group_by(self, *fields):
+        '''Group the records of this collection for aggregation
+
+        For example, memberships.group_by('legislative_period_id',
+        'on_behalf_of_id').count() counts seats per party per term, and
+        fields of joined records can be used too, like 'person.gender'.
+        See GroupBy for the aggregations available.'''
+        return GroupBy(self, fields)
+
     def filter(self, **kwargs):
-        filter_list = [
-            o.data for o in self.object_list
-            if all(getattr(o, k) == v for k, v in kwargs.items())
-        ]
-        return self.__class__(filter_list, self.all_popolo)
+        '''Return a collection of the objects matching every keyword argument
+
+        A keyword argument like name__normalized='...' matches objects
+        whose name is the same after passing both through
+        normalize_name; names__normalized matches against the name
+        and all other_names. These are looked up in an index.'''
+        candidates = None
+        lookups = []
+        for k, v in kwargs.items():
+            if k.endswith(NORMALIZED_SUFFIX):
+                attr = k[:-len(NORMALIZED_SUFFIX)]
+                found = self.normalized_index(attr).get(normalize_name(v), [])
+                if candidates is None:
+                    candidates = found
+                else:
+                    found_ids = set(id(o) for o in found)
+                    candidates = [o for o in candidates if id(o) in found_ids]
+            else:
+                lookups.append((k, v))
+        if candidates is None:
+            candidates = self.object_list
+        return self._view([
+            o for o in candidates
+            if all(getattr(o, k) == v for k, v in lookups)
+        ])
+
+    def unique_by_normalized_name(self):
+        '''Return a collection with only the first object with each name
+
+        Names are compared after passing them through normalize_name.'''
+        seen = set()
+        unique_list = []
+        for o in self.object_list:
+            key = o.normalized('name')
+            if key not in seen:
+                seen.add(key)
+                unique_list.append(o)
+        return self._view(unique_list)
 
     def get(self, **kwargs):
         matches = self.filter(**kwargs)
@@ -605,56 +1194,196 @@ class PopoloCollection(object):
                 self.object_class, n, kwargs))
         return matches[0]
 
+    def in_bulk(self, ids, missing='skip'):
+        '''Return a dict mapping each of ids to the object with that id
+
+        This uses lookup_from_key, so takes time in proportion to the
+        number of ids rather than the size of the collection. For
+        memberships the ids are fingerprints (see
+        membership_fingerprint). If there is no object with one of the
+        ids, missing says what to do: 'skip' leaves it out, 'none'
+        maps it to None, and 'raise' raises DoesNotExist listing all
+        the missing ids.'''
+        return find_in_bulk(
+            ids, self.lookup_from_key.get, missing, self.object_class)
+
+    def get_many(self, ids, missing='skip'):
+        '''Return a list of the objects with each of ids, in that order
+
+        missing is as for in_bulk.'''
+        found = self.in_bulk(ids, missing)
+        return [found[key] for key in ids if key in found]
+
+    def related(self, field, popolo_array):
+        '''Return a collection of the objects that field refers to
+
+        For example, memberships.related('person_id', 'persons') gives
+        each person with one of the memberships once, in the order
+        they're first referred to. Ids with no matching object are
+        left out.'''
+        ids = unique_preserving_order(
+            data.get(field) for data in self.data_list)
+        ids = [i for i in ids if i is not None]
+        target = getattr(self.all_popolo, popolo_array)
+        return target._view(target.get_many(ids))
+
 
 class PersonCollection(PopoloCollection):
 
-    def __init__(self, persons_data, all_popolo):
+    def __init__(self, persons_data, all_popolo, objects=None):
         super(PersonCollection, self).__init__(
-            persons_data, Person, all_popolo)
+            persons_data, Person, all_popolo, objects)
+        self._contact_caches = BuildCache()
+
+    def _record_changed(self, action, position, positions):
+        super(PersonCollection, self)._record_changed(
+            action, position, positions)
+        self._contact_caches.clear()
+
+    def contact_values(self, kind):
+        '''Return a dict mapping each Person to their values of one kind
+
+        kind is one of 'twitter', 'facebook', 'phone' or 'fax'. The
+        values for all kinds are extracted in a single pass over the
+        collection the first time this is called, and then cached.'''
+        if kind not in CONTACT_KINDS:
+            raise ValueError("Unknown contact kind {0}".format(kind))
+        return build_once(
+            self._contact_caches, None, self._build_contact_values)[kind]
+
+    def _build_contact_values(self):
+        contact_values = dict((k, {}) for k in CONTACT_KINDS)
+        for person in self.object_list:
+            found = contact_values_from_data(person.data)
+            for k, values in found.items():
+                if values:
+                    contact_values[k][person] = values
+        return contact_values
+
+    def twitter_handles(self):
+        return self.contact_values('twitter')
+
+    def facebook_urls(self):
+        return self.contact_values('facebook')
+
+    def phone_numbers(self):
+        return self.contact_values('phone')
+
+    def fax_numbers(self):
+        return self.contact_values('fax')
+
+    def find_by_contact(self, kind, value):
+        '''Return the persons with a contact value of this kind
+
+        Twitter handles are matched case-insensitively, and can be
+        given as URLs or with an '@' prefix. This uses a reverse
+        index from values to persons that is built on first use.'''
+        index = build_once(
+            self._contact_caches, kind,
+            lambda: self._build_contact_index(kind))
+        return index.get(self._contact_key(kind, value), [])
+
+    def _build_contact_index(self, kind):
+        index = {}
+        for person, values in self.contact_values(kind).items():
+            for v in values:
+                index.setdefault(self._contact_key(kind, v), []).append(
+                    person)
+        return index
+
+    @staticmethod
+    def _contact_key(kind, value):
+        if kind == 'twitter':
+            return extract_twitter_username(value).lower()
+        return value
+
+    def find_by_twitter_handle(self, handle):
+        return self.find_by_contact('twitter', handle)
+
+    def names_at(self, particular_date):
+        '''Find the name of every person at particular_date in one pass
+
+        This returns a tuple of two dicts: the first maps each Person
+        to their name at that date, and the second maps any Person
+        with more than one historic name at that date (for whom
+        name_at would raise an exception) to the list of those
+        names.'''
+        names = {}
+        conflicts = {}
+        for person in self.object_list:
+            names_at_date = person.historic_names_at(particular_date)
+            if len(names_at_date) > 1:
+                conflicts[person] = names_at_date
+            elif names_at_date:
+                names[person] = names_at_date[0]
+            else:
+                names[person] = person.name
+        return names, conflicts
 
 
 class OrganizationCollection(PopoloCollection):
 
-    def __init__(self, organizations_data, all_popolo):
+    def __init__(self, organizations_data, all_popolo, objects=None):
         super(OrganizationCollection, self).__init__(
-            organizations_data, Organization, all_popolo)
+            organizations_data, Organization, all_popolo, objects)
 
 
 class MembershipCollection(PopoloCollection):
 
-    def __init__(self, memberships_data, all_popolo):
+    def __init__(self, memberships_data, all_popolo, objects=None):
         super(MembershipCollection, self).__init__(
-            memberships_data, Membership, all_popolo)
+            memberships_data, Membership, all_popolo, objects)
+
+    @staticmethod
+    def _key_of(o):
+        # Memberships are looked up by fingerprint, like in the rest of
+        # the API, rather than by their whole data:
+        return o.fingerprint
+
+    def persons(self):
+        return self.related('person_id', 'persons')
+
+    def organizations(self):
+        return self.related('organization_id', 'organizations')
+
+    def parties(self):
+        '''Return the organizations these memberships are on behalf of'''
+        return self.related('on_behalf_of_id', 'organizations')
+
+    def areas(self):
+        return self.related('area_id', 'areas')
+
+    def posts(self):
+        return self.related('post_id', 'posts')
+
+    def legislative_periods(self):
+        return self.related('legislative_period_id', 'events')
 
 
 class AreaCollection(PopoloCollection):
 
-    def __init__(self, areas_data, all_popolo):
+    def __init__(self, areas_data, all_popolo, objects=None):
         super(AreaCollection, self).__init__(
-            areas_data, Area, all_popolo)
+            areas_data, Area, all_popolo, objects)
 
 
 class PostCollection(PopoloCollection):
 
-    def __init__(self, posts_data, all_popolo):
+    def __init__(self, posts_data, all_popolo, objects=None):
         super(PostCollection, self).__init__(
-            posts_data, Post, all_popolo)
+            posts_data, Post, all_popolo, objects)
 
 
 class EventCollection(PopoloCollection):
 
-    def __init__(self, events_data, all_popolo):
+    def __init__(self, events_data, all_popolo, objects=None):
         super(EventCollection, self).__init__(
-            events_data, Event, all_popolo)
+            events_data, Event, all_popolo, objects)
 
     @property
     def elections(self):
-        elections_list = self.filter(classification='general election')
-        elections_data = [election.data for election in elections_list]
-        return EventCollection(elections_data, self.all_popolo)
+        return self.filter(classification='general election')
 
     @property
     def legislative_periods(self):
-        lps_list = self.filter(classification='legislative period')
-        legislative_periods_data = [lp.data for lp in lps_list]
-        return EventCollection(legislative_periods_data, self.all_popolo)
+        return self.filter(classification='legislative period')
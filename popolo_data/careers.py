@@ -0,0 +1,153 @@
+from collections import namedtuple
+import csv
+from datetime import date, timedelta
+
+from approx_dates.models import ApproxDate
+import six
+
+
+class Career(namedtuple('Career', [
+        'person_id', 'intervals', 'days_served', 'terms', 'parties',
+        'memberships'])):
+    '''A summary of one person's memberships
+
+    intervals is a list of (start, end) dates with overlapping or
+    adjacent memberships merged; days_served is their total length;
+    terms is the legislative_period_ids of their memberships and
+    parties the on_behalf_of_ids, each in order of start date, with
+    repeats removed (for parties, only consecutive repeats, so that
+    switching back to a party counts); memberships is the number of
+    memberships.'''
+
+    __slots__ = ()
+
+    @property
+    def party_switches(self):
+        return max(len(self.parties) - 1, 0)
+
+    @property
+    def first_start(self):
+        return self.intervals[0][0] if self.intervals else None
+
+    @property
+    def last_end(self):
+        return self.intervals[-1][1] if self.intervals else None
+
+    def as_dict(self):
+        '''Return the career as a dict that can be serialized as JSON'''
+        return {
+            'person_id': self.person_id,
+            'intervals': [
+                [start.isoformat(), end.isoformat()]
+                for start, end in self.intervals],
+            'days_served': self.days_served,
+            'terms': list(self.terms),
+            'parties': list(self.parties),
+            'party_switches': self.party_switches,
+            'memberships': self.memberships,
+        }
+
+
+CAREER_COLUMNS = (
+    'person_id', 'first_start', 'last_end', 'days_served', 'terms',
+    'parties', 'party_switches', 'memberships')
+
+
+def _merge_intervals(intervals):
+    '''Merge sorted (start, end) date intervals that overlap or touch'''
+    merged = []
+    for start, end in intervals:
+        if merged and start <= merged[-1][1] + timedelta(days=1):
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _unique(values):
+    seen = set()
+    return [v for v in values if not (v in seen or seen.add(v))]
+
+
+def _collapse_repeats(values):
+    return [v for i, v in enumerate(values) if i == 0 or v != values[i - 1]]
+
+
+def compute_careers(all_popolo, organization_id=None, as_of=None):
+    '''Return a dict mapping each person's id to their Career
+
+    Every membership (or just those of organization_id, e.g. a
+    legislature) is sorted by person and start date in one pass, so
+    this takes O(M log M) time for M memberships rather than
+    looking at each person's memberships separately. Memberships
+    with no end date are counted as continuing until as_of (by
+    default, today); those with no start date aren't included in
+    the intervals served. Partial dates count from the earliest
+    possible start to the latest possible end, as in current_at.'''
+    if as_of is None:
+        as_of = date.today()
+    rows = []
+    for data in all_popolo.memberships.data_list:
+        person_id = data.get('person_id')
+        if person_id is None:
+            continue
+        if organization_id is not None and \
+                data.get('organization_id') != organization_id:
+            continue
+        rows.append((person_id, data.get('start_date') or '', data))
+    rows.sort(key=lambda row: row[:2])
+    careers = {}
+    i = 0
+    while i < len(rows):
+        person_id = rows[i][0]
+        j = i
+        while j < len(rows) and rows[j][0] == person_id:
+            j += 1
+        intervals = []
+        terms = []
+        parties = []
+        for _, start_date, data in rows[i:j]:
+            if start_date:
+                start = ApproxDate.from_iso8601(start_date).earliest_date
+                end = as_of
+                if data.get('end_date'):
+                    end_date = ApproxDate.from_iso8601(data['end_date'])
+                    end = min(end_date.latest_date, as_of)
+                if start <= end:
+                    intervals.append((start, end))
+            if data.get('legislative_period_id'):
+                terms.append(data['legislative_period_id'])
+            if data.get('on_behalf_of_id'):
+                parties.append(data['on_behalf_of_id'])
+        intervals = _merge_intervals(sorted(intervals))
+        careers[person_id] = Career(
+            person_id,
+            intervals,
+            sum((end - start).days + 1 for start, end in intervals),
+            _unique(terms),
+            _collapse_repeats(parties),
+            j - i)
+        i = j
+    return careers
+
+
+def write_careers_csv(careers, f):
+    '''Write a dict of Careers (from compute_careers) as CSV to f
+
+    Lists of terms and parties are joined with semicolons.'''
+    writer = csv.writer(f)
+    writer.writerow(CAREER_COLUMNS)
+    for person_id in sorted(careers):
+        career = careers[person_id]
+        row = []
+        for column in CAREER_COLUMNS:
+            value = getattr(career, column)
+            if isinstance(value, list):
+                value = ';'.join(value)
+            elif isinstance(value, date):
+                value = value.isoformat()
+            if six.PY2 and isinstance(value, six.text_type):
+                value = value.encode('utf-8')
+            row.append(value)
+        writer.writerow(row)
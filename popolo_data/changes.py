@@ -0,0 +1,71 @@
+from collections import namedtuple
+
+from .base import membership_fingerprint
+
+
+POPOLO_ARRAYS = (
+    'persons', 'organizations', 'memberships', 'areas', 'posts', 'events')
+
+
+def record_key(popolo_array, data):
+    '''Return the key used to refer to a record in a Popolo array'''
+    if popolo_array == 'memberships':
+        return membership_fingerprint(data)
+    return data.get('id')
+
+
+class Change(namedtuple('Change', ['action', 'array', 'key', 'old', 'new'])):
+    '''A single modification made to a Popolo dataset
+
+    action is one of 'add', 'update' or 'remove', array is the
+    top-level Popolo array changed, key is the record's id (or
+    fingerprint, for memberships) and old and new are the record's
+    data before and after the change.'''
+
+    __slots__ = ()
+
+    @property
+    def fields(self):
+        '''Return a dict mapping each changed field to (old, new) values
+
+        Fields missing from one side of the change have the value None
+        on that side.'''
+        old = self.old or {}
+        new = self.new or {}
+        result = {}
+        for field in set(old) | set(new):
+            old_value = old.get(field)
+            new_value = new.get(field)
+            if old_value != new_value:
+                result[field] = (old_value, new_value)
+        return result
+
+
+def iter_diff(old_json_data, new_json_data, popolo_arrays=POPOLO_ARRAYS):
+    '''Generate the Changes that turn one set of Popolo data into another
+
+    Each array of the old data is indexed by record key, and then the
+    new data is streamed past that index, so this takes linear time.
+    If there are several records with the same key (e.g. duplicated
+    memberships) identical records are paired up first.'''
+    for popolo_array in popolo_arrays:
+        old_index = {}
+        for data in old_json_data.get(popolo_array, []):
+            key = record_key(popolo_array, data)
+            old_index.setdefault(key, []).append(data)
+        for data in new_json_data.get(popolo_array, []):
+            key = record_key(popolo_array, data)
+            old_records = old_index.get(key)
+            if not old_records:
+                yield Change('add', popolo_array, key, None, data)
+                continue
+            if data in old_records:
+                old_records.remove(data)
+            else:
+                yield Change(
+                    'update', popolo_array, key, old_records.pop(0), data)
+            if not old_records:
+                del old_index[key]
+        for key, old_records in old_index.items():
+            for data in old_records:
+                yield Change('remove', popolo_array, key, data, None)
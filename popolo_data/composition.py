@@ -0,0 +1,99 @@
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import date, timedelta
+
+
+# How many change points there are between each stored copy of the
+# full composition; answering a query replays at most this many.
+DEFAULT_CHECKPOINT_INTERVAL = 64
+
+
+Seat = namedtuple(
+    'Seat', ['membership', 'person', 'post', 'party', 'area'])
+
+SeatChange = namedtuple('SeatChange', ['date', 'action', 'seat'])
+
+
+class CompositionTimeline(object):
+    '''The membership of an organization (e.g. a legislature) over time
+
+    Every membership of the organization is resolved to a Seat, with
+    its person, post, party (on_behalf_of) and area, once. The dates
+    on which the composition changes are sorted, with a copy of the
+    full composition stored every checkpoint_interval changes, so
+    that finding the composition at a date takes a binary search and
+    a short replay rather than a scan of every membership.
+
+    As with Membership.current_at, a membership counts from the
+    earliest possible start date to the latest possible end date.'''
+
+    def __init__(self, organization_id, all_popolo,
+                 checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL):
+        self.organization_id = organization_id
+        self.checkpoint_interval = checkpoint_interval
+        persons = all_popolo.persons.lookup_from_key
+        organizations = all_popolo.organizations.lookup_from_key
+        posts = all_popolo.posts.lookup_from_key
+        areas = all_popolo.areas.lookup_from_key
+        self.seats = []
+        changes = []
+        memberships = all_popolo.memberships.filter(
+            organization_id=organization_id)
+        for membership in memberships:
+            start = membership.start_date.earliest_date
+            end = membership.end_date.latest_date
+            if start > end:
+                continue
+            index = len(self.seats)
+            self.seats.append(Seat(
+                membership,
+                persons.get(membership.person_id),
+                posts.get(membership.post_id),
+                organizations.get(membership.on_behalf_of_id),
+                areas.get(membership.area_id)))
+            changes.append((start, index, 'start'))
+            if end < date.max:
+                changes.append((end + timedelta(days=1), index, 'end'))
+        changes.sort()
+        self.change_dates = [c[0] for c in changes]
+        self.changes = [(c[2], c[1]) for c in changes]
+        self.checkpoints = []
+        active = set()
+        for i, (action, index) in enumerate(self.changes):
+            if i % checkpoint_interval == 0:
+                self.checkpoints.append(frozenset(active))
+            self._apply(active, action, index)
+
+    @staticmethod
+    def _apply(active, action, index):
+        if action == 'start':
+            active.add(index)
+        else:
+            active.discard(index)
+
+    def at(self, when):
+        '''Return the Seats of the organization on the date when
+
+        They're in the order the memberships appear in the data.'''
+        n = bisect_right(self.change_dates, when)
+        checkpoint = n // self.checkpoint_interval
+        if checkpoint >= len(self.checkpoints):
+            checkpoint = len(self.checkpoints) - 1
+        if checkpoint < 0:
+            return []
+        active = set(self.checkpoints[checkpoint])
+        for i in range(checkpoint * self.checkpoint_interval, n):
+            self._apply(active, *self.changes[i])
+        return [self.seats[i] for i in sorted(active)]
+
+    def changes_between(self, start, end):
+        '''Return the SeatChanges after the date start, up to date end
+
+        Each change's date is the first day it applies, so for a seat
+        whose membership ended it's the day after the end date. Its
+        action is 'start' or 'end'.'''
+        lo = bisect_right(self.change_dates, start)
+        hi = bisect_right(self.change_dates, end)
+        return [
+            SeatChange(self.change_dates[i], action, self.seats[index])
+            for i, (action, index) in enumerate(self.changes[lo:hi], lo)]
@@ -0,0 +1,112 @@
+import bz2
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+CHUNK_SIZE = 1024 * 1024
+
+# The bytes that each supported compressed format starts with.
+MAGIC_NUMBERS = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+)
+
+MAGIC_LENGTH = max(len(magic) for magic, _ in MAGIC_NUMBERS)
+
+
+def detect_compression(prefix):
+    '''Return the compression format of data starting with prefix
+
+    This is one of 'gzip', 'bz2', 'xz' or 'zstd', or None if the data
+    doesn't look compressed.'''
+    for magic, compression in MAGIC_NUMBERS:
+        if prefix.startswith(magic):
+            return compression
+    return None
+
+
+def _decompressor(compression):
+    if compression == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif compression == 'bz2':
+        return bz2.BZ2Decompressor()
+    elif compression == 'xz':
+        if lzma is None:
+            raise ImportError(
+                "The lzma module is needed to read xz-compressed data")
+        return lzma.LZMADecompressor()
+    elif compression == 'zstd':
+        if zstandard is None:
+            raise ImportError(
+                "zstandard is needed to read zstd-compressed data; install "
+                "it with: pip install everypolitician-popolo[zstd]")
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise ValueError("Unknown compression {0}".format(compression))
+
+
+def _finished(decompressor):
+    '''Check whether decompressor has reached the end of its stream'''
+    eof = getattr(decompressor, 'eof', None)
+    if eof is None:
+        # Python 2's decompressors only show this through unused_data:
+        return bool(getattr(decompressor, 'unused_data', b''))
+    return eof
+
+
+def iter_decompressed(chunks, compression):
+    '''Decompress an iterable of chunks of compressed bytes as they arrive
+
+    Data made of several compressed streams one after another (like
+    files written by pigz or pbzip2, or compressed files joined with
+    cat) is decompressed in full, by starting a new decompressor on
+    whatever follows the end of each stream.'''
+    decompressor = _decompressor(compression)
+    for chunk in chunks:
+        while chunk:
+            if _finished(decompressor):
+                if not chunk.strip(b'\x00'):
+                    # gzip files can be padded with zero bytes
+                    break
+                decompressor = _decompressor(compression)
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+            chunk = b''
+            if _finished(decompressor):
+                chunk = decompressor.unused_data
+    if hasattr(decompressor, 'flush'):
+        data = decompressor.flush()
+        if data:
+            yield data
+
+
+def iter_file_chunks(f, chunk_size=CHUNK_SIZE):
+    return iter(lambda: f.read(chunk_size), b'')
+
+
+def decompress_file(f, compression):
+    '''Return the decompressed contents of the binary file object f
+
+    The compressed data is read and decompressed a chunk at a time, so
+    it's never all in memory at once.'''
+    return b''.join(iter_decompressed(iter_file_chunks(f), compression))
+
+
+def decompress_bytes(data, compression):
+    '''Return the decompressed version of the bytes data'''
+    view = memoryview(data)
+    chunks = (
+        view[i:i + CHUNK_SIZE].tobytes()
+        for i in range(0, len(data), CHUNK_SIZE))
+    return b''.join(iter_decompressed(chunks, compression))
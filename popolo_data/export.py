@@ -0,0 +1,216 @@
+import csv
+from itertools import islice
+
+import six
+
+from .base import contact_values_from_data
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+DEFAULT_CHUNK_SIZE = 10000
+
+INTEGER_COLUMNS = ('seats',)
+
+
+def _field(name):
+    return lambda data: data.get(name)
+
+
+def _identifier(scheme):
+    def get_identifier(data):
+        for identifier in data.get('identifiers', []):
+            if identifier.get('scheme') == scheme:
+                return identifier.get('identifier')
+    return get_identifier
+
+
+def _first_twitter(data):
+    handles = contact_values_from_data(data)['twitter']
+    return handles[0] if handles else None
+
+
+# The columns exported for each Popolo array, and how to get each
+# column's value from a record's data.
+COLUMNS = {
+    'persons': [
+        ('id', _field('id')),
+        ('name', _field('name')),
+        ('sort_name', _field('sort_name')),
+        ('given_name', _field('given_name')),
+        ('family_name', _field('family_name')),
+        ('gender', _field('gender')),
+        ('birth_date', _field('birth_date')),
+        ('death_date', _field('death_date')),
+        ('email', _field('email')),
+        ('image', _field('image')),
+        ('national_identity', _field('national_identity')),
+        ('wikidata', _identifier('wikidata')),
+        ('twitter', _first_twitter),
+    ],
+    'organizations': [
+        ('id', _field('id')),
+        ('name', _field('name')),
+        ('classification', _field('classification')),
+        ('founding_date', _field('founding_date')),
+        ('dissolution_date', _field('dissolution_date')),
+        ('seats', _field('seats')),
+        ('wikidata', _identifier('wikidata')),
+    ],
+    'memberships': [
+        ('person_id', _field('person_id')),
+        ('organization_id', _field('organization_id')),
+        ('on_behalf_of_id', _field('on_behalf_of_id')),
+        ('area_id', _field('area_id')),
+        ('post_id', _field('post_id')),
+        ('legislative_period_id', _field('legislative_period_id')),
+        ('role', _field('role')),
+        ('start_date', _field('start_date')),
+        ('end_date', _field('end_date')),
+    ],
+    'events': [
+        ('id', _field('id')),
+        ('name', _field('name')),
+        ('classification', _field('classification')),
+        ('start_date', _field('start_date')),
+        ('end_date', _field('end_date')),
+        ('organization_id', _field('organization_id')),
+    ],
+    'areas': [
+        ('id', _field('id')),
+        ('name', _field('name')),
+        ('type', _field('type')),
+        ('wikidata', _identifier('wikidata')),
+    ],
+    'posts': [
+        ('id', _field('id')),
+        ('label', _field('label')),
+        ('organization_id', _field('organization_id')),
+    ],
+}
+
+# Membership columns with the name of the record that a foreign key
+# refers to, as (column, foreign key field, array, field to use).
+MEMBERSHIP_RESOLVED_COLUMNS = [
+    ('person_name', 'person_id', 'persons', 'name'),
+    ('organization_name', 'organization_id', 'organizations', 'name'),
+    ('on_behalf_of_name', 'on_behalf_of_id', 'organizations', 'name'),
+    ('area_name', 'area_id', 'areas', 'name'),
+    ('post_label', 'post_id', 'posts', 'label'),
+    ('legislative_period_name', 'legislative_period_id', 'events', 'name'),
+]
+
+
+def columns_for(popolo, popolo_array):
+    '''Return a list of (column name, function) pairs for an array
+
+    For memberships, this adds columns with the names of the related
+    records. These are looked up in dicts built here, which only need
+    memory proportional to the number of related records.'''
+    if popolo_array not in COLUMNS:
+        raise ValueError("Unknown Popolo array {0}".format(popolo_array))
+    columns = list(COLUMNS[popolo_array])
+    if popolo_array == 'memberships':
+        lookups = {}
+        for column, key_field, related_array, name_field in \
+                MEMBERSHIP_RESOLVED_COLUMNS:
+            if (related_array, name_field) not in lookups:
+                lookups[related_array, name_field] = dict(
+                    (data.get('id'), data.get(name_field))
+                    for data in popolo.json_data.get(related_array, []))
+            names = lookups[related_array, name_field]
+            columns.append((
+                column, lambda data, k=key_field, n=names: n.get(data.get(k))))
+    return columns
+
+
+def iter_rows(popolo, popolo_array):
+    '''Generate a tuple of column values for each record in an array
+
+    These come straight from the JSON data, without creating a
+    PopoloObject for each record.'''
+    getters = [getter for _, getter in columns_for(popolo, popolo_array)]
+    for data in popolo.json_data.get(popolo_array, []):
+        yield tuple(getter(data) for getter in getters)
+
+
+def iter_chunks(iterable, chunk_size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def write_csv(popolo, popolo_array, f):
+    '''Write the records of popolo_array as CSV to the file object f
+
+    Rows are written as they're generated, so memory use doesn't
+    depend on the number of records.'''
+    writer = csv.writer(f)
+    header = [name for name, _ in columns_for(popolo, popolo_array)]
+    writer.writerow(header)
+    for row in iter_rows(popolo, popolo_array):
+        if six.PY2:
+            row = [
+                v.encode('utf-8') if isinstance(v, six.text_type) else v
+                for v in row]
+        writer.writerow(row)
+
+
+def _require_pyarrow():
+    if pyarrow is None:
+        raise ImportError(
+            "pyarrow is needed for Arrow and Parquet export; install it "
+            "with: pip install everypolitician-popolo[arrow]")
+
+
+def arrow_schema(popolo, popolo_array):
+    '''Return the pyarrow schema used when exporting popolo_array
+
+    Every column is a string apart from the integer seats column;
+    giving the types explicitly means chunks where a column happens
+    to be empty still have the same schema.'''
+    _require_pyarrow()
+    return pyarrow.schema([
+        (name, pyarrow.int64() if name in INTEGER_COLUMNS
+         else pyarrow.string())
+        for name, _ in columns_for(popolo, popolo_array)])
+
+
+def iter_record_batches(popolo, popolo_array, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''Generate pyarrow RecordBatches of at most chunk_size records'''
+    schema = arrow_schema(popolo, popolo_array)
+    for chunk in iter_chunks(iter_rows(popolo, popolo_array), chunk_size):
+        columns = zip(*chunk)
+        yield pyarrow.RecordBatch.from_arrays(
+            [pyarrow.array(list(c), type=field.type)
+             for c, field in zip(columns, schema)],
+            schema=schema)
+
+
+def to_arrow(popolo, popolo_array, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''Return a pyarrow Table of the records of popolo_array'''
+    schema = arrow_schema(popolo, popolo_array)
+    batches = list(iter_record_batches(popolo, popolo_array, chunk_size))
+    return pyarrow.Table.from_batches(batches, schema=schema)
+
+
+def write_parquet(popolo, popolo_array, path, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''Write the records of popolo_array to a Parquet file at path
+
+    Each chunk of records is written as a row group, so only one
+    chunk needs to be held in memory at a time.'''
+    schema = arrow_schema(popolo, popolo_array)
+    writer = pyarrow.parquet.ParquetWriter(path, schema)
+    try:
+        for batch in iter_record_batches(popolo, popolo_array, chunk_size):
+            writer.write_table(
+                pyarrow.Table.from_batches([batch], schema=schema))
+    finally:
+        writer.close()
@@ -0,0 +1,371 @@
+from array import array
+from bisect import bisect_left
+from collections import deque
+
+from .references import all_popolo_property
+
+
+# Each membership links a person to up to five other records; these
+# are the membership fields that form edges of the graph, and the
+# Popolo collection that the field refers to.
+RELATIONS = (
+    ('organization_id', 'organizations'),
+    ('on_behalf_of_id', 'organizations'),
+    ('post_id', 'posts'),
+    ('legislative_period_id', 'events'),
+    ('area_id', 'areas'),
+)
+
+RELATION_TARGETS = dict(RELATIONS)
+
+
+class Adjacency(object):
+    '''Compressed adjacency lists for integer-numbered nodes
+
+    The neighbours of node i are targets[offsets[i]:offsets[i + 1]],
+    so finding them costs one slice regardless of the size of the
+    graph. When the graph is changed after it's built, the sorted
+    neighbours of each changed node are kept in changed instead, so
+    an edge can be added or removed without rebuilding the arrays.'''
+
+    def __init__(self, pairs, n):
+        buckets = [set() for _ in range(n)]
+        for source, target in pairs:
+            buckets[source].add(target)
+        self.offsets = array('l', [0])
+        self.targets = array('l')
+        for bucket in buckets:
+            self.targets.extend(sorted(bucket))
+            self.offsets.append(len(self.targets))
+        self.size = n
+        self.changed = {}
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        neighbours = self.changed.get(i)
+        if neighbours is not None:
+            return neighbours
+        if i >= len(self.offsets) - 1:
+            if i < self.size:
+                return array('l')
+            raise IndexError(i)
+        return self.targets[self.offsets[i]:self.offsets[i + 1]]
+
+    def add_node(self):
+        '''Add a node with no neighbours, returning its number'''
+        self.size += 1
+        return self.size - 1
+
+    def add(self, i, target):
+        neighbours = self[i]
+        position = bisect_left(neighbours, target)
+        if position < len(neighbours) and neighbours[position] == target:
+            return
+        neighbours = array('l', neighbours)
+        neighbours.insert(position, target)
+        self.changed[i] = neighbours
+
+    def discard(self, i, target):
+        neighbours = self[i]
+        position = bisect_left(neighbours, target)
+        if position == len(neighbours) or neighbours[position] != target:
+            return
+        neighbours = array('l', neighbours)
+        del neighbours[position]
+        self.changed[i] = neighbours
+
+
+class PopoloGraph(object):
+    '''A graph view of the people in a Popolo dataset
+
+    Persons are connected to organizations, parties, posts,
+    legislative periods and areas via their memberships. Every
+    record is numbered by its position in its collection, and the
+    edges are precomputed into Adjacency objects when the graph is
+    built, so each hop of a traversal is a lookup rather than a scan
+    of all memberships.'''
+
+    all_popolo = all_popolo_property
+
+    def __init__(self, all_popolo):
+        self.all_popolo = all_popolo
+        self.persons = all_popolo.persons
+        self.memberships = all_popolo.memberships
+        self.collections = {
+            'organizations': all_popolo.organizations,
+            'posts': all_popolo.posts,
+            'events': all_popolo.events,
+            'areas': all_popolo.areas,
+        }
+        self.person_index = self._index(self.persons)
+        self.indexes = dict(
+            (name, self._index(collection))
+            for name, collection in self.collections.items())
+        # Memberships referring to records that aren't in the data, by
+        # (collection name, id), so they can be linked if it's added:
+        self.unresolved = {}
+        person_memberships = []
+        relation_pairs = dict((field, []) for field, _ in RELATIONS)
+        relation_memberships = dict((field, []) for field, _ in RELATIONS)
+        for i, data in enumerate(self.memberships.data_list):
+            person, targets = self._resolve(i, data)
+            if person is not None:
+                person_memberships.append((person, i))
+            for field, target in targets:
+                relation_memberships[field].append((target, i))
+                if person is not None:
+                    relation_pairs[field].append((person, target))
+        n_persons = len(self.persons)
+        self.person_memberships = Adjacency(person_memberships, n_persons)
+        self.forward = {}
+        self.reverse = {}
+        self.target_memberships = {}
+        for field, collection_name in RELATIONS:
+            n_targets = len(self.collections[collection_name])
+            pairs = relation_pairs[field]
+            self.forward[field] = Adjacency(pairs, n_persons)
+            self.reverse[field] = Adjacency(
+                ((t, p) for p, t in pairs), n_targets)
+            self.target_memberships[field] = Adjacency(
+                relation_memberships[field], n_targets)
+
+    def _resolve(self, i, data, unresolved=True):
+        '''Return a membership's person node and (field, target) pairs
+
+        References to missing records are added to self.unresolved,
+        or removed from it if unresolved is False.'''
+        references = [('persons', data.get('person_id'))]
+        references.extend(
+            (collection_name, data.get(field))
+            for field, collection_name in RELATIONS)
+        for reference in references:
+            if reference[1] is None:
+                continue
+            if reference[0] == 'persons':
+                found = reference[1] in self.person_index
+            else:
+                found = reference[1] in self.indexes[reference[0]]
+            if found:
+                continue
+            if unresolved:
+                self.unresolved.setdefault(reference, set()).add(i)
+            else:
+                self.unresolved.get(reference, set()).discard(i)
+        person = self.person_index.get(data.get('person_id'))
+        targets = []
+        for field, collection_name in RELATIONS:
+            target = self.indexes[collection_name].get(data.get(field))
+            if target is not None:
+                targets.append((field, target))
+        return person, targets
+
+    def collection(self, popolo_array):
+        '''Return the graph's collection of one of the Popolo arrays'''
+        if popolo_array == 'persons':
+            return self.persons
+        if popolo_array == 'memberships':
+            return self.memberships
+        return self.collections[popolo_array]
+
+    def record_changed(self, change, position):
+        '''Update the graph after a Change to the data at position
+
+        This takes time in proportion to the number of edges of the
+        changed record. Returns False if the graph can't be updated
+        (because a record was removed, which renumbers the records
+        after it, or a record's id changed) and so should be rebuilt.
+        The graph's collections must already have been updated.'''
+        if change.action == 'remove':
+            return False
+        if change.array == 'memberships':
+            if change.old is not None:
+                self._unlink_membership(position, change.old)
+            self._link_membership(position, change.new)
+            return True
+        if change.action == 'update':
+            return change.old.get('id') == change.new.get('id')
+        record_id = change.new.get('id')
+        if change.array == 'persons':
+            if record_id in self.person_index:
+                return True
+            self.person_index[record_id] = position
+            self.person_memberships.add_node()
+            for adjacency in self.forward.values():
+                adjacency.add_node()
+        else:
+            index = self.indexes[change.array]
+            if record_id in index:
+                return True
+            index[record_id] = position
+            for field, collection_name in RELATIONS:
+                if collection_name == change.array:
+                    self.reverse[field].add_node()
+                    self.target_memberships[field].add_node()
+        data_list = self.memberships.data_list
+        for i in sorted(
+                self.unresolved.pop((change.array, record_id), ())):
+            self._link_membership(i, data_list[i])
+        return True
+
+    def _link_membership(self, i, data):
+        person, targets = self._resolve(i, data)
+        if person is not None:
+            self.person_memberships.add(person, i)
+        for field, target in targets:
+            self.target_memberships[field].add(target, i)
+            if person is not None:
+                self.forward[field].add(person, target)
+                self.reverse[field].add(target, person)
+
+    def _unlink_membership(self, i, data):
+        person, targets = self._resolve(i, data, unresolved=False)
+        if person is not None:
+            self.person_memberships.discard(person, i)
+        for field, target in targets:
+            self.target_memberships[field].discard(target, i)
+            if person is not None and \
+                    not self._linked(person, field, target):
+                self.forward[field].discard(person, target)
+                self.reverse[field].discard(target, person)
+
+    def _linked(self, person, field, target):
+        '''Check whether any membership of person links them to target'''
+        index = self.indexes[RELATION_TARGETS[field]]
+        data_list = self.memberships.data_list
+        return any(
+            index.get(data_list[i].get(field)) == target
+            for i in self.person_memberships[person])
+
+    @staticmethod
+    def _index(collection):
+        index = {}
+        for i, data in enumerate(collection.data_list):
+            index.setdefault(data.get('id'), i)
+        return index
+
+    def _relations_for(self, obj, relation):
+        if relation is not None:
+            if relation not in RELATION_TARGETS:
+                raise ValueError("Unknown relation {0}".format(relation))
+            return [relation]
+        if obj is None:
+            return [field for field, _ in RELATIONS]
+        return [
+            field for field, collection_name in RELATIONS
+            if isinstance(obj, self.collections[collection_name].object_class)
+        ]
+
+    def _locate(self, obj):
+        '''Return the collection name and node number for a record'''
+        if isinstance(obj, self.persons.object_class):
+            return 'persons', self.person_index[obj.id]
+        for name, collection in self.collections.items():
+            if isinstance(obj, collection.object_class):
+                return name, self.indexes[name][obj.id]
+        raise TypeError("{0!r} is not a node of this graph".format(obj))
+
+    def neighbours(self, obj, relation=None):
+        '''Return the records directly connected to obj
+
+        For a person this gives the organizations, posts, events and
+        areas of their memberships; for any other record it gives the
+        persons with a membership referring to it. Pass relation
+        (e.g. 'on_behalf_of_id') to follow just one kind of edge.'''
+        name, node = self._locate(obj)
+        result = []
+        if name == 'persons':
+            for field in self._relations_for(None, relation):
+                collection = self.collections[RELATION_TARGETS[field]]
+                result.extend(collection[t] for t in self.forward[field][node])
+        else:
+            nodes = set()
+            for field in self._relations_for(obj, relation):
+                if RELATION_TARGETS[field] == name:
+                    nodes.update(self.reverse[field][node])
+            result.extend(self.persons[p] for p in sorted(nodes))
+        seen = set()
+        return [o for o in result if not (id(o) in seen or seen.add(id(o)))]
+
+    def memberships_of(self, obj, relation=None):
+        '''Return the memberships that connect obj to the graph
+
+        The memberships are in the order they appear in the data.'''
+        name, node = self._locate(obj)
+        if name == 'persons':
+            indices = self.person_memberships[node]
+        else:
+            found = set()
+            for field in self._relations_for(obj, relation):
+                if RELATION_TARGETS[field] == name:
+                    found.update(self.target_memberships[field][node])
+            indices = sorted(found)
+        return [self.memberships[i] for i in indices]
+
+    def _person_neighbours(self, node, relation):
+        forward = self.forward[relation]
+        reverse = self.reverse[relation]
+        for target in forward[node]:
+            for other in reverse[target]:
+                if other != node:
+                    yield target, other
+
+    def co_members(self, person, relation='organization_id'):
+        '''Return the other persons who share a related record with person
+
+        By default this is everyone who has been a member of any of
+        the same organizations.'''
+        return self.k_hop(person, 1, relation)
+
+    def k_hop(self, person, k, relation='organization_id'):
+        '''Return the persons within k hops of person, nearest first
+
+        One hop is from a person to another person via a shared
+        related record, such as an organization.'''
+        self._relations_for(None, relation)
+        start = self.person_index[person.id]
+        distances = {start: 0}
+        frontier = [start]
+        for depth in range(1, k + 1):
+            next_frontier = []
+            for node in frontier:
+                for _, other in self._person_neighbours(node, relation):
+                    if other not in distances:
+                        distances[other] = depth
+                        next_frontier.append(other)
+            frontier = next_frontier
+        return [
+            self.persons[node] for node in
+            sorted(distances, key=lambda n: (distances[n], n))
+            if node != start
+        ]
+
+    def shortest_path(self, person_a, person_b, relation='organization_id'):
+        '''Find the shortest chain of persons linking person_a to person_b
+
+        The path is returned as a list alternating between persons and
+        the records that link them, e.g. [person_a, organization,
+        person_b], or None if the two persons are not connected.'''
+        self._relations_for(None, relation)
+        start = self.person_index[person_a.id]
+        end = self.person_index[person_b.id]
+        parents = {start: None}
+        queue = deque([start])
+        while queue and end not in parents:
+            node = queue.popleft()
+            for target, other in self._person_neighbours(node, relation):
+                if other not in parents:
+                    parents[other] = (node, target)
+                    queue.append(other)
+        if end not in parents:
+            return None
+        targets = self.collections[RELATION_TARGETS[relation]]
+        path = [self.persons[end]]
+        node = end
+        while parents[node] is not None:
+            node, target = parents[node]
+            path.append(targets[target])
+            path.append(self.persons[node])
+        path.reverse()
+        return path
@@ -1,52 +1,378 @@
+from datetime import date
+import functools
 import json
+import sys
+import threading
+import weakref
 
 import requests
+import six
 
 from .base import (
-    AreaCollection, EventCollection, MembershipCollection, PersonCollection,
-    OrganizationCollection, PostCollection)
+    build_once, BuildCache, IdentityMap, Area, AreaCollection, Event,
+    EventCollection, Membership, MembershipCollection, Organization,
+    OrganizationCollection, Person, PersonCollection, Post, PostCollection,
+    project_records)
+from .careers import compute_careers
+from .changes import POPOLO_ARRAYS, Change, iter_diff, record_key
+from .composition import CompositionTimeline
+from .compression import MAGIC_LENGTH, decompress_bytes, \
+    decompress_file, detect_compression
+from .graph import PopoloGraph
+from .lazy import LazyJSONData
+from .validation import iter_problems
+
+
+# The Popolo arrays that each kind of cached value (identified by the
+# first item of its key) is built from.
+CACHE_DEPENDENCIES = {
+    'composition': (
+        'persons', 'organizations', 'memberships', 'areas', 'posts'),
+    'careers': ('memberships',),
+}
+
+ARRAY_OBJECT_CLASSES = {
+    'persons': Person,
+    'organizations': Organization,
+    'memberships': Membership,
+    'areas': Area,
+    'posts': Post,
+    'events': Event,
+}
+
+
+def cache_depends_on(key, popolo_array):
+    '''Check whether a value in Popolo._caches depends on popolo_array
+
+    Collections of whole arrays and the graph are updated rather than
+    rebuilt, so don't count.'''
+    if key in POPOLO_ARRAYS or key == 'graph':
+        return False
+    if not isinstance(key, tuple):
+        return True
+    if key[0] == 'order_by':
+        return key[1] == ARRAY_OBJECT_CLASSES[popolo_array].__name__
+    return popolo_array in CACHE_DEPENDENCIES.get(key[0], POPOLO_ARRAYS)
+
+
+def synchronized(method):
+    '''Make a Popolo method hold the dataset's write lock while running'''
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._write_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+# Fields whose values are repeated many times in a typical Popolo file,
+# and so are worth interning; any field ending in '_id' is too.
+INTERNED_FIELDS = frozenset([
+    'id', 'role', 'classification', 'gender', 'scheme', 'note', 'type'])
+
+
+class StringInterner(object):
+    '''Dedupes repeated string values in decoded Popolo JSON
+
+    json.load creates a new string object for every value, so e.g.
+    each membership has its own copy of its organization_id. An
+    instance of this can be passed as the object_pairs_hook of
+    json.load, or given already decoded data with intern_data, and
+    makes every equal value of the fields in INTERNED_FIELDS (or
+    ending in '_id') the same object. As well as saving memory, this
+    means that looking up ids in dicts keyed by id (like the
+    collections' lookup_from_key) usually succeeds on an identity
+    comparison. duplicates and saved_bytes record how many strings
+    were replaced and roughly how much memory that saved.'''
+
+    def __init__(self, fields=INTERNED_FIELDS):
+        self.fields = fields
+        self.strings = {}
+        self.duplicates = 0
+        self.saved_bytes = 0
+
+    def is_interned_field(self, field):
+        return field in self.fields or field.endswith('_id')
+
+    def intern(self, value):
+        existing = self.strings.setdefault(value, value)
+        if existing is not value:
+            self.duplicates += 1
+            self.saved_bytes += sys.getsizeof(value)
+        return existing
+
+    def _intern_pair(self, field, value):
+        if isinstance(value, six.string_types) and \
+                self.is_interned_field(field):
+            return self.intern(value)
+        return value
+
+    def __call__(self, pairs):
+        # This is called for every object decoded, so avoids calling
+        # other methods in the common case:
+        result = dict(pairs)
+        fields = self.fields
+        strings = self.strings
+        for k, v in pairs:
+            if (k in fields or k.endswith('_id')) and \
+                    isinstance(v, six.string_types):
+                existing = strings.setdefault(v, v)
+                if existing is not v:
+                    result[k] = existing
+                    self.duplicates += 1
+                    self.saved_bytes += sys.getsizeof(v)
+        return result
+
+    def intern_data(self, json_data):
+        '''Intern the strings of already decoded data in place'''
+        pending = [json_data]
+        while pending:
+            o = pending.pop()
+            if isinstance(o, dict):
+                for k, v in o.items():
+                    if isinstance(v, (dict, list)):
+                        pending.append(v)
+                    else:
+                        o[k] = self._intern_pair(k, v)
+            elif isinstance(o, list):
+                pending.extend(
+                    v for v in o if isinstance(v, (dict, list)))
+        return json_data
+
+
+def projection(fields):
+    '''Return a function that drops all but some fields of Popolo records
+
+    fields maps Popolo arrays to the fields to keep in their records;
+    the function is called with the name of an array and its records,
+    and returns copies of the records with just those fields (and
+    'id', and for memberships the fields of their fingerprint).
+    Getting any other field of those records, for example through a
+    property like Person.biography, raises FieldNotLoaded. Arrays
+    that aren't in fields are returned unchanged.'''
+    for popolo_array in fields:
+        if popolo_array not in POPOLO_ARRAYS:
+            raise ValueError(
+                "Unknown Popolo array {0}".format(popolo_array))
+
+    def transform(popolo_array, records):
+        if popolo_array in fields:
+            return project_records(
+                records, fields[popolo_array], popolo_array)
+        return records
+    return transform
 
 
 class Popolo(object):
+    '''A Popolo dataset
+
+    Any number of threads can read from a Popolo object at once;
+    indexes (like graph) that are built on first use are only built
+    once. The add, update and remove methods hold a lock so that
+    only one thread modifies the data at a time, but readers don't
+    take that lock, so shouldn't read while another thread is
+    writing. To serve readers while the data changes, publish new
+    versions of the dataset through a SharedPopolo instead.
+
+    identity_policy controls the dataset's IdentityMap: with 'strong'
+    (the default) each record always has the same Popolo object, and
+    collections like persons are kept, and updated when the data
+    changes; with 'weak', objects and collections are only kept while
+    in use, but there's still only one object per record at a time;
+    with None, every collection creates new objects.
+
+    Popolo objects and collections normally refer to their dataset
+    (as all_popolo), so keeping any of them (e.g. a Person in a
+    long-lived cache) keeps the whole dataset in memory. If
+    weak_references is True they only keep a weak reference, so the
+    dataset is released as soon as nothing else refers to the Popolo
+    object; after that, anything that needs all_popolo (like
+    Membership.person) raises ReferenceError, but data held by the
+    object itself (like Person.name) is still available.'''
+
+    @classmethod
+    def _from_text(cls, text, lazy, intern_strings, fields, **kwargs):
+        interner = StringInterner() if intern_strings else None
+        transform = None
+        if fields is not None:
+            transform = projection(fields)
+        if lazy:
+            json_data = LazyJSONData(
+                text, object_pairs_hook=interner, transform=transform)
+        else:
+            if isinstance(text, bytes):
+                text = text.decode('utf-8')
+            json_data = json.loads(text, object_pairs_hook=interner)
+            if transform is not None:
+                for popolo_array in fields:
+                    if popolo_array in json_data:
+                        json_data[popolo_array] = transform(
+                            popolo_array, json_data[popolo_array])
+        popolo = cls(json_data, **kwargs)
+        popolo.interner = interner
+        return popolo
 
     @classmethod
-    def from_filename(cls, filename):
+    def from_filename(cls, filename, lazy=False, intern_strings=False,
+                      fields=None, **kwargs):
+        '''Load Popolo data from a file
+
+        If lazy is True, each top-level array (e.g. 'memberships') is
+        only parsed when it's first used. If intern_strings is True,
+        repeated ids and values are deduped by a StringInterner, which
+        is then available as the interner attribute. fields can map
+        Popolo arrays to the fields to keep of each of their records,
+        e.g. {'persons': ['name', 'gender']}; other fields are dropped
+        as each array is decoded (see projection). Any other keyword
+        arguments (e.g. identity_policy) are passed to the
+        constructor.
+
+        Files compressed with gzip, bz2, xz or zstd (if the zstandard
+        package is installed) are detected and decompressed as they're
+        read.'''
+        with open(filename, 'rb') as f:
+            compression = detect_compression(f.read(MAGIC_LENGTH))
+            f.seek(0)
+            if compression is not None:
+                return cls._from_text(
+                    decompress_file(f, compression), lazy, intern_strings,
+                    fields, **kwargs)
+            if lazy or intern_strings or fields is not None:
+                return cls._from_text(
+                    f.read(), lazy, intern_strings, fields, **kwargs)
         with open(filename) as f:
-            return cls(json.load(f))
+            return cls(json.load(f), **kwargs)
 
     @classmethod
-    def from_url(cls, url):
+    def from_url(cls, url, lazy=False, intern_strings=False, fields=None,
+                 **kwargs):
+        '''Load Popolo data from a URL
+
+        The options are the same as for from_filename, and compressed
+        data is detected and decompressed in the same way.'''
         r = requests.get(url)
-        return cls(r.json())
+        if lazy or intern_strings or fields is not None:
+            content = r.content
+            compression = detect_compression(content[:MAGIC_LENGTH])
+            if compression is not None:
+                content = decompress_bytes(content, compression)
+            return cls._from_text(
+                content, lazy, intern_strings, fields, **kwargs)
+        try:
+            return cls(r.json(), **kwargs)
+        except ValueError:
+            # This might be because the data is compressed:
+            compression = detect_compression(r.content[:MAGIC_LENGTH])
+            if compression is None:
+                raise
+            return cls._from_text(
+                decompress_bytes(r.content, compression), False, False,
+                None, **kwargs)
+
+    @classmethod
+    def from_sqlite(cls, path):
+        '''Open Popolo data stored in SQLite by to_sqlite'''
+        from .sqlite import SQLitePopolo
+        return SQLitePopolo(path)
+
+    def to_sqlite(self, path):
+        from .sqlite import convert_to_sqlite
+        convert_to_sqlite(self.json_data, path)
 
-    def __init__(self, json_data):
+    def __init__(self, json_data, identity_policy='strong',
+                 weak_references=False):
         self.json_data = json_data
+        self._init_state(identity_policy, weak_references)
+
+    def _init_state(self, identity_policy, weak_references):
+        '''Set up the state shared by every kind of dataset
+
+        Subclasses that store their data differently, like
+        SQLitePopolo, call this instead of __init__.'''
+        self.identity_policy = identity_policy
+        self.weak_references = weak_references
+        self.weak_reference = weakref.ref(self)
+        self.identity_map = None
+        if identity_policy is not None:
+            self.identity_map = IdentityMap(identity_policy)
+        self.interner = None
+        self.change_log = []
+        self._caches = BuildCache()
+        self._positions = {}
+        self._write_lock = threading.RLock()
+
+    def _collection(self, popolo_array, collection_class):
+        '''Return a collection of one of the Popolo arrays
+
+        With the 'strong' identity policy, the collection (with any
+        indexes it has built) is kept until the data is changed.'''
+        def build():
+            return collection_class(self.json_data.get(popolo_array, []), self)
+        if self.identity_policy == 'strong':
+            return build_once(self._caches, popolo_array, build)
+        return build()
 
     @property
     def persons(self):
-        return PersonCollection(self.json_data.get('persons', []), self)
+        return self._collection('persons', PersonCollection)
 
     @property
     def organizations(self):
-        return OrganizationCollection(
-            self.json_data.get('organizations', []), self)
+        return self._collection('organizations', OrganizationCollection)
 
     @property
     def memberships(self):
-        return MembershipCollection(
-            self.json_data.get('memberships', []), self)
+        return self._collection('memberships', MembershipCollection)
 
     @property
     def areas(self):
-        return AreaCollection(self.json_data.get('areas', []), self)
+        return self._collection('areas', AreaCollection)
 
     @property
     def posts(self):
-        return PostCollection(self.json_data.get('posts', []), self)
+        return self._collection('posts', PostCollection)
 
     @property
     def events(self):
-        return EventCollection(self.json_data.get('events', []), self)
+        return self._collection('events', EventCollection)
+
+    @property
+    def graph(self):
+        return build_once(self._caches, 'graph', lambda: PopoloGraph(self))
+
+    def composition(self, organization):
+        '''Return the CompositionTimeline of an organization or its id
+
+        This is built the first time it's needed, and rebuilt after
+        the data is changed.'''
+        organization_id = getattr(organization, 'id', organization)
+        return build_once(
+            self._caches, ('composition', organization_id),
+            lambda: CompositionTimeline(organization_id, self))
+
+    def careers(self, organization=None, as_of=None):
+        '''Return a dict mapping person ids to their Careers
+
+        Pass an organization (or its id) to only look at memberships
+        of that organization. The result is cached until the data is
+        changed, but only for the latest as_of asked for, so that a
+        long-running service doesn't keep one for every day; see
+        compute_careers for the details.'''
+        organization_id = getattr(organization, 'id', organization)
+        if as_of is None:
+            as_of = date.today()
+
+        # Each organization has one slot holding an (as_of, careers)
+        # tuple, which is replaced as a whole:
+        key = ('careers', organization_id)
+        slot = self._caches.get(key)
+        if slot is None or slot[0] != as_of:
+            with self._caches.lock_for(key):
+                slot = self._caches.get(key)
+                if slot is None or slot[0] != as_of:
+                    slot = (as_of, compute_careers(
+                        self, organization_id, as_of))
+                    self._caches[key] = slot
+        return slot[1]
 
     @property
     def elections(self):
@@ -62,9 +388,187 @@ class Popolo(object):
 
     @property
     def latest_legislative_period(self):
-        lps = self.legislative_periods
-        return max(lps, key=lambda lp: lp.start_date.midpoint_date)
+        for event in self.events.order_by('-start_date'):
+            if event.classification == 'legislative period':
+                return event
+        raise ValueError("There are no legislative periods")
 
     @property
     def latest_term(self):
         return self.latest_legislative_period
+
+    def diff(self, other):
+        '''Generate the Changes needed to turn this dataset into other
+
+        Changes are yielded one at a time, so can be processed as they
+        are found; they can be passed to apply_changes.'''
+        return iter_diff(self.json_data, other.json_data)
+
+    def validate(self):
+        '''Return a list of every Problem found with the data
+
+        See iter_problems for the checks made; to check a file before
+        loading it, use validate_file instead.'''
+        return list(iter_problems(self.json_data))
+
+    def _array_positions(self, popolo_array):
+        '''Return a dict mapping record keys to positions in the array
+
+        The values are lists since, for example, a file might contain
+        the same membership twice.'''
+        if popolo_array not in POPOLO_ARRAYS:
+            raise ValueError(
+                "Unknown Popolo array {0}".format(popolo_array))
+        positions = self._positions.get(popolo_array)
+        if positions is None:
+            positions = {}
+            records = self.json_data.get(popolo_array, [])
+            for i, data in enumerate(records):
+                key = record_key(popolo_array, data)
+                positions.setdefault(key, []).append(i)
+            self._positions[popolo_array] = positions
+        return positions
+
+    def _position_of(self, popolo_array, key):
+        positions = self._array_positions(popolo_array).get(key)
+        if not positions:
+            msg = "No record with key {0} found in {1}"
+            raise KeyError(msg.format(key, popolo_array))
+        return positions[0]
+
+    def _record_change(self, change, position):
+        self.change_log.append(change)
+        if self.identity_map is not None and change.old is not None:
+            self.identity_map.discard(change.old)
+        self._update_caches(change, position)
+        return change
+
+    def _update_caches(self, change, position):
+        '''Bring cached collections and indexes up to date after a Change
+
+        The collections of the changed array (the cached one, and the
+        graph's if that's different) and the graph are updated in
+        place. Other cached values are only dropped, to be rebuilt
+        when next needed, if they depend on the changed array.'''
+        popolo_array = change.array
+        records = self.json_data[popolo_array]
+        positions = self._positions[popolo_array]
+        graph = self._caches.get('graph')
+        collections = [self._caches.get(popolo_array)]
+        if graph is not None:
+            collections.append(graph.collection(popolo_array))
+        patched = set()
+        for collection in collections:
+            if collection is None or id(collection) in patched:
+                continue
+            patched.add(id(collection))
+            if collection.data_list is records:
+                collection._record_changed(change.action, position, positions)
+            else:
+                # The collection was made before the array existed:
+                self._caches.pop(popolo_array, None)
+                graph = None
+                self._caches.pop('graph', None)
+        if graph is not None and not graph.record_changed(change, position):
+            self._caches.pop('graph', None)
+        for key in list(self._caches):
+            if cache_depends_on(key, popolo_array):
+                self._caches.pop(key, None)
+
+    def take_changes(self):
+        '''Return the change_log and start a new, empty one
+
+        Every Change is kept in change_log until it's taken, so call
+        this regularly (e.g. after passing the changes on with
+        apply_changes) when making many changes to a dataset.'''
+        with self._write_lock:
+            changes = self.change_log
+            self.change_log = []
+            return changes
+
+    @synchronized
+    def add(self, popolo_array, data):
+        '''Add a new record to one of the Popolo arrays
+
+        Returns the Change that was made.'''
+        positions = self._array_positions(popolo_array)
+        key = record_key(popolo_array, data)
+        if popolo_array != 'memberships' and positions.get(key):
+            msg = "A record with key {0} already exists in {1}"
+            raise ValueError(msg.format(key, popolo_array))
+        records = self.json_data.setdefault(popolo_array, [])
+        position = len(records)
+        positions.setdefault(key, []).append(position)
+        records.append(data)
+        return self._record_change(
+            Change('add', popolo_array, key, None, data), position)
+
+    @synchronized
+    def update(self, popolo_array, key, changes):
+        '''Update fields of the record in popolo_array with this key
+
+        Any field in changes whose value is None is removed from the
+        record. The record's data is replaced rather than modified in
+        place, so objects already wrapping the old data are unaffected.
+        Returns the Change that was made.'''
+        position = self._position_of(popolo_array, key)
+        records = self.json_data[popolo_array]
+        old = records[position]
+        new = dict(old)
+        for field, value in changes.items():
+            if value is None:
+                new.pop(field, None)
+            else:
+                new[field] = value
+        new_key = record_key(popolo_array, new)
+        positions = self._positions[popolo_array]
+        if new_key != key and popolo_array != 'memberships' and \
+                positions.get(new_key):
+            msg = "A record with key {0} already exists in {1}"
+            raise ValueError(msg.format(new_key, popolo_array))
+        records[position] = new
+        if new_key != key:
+            positions[key].remove(position)
+            if not positions[key]:
+                del positions[key]
+            positions.setdefault(new_key, []).append(position)
+        return self._record_change(
+            Change('update', popolo_array, key, old, new), position)
+
+    @synchronized
+    def remove(self, popolo_array, key):
+        '''Remove the record in popolo_array with this key
+
+        The order of the other records is kept, so this takes time in
+        proportion to the number of records after the removed one,
+        which all move down one place, and the graph is rebuilt when
+        next used. Returns the Change that was made.'''
+        position = self._position_of(popolo_array, key)
+        positions = self._positions[popolo_array]
+        records = self.json_data[popolo_array]
+        old = records.pop(position)
+        positions[key].remove(position)
+        if not positions[key]:
+            del positions[key]
+        for i in range(position, len(records)):
+            moved = positions[record_key(popolo_array, records[i])]
+            moved[moved.index(i + 1)] = i
+        return self._record_change(
+            Change('remove', popolo_array, key, old, None), position)
+
+    @synchronized
+    def apply_changes(self, changes):
+        '''Apply a sequence of Change objects, e.g. from a change_log'''
+        for change in changes:
+            if change.action == 'add':
+                self.add(change.array, change.new)
+            elif change.action == 'update':
+                fields = dict(
+                    (k, None) for k in change.old if k not in change.new)
+                fields.update(change.new)
+                self.update(change.array, change.key, fields)
+            elif change.action == 'remove':
+                self.remove(change.array, change.key)
+            else:
+                raise ValueError(
+                    "Unknown change action {0}".format(change.action))
@@ -0,0 +1,161 @@
+import json
+import re
+import threading
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+
+_WHITESPACE_RE = re.compile(r'\s*')
+
+_STRING_RE = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+
+
+def _depth_at(text, position):
+    '''Find the nesting depth of JSON text at position
+
+    Strings (which can contain brackets and escaped quotes) are
+    removed first, by a regular expression so that the scan is still
+    fast, and then the brackets left are counted. Returns None if
+    position is inside a string.'''
+    outside_strings = _STRING_RE.sub('', text[:position])
+    if '"' in outside_strings:
+        return None
+    opened = outside_strings.count('{') + outside_strings.count('[')
+    closed = outside_strings.count('}') + outside_strings.count(']')
+    return opened - closed
+
+
+def find_top_level_value(text, key):
+    '''Find where the value of a key of the top-level JSON object starts
+
+    Returns the index of the start of the value, None if the key
+    doesn't appear at all, or raises ValueError if it's ambiguous
+    where the value is (e.g. because nested objects use the same
+    key). This searches for the key rather than parsing the text, so
+    is much faster than decoding everything before the value.'''
+    needle = json.dumps(key)
+    candidates = []
+    position = text.find(needle)
+    while position != -1:
+        after_key = _WHITESPACE_RE.match(text, position + len(needle)).end()
+        if text[after_key:after_key + 1] == ':':
+            candidates.append((position, after_key + 1))
+        position = text.find(needle, position + 1)
+    if not candidates:
+        return None
+    if len(candidates) > 1:
+        raise ValueError("Multiple candidates for key {0}".format(key))
+    key_start, after_colon = candidates[0]
+    if _depth_at(text, key_start) != 1:
+        raise ValueError("Couldn't confirm {0} is a top-level key".format(key))
+    return _WHITESPACE_RE.match(text, after_colon).end()
+
+
+class LazyJSONData(MutableMapping):
+    '''A dict-like view of a JSON object that decodes values on demand
+
+    This keeps the original JSON text, and only decodes the value of
+    a top-level key (e.g. the 'events' array of a Popolo file) the
+    first time it's accessed, so the other arrays never need to be
+    parsed. If a key can't be located unambiguously, or the keys
+    need to be listed, the whole text is decoded and released. An
+    object_pairs_hook is passed on to the JSON decoder, and if
+    transform is given, each decoded value is replaced by
+    transform(key, value).'''
+
+    def __init__(self, text, object_pairs_hook=None, transform=None):
+        if isinstance(text, bytes):
+            text = text.decode('utf-8')
+        self.text = text
+        self.decoder = json.JSONDecoder(
+            object_pairs_hook=object_pairs_hook)
+        self.transform = transform
+        self.decoded = {}
+        self.removed = set()
+        self.lock = threading.RLock()
+
+    @property
+    def is_decoded(self):
+        return self.text is None
+
+    def _decode_all(self):
+        with self.lock:
+            self._decode_all_locked()
+
+    def _decode_all_locked(self):
+        if self.text is None:
+            return
+        everything = self.decoder.decode(self.text)
+        if not isinstance(everything, dict):
+            raise ValueError("Expected a JSON object")
+        for key in self.removed:
+            everything.pop(key, None)
+        if self.transform is not None:
+            for key, value in everything.items():
+                if key not in self.decoded:
+                    everything[key] = self.transform(key, value)
+        everything.update(self.decoded)
+        self.decoded = everything
+        self.text = None
+        self.removed = set()
+
+    def __getitem__(self, key):
+        try:
+            return self.decoded[key]
+        except KeyError:
+            pass
+        with self.lock:
+            return self._decode(key)
+
+    def _decode(self, key):
+        if key in self.decoded:
+            return self.decoded[key]
+        if self.text is None or key in self.removed:
+            raise KeyError(key)
+        try:
+            start = find_top_level_value(self.text, key)
+        except ValueError:
+            self._decode_all_locked()
+            return self.decoded[key]
+        if start is None:
+            raise KeyError(key)
+        value = self.decoder.raw_decode(self.text, start)[0]
+        if self.transform is not None:
+            value = self.transform(key, value)
+        self.decoded[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.decoded[key] = value
+            self.removed.discard(key)
+
+    def __delitem__(self, key):
+        with self.lock:
+            self[key]
+            del self.decoded[key]
+            if self.text is not None:
+                self.removed.add(key)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        self._decode_all()
+        return iter(self.decoded)
+
+    def __len__(self):
+        self._decode_all()
+        return len(self.decoded)
+
+    def __repr__(self):
+        if self.text is None:
+            return '<LazyJSONData: {0!r}>'.format(self.decoded)
+        return '<LazyJSONData: decoded {0}>'.format(sorted(self.decoded))
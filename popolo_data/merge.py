@@ -0,0 +1,153 @@
+from heapq import merge as heap_merge
+from itertools import count
+
+from .changes import POPOLO_ARRAYS, record_key
+from .importer import Popolo
+
+
+# The arrays whose records can be unified via shared identifiers,
+# and the fields of other records that refer to them.
+UNIFIED_ARRAYS = ('persons', 'organizations')
+REFERENCE_FIELDS = {
+    'person_id': 'persons',
+    'organization_id': 'organizations',
+    'on_behalf_of_id': 'organizations',
+}
+
+# Records are added in this order so that any references have been
+# unified before the records referring to them are seen:
+MERGE_ORDER = (
+    'persons', 'organizations', 'areas', 'posts', 'events', 'memberships')
+
+
+def merge_records(base, other):
+    '''Return a copy of base with data missing from it filled in from other
+
+    Fields already set in base take precedence, except that lists
+    (like identifiers or links) are combined, dropping duplicates.'''
+    merged = dict(base)
+    for field, value in other.items():
+        existing = merged.get(field)
+        if existing is None:
+            merged[field] = value
+        elif isinstance(existing, list) and isinstance(value, list):
+            merged[field] = existing + [v for v in value if v not in existing]
+    return merged
+
+
+class PopoloMerger(object):
+    '''Combine several Popolo datasets into one
+
+    Persons and organizations are unified if they have the same id or
+    share an identifier in one of the given schemes; other records
+    are unified if they have the same id, and memberships if they
+    have the same fingerprint (after references to unified persons
+    and organizations have been updated). Every lookup is in a dict,
+    so merging takes time linear in the total number of records.'''
+
+    def __init__(self, schemes=('wikidata',)):
+        self.schemes = schemes
+        self.records = dict((a, []) for a in POPOLO_ARRAYS)
+        self.positions = dict((a, {}) for a in POPOLO_ARRAYS)
+        self.identifier_positions = dict((a, {}) for a in UNIFIED_ARRAYS)
+
+    def _identifier_keys(self, data):
+        for identifier in data.get('identifiers', []):
+            if identifier.get('scheme') in self.schemes:
+                yield identifier['scheme'], identifier.get('identifier')
+
+    def _find(self, popolo_array, key, data):
+        if key is not None and key in self.positions[popolo_array]:
+            return self.positions[popolo_array][key]
+        if popolo_array in UNIFIED_ARRAYS:
+            identifier_positions = self.identifier_positions[popolo_array]
+            for identifier_key in self._identifier_keys(data):
+                if identifier_key in identifier_positions:
+                    return identifier_positions[identifier_key]
+        return None
+
+    def _remap(self, data, id_maps):
+        remapped = None
+        for field, popolo_array in REFERENCE_FIELDS.items():
+            old_id = data.get(field)
+            new_id = id_maps[popolo_array].get(old_id, old_id)
+            if new_id != old_id:
+                if remapped is None:
+                    remapped = dict(data)
+                remapped[field] = new_id
+        return data if remapped is None else remapped
+
+    def _add_record(self, popolo_array, data):
+        records = self.records[popolo_array]
+        key = record_key(popolo_array, data)
+        position = self._find(popolo_array, key, data)
+        if position is None:
+            position = len(records)
+            records.append(data)
+        else:
+            records[position] = merge_records(records[position], data)
+        if key is not None:
+            self.positions[popolo_array].setdefault(key, position)
+        if popolo_array in UNIFIED_ARRAYS:
+            identifier_positions = self.identifier_positions[popolo_array]
+            for identifier_key in self._identifier_keys(records[position]):
+                identifier_positions.setdefault(identifier_key, position)
+        return key, records[position]
+
+    def add(self, json_data):
+        '''Merge the records of one Popolo dataset into the result'''
+        id_maps = dict((a, {}) for a in UNIFIED_ARRAYS)
+        for popolo_array in MERGE_ORDER:
+            for data in json_data.get(popolo_array, []):
+                data = self._remap(data, id_maps)
+                key, merged = self._add_record(popolo_array, data)
+                if popolo_array in id_maps and key != merged.get('id'):
+                    id_maps[popolo_array][key] = merged.get('id')
+
+    @property
+    def json_data(self):
+        return dict(
+            (popolo_array, records)
+            for popolo_array, records in self.records.items() if records)
+
+
+def merge_popolo(sources, schemes=('wikidata',)):
+    '''Return a new Popolo object combining all the Popolo objects in sources
+
+    Earlier sources take precedence where records conflict.'''
+    merger = PopoloMerger(schemes)
+    for source in sources:
+        merger.add(source.json_data)
+    return Popolo(merger.json_data)
+
+
+def merge_sorted(popolo_array, streams):
+    '''Merge streams of records which are each sorted by record key
+
+    This is for data too large to hold in memory: each stream can be
+    any iterable of records from popolo_array (e.g. parsed lazily
+    from a file) that is sorted by record_key, and records with the
+    same key are combined with merge_records. Only one record from
+    each stream, and the records sharing the current key, are held in
+    memory at once. Records are only unified by key, not by shared
+    identifiers, since that would need an index of every record.
+    Records without an id can't be unified with anything, so they're
+    passed through unchanged; they sort before every other record.'''
+    def decorated(stream, source_number):
+        counter = count()
+        for data in stream:
+            key = record_key(popolo_array, data)
+            sort_key = (0,) if key is None else (1, key)
+            yield sort_key, source_number, next(counter), key, data
+    merged_stream = heap_merge(
+        *[decorated(s, i) for i, s in enumerate(streams)])
+    current_key = current = None
+    for _, _, _, key, data in merged_stream:
+        if current is not None and key is not None and key == current_key:
+            current = merge_records(current, data)
+            continue
+        if current is not None:
+            yield current
+        current_key, current = key, data
+    if current is not None:
+        yield current
@@ -0,0 +1,24 @@
+import weakref
+
+
+def _get_all_popolo(self):
+    all_popolo = self._all_popolo
+    if type(all_popolo) is weakref.ref:
+        all_popolo = all_popolo()
+        if all_popolo is None:
+            raise ReferenceError("This object's Popolo data has been released")
+    return all_popolo
+
+
+def _set_all_popolo(self, all_popolo):
+    if getattr(all_popolo, 'weak_references', False):
+        self._all_popolo = all_popolo.weak_reference
+    else:
+        self._all_popolo = all_popolo
+
+
+# The dataset that a Popolo object or collection belongs to. If the
+# dataset was created with weak_references=True, only a weak
+# reference to it is kept, so holding on to objects from it doesn't
+# stop it being released.
+all_popolo_property = property(_get_all_popolo, _set_all_popolo)
@@ -0,0 +1,283 @@
+from collections import namedtuple
+import sys
+import threading
+import time
+
+from .changes import POPOLO_ARRAYS, record_key
+from .importer import Popolo
+
+
+def copy_popolo(popolo):
+    '''Return a new Popolo object that can be modified independently
+
+    Only the top-level arrays are copied: the add, update and remove
+    methods replace records rather than changing them in place, so
+    the records themselves can be shared between the copies.'''
+    json_data = dict(
+        (popolo_array, list(records))
+        for popolo_array, records in popolo.json_data.items())
+    copied = Popolo(
+        json_data, identity_policy=popolo.identity_policy,
+        weak_references=popolo.weak_references)
+    copied.change_log = list(popolo.change_log)
+    return copied
+
+
+class SharedPopolo(object):
+    '''Publishes successive versions of a Popolo dataset to many threads
+
+    Readers get the latest published dataset from current or
+    snapshot() without taking any lock, and can keep using it for as
+    long as they like. A published Popolo object must never be
+    modified; instead, writers either publish() a freshly loaded
+    dataset or modify() a copy of the current one. Either way the new
+    version replaces the old one in a single assignment, so readers
+    see either the old or the new version, never a mixture.'''
+
+    def __init__(self, popolo):
+        self._published = (0, popolo)
+        self._write_lock = threading.Lock()
+
+    @property
+    def current(self):
+        return self._published[1]
+
+    @property
+    def version(self):
+        return self._published[0]
+
+    def snapshot(self):
+        '''Return a (version, Popolo) tuple for the current dataset'''
+        return self._published
+
+    def publish(self, popolo):
+        '''Replace the current dataset with popolo, returning its version'''
+        with self._write_lock:
+            version = self._published[0] + 1
+            self._published = (version, popolo)
+            return version
+
+    def modify(self, function):
+        '''Publish a modified copy of the current dataset
+
+        function is called with the copy, e.g. to call its add, update
+        and remove methods, before the copy is published. Writers are
+        serialized, so no modifications are lost. Returns the copy.'''
+        with self._write_lock:
+            version, popolo = self._published
+            copied = copy_popolo(popolo)
+            function(copied)
+            self._published = (version + 1, copied)
+            return copied
+
+
+LoadMetrics = namedtuple('LoadMetrics', [
+    'version', 'load_seconds', 'warm_seconds', 'approximate_bytes',
+    'shared_records', 'total_records'])
+
+
+def approximate_size(obj):
+    '''Estimate the memory used by decoded JSON data, in bytes
+
+    Objects that are referred to more than once (e.g. records shared
+    with an earlier version of the data) are only counted once.'''
+    seen = set()
+    total = 0
+    pending = [obj]
+    while pending:
+        o = pending.pop()
+        if id(o) in seen:
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        if isinstance(o, dict):
+            pending.extend(o.keys())
+            pending.extend(o.values())
+        elif isinstance(o, list):
+            pending.extend(o)
+    return total
+
+
+def share_structure(old_json_data, new_json_data):
+    '''Reuse records of old_json_data that are unchanged in new_json_data
+
+    Returns a tuple of the new data, in which every record equal to
+    a record in the old data with the same key is replaced by the old
+    record, and the number of records replaced. If an array is
+    entirely unchanged, the old array itself is used. This means the
+    newly decoded copies can be freed straight away, rather than
+    both versions being kept in memory.'''
+    result = dict(new_json_data)
+    shared = 0
+    for popolo_array in POPOLO_ARRAYS:
+        old_records = old_json_data.get(popolo_array)
+        new_records = new_json_data.get(popolo_array)
+        if not old_records or not new_records:
+            continue
+        old_index = dict(
+            (record_key(popolo_array, data), data) for data in old_records)
+        records = []
+        for data in new_records:
+            old = old_index.get(record_key(popolo_array, data))
+            if old is not None and old == data:
+                data = old
+                shared += 1
+            records.append(data)
+        if len(records) == len(old_records) and \
+                all(a is b for a, b in zip(records, old_records)):
+            records = old_records
+        result[popolo_array] = records
+    return result, shared
+
+
+def is_in_memory(popolo):
+    '''Check whether popolo is a plain Popolo with its data in memory
+
+    Only then can records be shared between versions; for others,
+    like an SQLitePopolo, json_data makes a new copy of everything.'''
+    return type(popolo) is Popolo and isinstance(popolo.json_data, dict)
+
+
+class PopoloHandle(object):
+    '''Keeps the latest version of a Popolo dataset available to a service
+
+    loader is a function that loads the dataset and returns a Popolo
+    object, e.g.:
+
+        handle = PopoloHandle(lambda: Popolo.from_url(URL))
+
+    The dataset is loaded straight away. Calling reload_in_background()
+    (or start(), to reload every interval seconds) loads a new version
+    in a background thread, calls warm (if given) with it so that any
+    indexes can be built before it's used, and then publishes it.
+    Queries that are using the old version carry on using it; new
+    calls to current get the new version. Records that haven't
+    changed are shared with the old version, and if nothing has
+    changed the old version (and its indexes) is kept; this is only
+    done for plain Popolo objects, since for others (e.g. those from
+    Popolo.from_sqlite) it would mean reading the whole dataset
+    again. Details of the
+    last load are in metrics, and the exception raised by the last
+    failed load (if any) is in last_error.
+
+    Working out the approximate_bytes of the metrics means looking at
+    every object in the dataset, which takes about as long as loading
+    it, so it's only done if measure_size is True, and then only when
+    the data has changed; otherwise it's None.'''
+
+    def __init__(self, loader, warm=None, share=True, measure_size=False):
+        self.loader = loader
+        self.warm = warm
+        self.share = share
+        self.measure_size = measure_size
+        self.metrics = None
+        self.last_error = None
+        self._reload_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._shared = None
+        self.reload()
+
+    @property
+    def current(self):
+        return self._shared.current
+
+    @property
+    def version(self):
+        return self._shared.version
+
+    def snapshot(self):
+        '''Return a (version, Popolo) tuple for the current dataset'''
+        return self._shared.snapshot()
+
+    def _prepare(self, popolo):
+        started = time.time()
+        if self.warm is not None:
+            self.warm(popolo)
+        return time.time() - started
+
+    def reload(self):
+        '''Load and publish a new version of the dataset now
+
+        Returns the LoadMetrics of the load.'''
+        with self._reload_lock:
+            started = time.time()
+            popolo = self.loader()
+            old_popolo = self._shared and self._shared.current
+            shared = 0
+            if self.share and is_in_memory(popolo) and \
+                    is_in_memory(old_popolo):
+                json_data, shared = share_structure(
+                    old_popolo.json_data, popolo.json_data)
+                if all(json_data.get(a) is old_popolo.json_data.get(a)
+                       for a in set(json_data) | set(old_popolo.json_data)):
+                    popolo = old_popolo
+                else:
+                    popolo = Popolo(
+                        json_data, identity_policy=popolo.identity_policy,
+                        weak_references=popolo.weak_references)
+            load_seconds = time.time() - started
+            if popolo is old_popolo:
+                warm_seconds = 0.0
+                version = self._shared.version
+            else:
+                warm_seconds = self._prepare(popolo)
+                if self._shared is None:
+                    self._shared = SharedPopolo(popolo)
+                    version = 0
+                else:
+                    version = self._shared.publish(popolo)
+            approximate_bytes = None
+            if popolo is old_popolo:
+                approximate_bytes = self.metrics.approximate_bytes
+            elif self.measure_size and is_in_memory(popolo):
+                approximate_bytes = approximate_size(popolo.json_data)
+            self.metrics = LoadMetrics(
+                version=version,
+                load_seconds=load_seconds,
+                warm_seconds=warm_seconds,
+                approximate_bytes=approximate_bytes,
+                shared_records=shared,
+                total_records=sum(
+                    len(getattr(popolo, a)) for a in POPOLO_ARRAYS))
+            return self.metrics
+
+    def _reload_logging_errors(self):
+        try:
+            self.reload()
+        except Exception as e:
+            self.last_error = e
+        else:
+            self.last_error = None
+
+    def reload_in_background(self):
+        '''Start reloading the dataset in a background thread
+
+        If a reload is already in progress, no new one is started.
+        Returns the thread doing the reload.'''
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            thread = threading.Thread(target=self._reload_logging_errors)
+            thread.daemon = True
+            thread.start()
+            self._thread = thread
+        return thread
+
+    def start(self, interval):
+        '''Reload the dataset every interval seconds until stop() is called
+
+        Returns the background thread doing the reloads.'''
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval):
+                self._reload_logging_errors()
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def stop(self):
+        '''Stop the periodic reloads started by start()'''
+        self._stop.set()
@@ -0,0 +1,360 @@
+from collections import OrderedDict
+from itertools import islice
+import json
+import sqlite3
+import threading
+
+from .base import (
+    Area, AreaCollection, Event, EventCollection, Membership,
+    MembershipCollection, Organization, OrganizationCollection, Person,
+    PersonCollection, Post, PostCollection, NORMALIZED_SUFFIX, find_in_bulk,
+    membership_fingerprint, unique_preserving_order)
+from .changes import POPOLO_ARRAYS
+from .importer import Popolo
+
+
+# The fields of each array that get their own indexed column, so
+# that filter() on them can be done by SQLite. In each case the
+# field has the same name as the property of the Popolo object.
+INDEXED_FIELDS = {
+    'persons': ('id', 'name'),
+    'organizations': ('id', 'name', 'classification'),
+    'memberships': (
+        'fingerprint', 'person_id', 'organization_id', 'on_behalf_of_id',
+        'post_id', 'area_id', 'legislative_period_id', 'role'),
+    'events': ('id', 'classification', 'organization_id'),
+    'areas': ('id', 'name', 'type'),
+    'posts': ('id', 'label', 'organization_id'),
+}
+
+COLLECTION_CLASSES = {
+    'persons': (Person, PersonCollection),
+    'organizations': (Organization, OrganizationCollection),
+    'memberships': (Membership, MembershipCollection),
+    'events': (Event, EventCollection),
+    'areas': (Area, AreaCollection),
+    'posts': (Post, PostCollection),
+}
+
+# The column that lookup_from_key and in_bulk use for each array;
+# memberships rarely have ids, so they're found by fingerprint, as in
+# MembershipCollection.
+KEY_FIELDS = dict(
+    (popolo_array, 'id') for popolo_array in INDEXED_FIELDS)
+KEY_FIELDS['memberships'] = 'fingerprint'
+
+DEFAULT_CACHE_SIZE = 1000
+
+# Older versions of SQLite allow at most 999 parameters in a query.
+MAX_QUERY_PARAMETERS = 500
+
+
+def convert_to_sqlite(json_data, path):
+    '''Write Popolo JSON data (e.g. Popolo.json_data) to an SQLite database
+
+    Each record's data is stored as JSON alongside indexed columns
+    for the fields in INDEXED_FIELDS.'''
+    def column_value(data, field):
+        if field == 'fingerprint':
+            return membership_fingerprint(data)
+        return data.get(field)
+
+    connection = sqlite3.connect(path)
+    try:
+        with connection:
+            for popolo_array in POPOLO_ARRAYS:
+                fields = INDEXED_FIELDS[popolo_array]
+                connection.execute(
+                    'CREATE TABLE {0} (data TEXT NOT NULL, {1})'.format(
+                        popolo_array, ', '.join(fields)))
+                for field in fields:
+                    connection.execute(
+                        'CREATE INDEX {0}_{1} ON {0} ({1})'.format(
+                            popolo_array, field))
+                insert = 'INSERT INTO {0} VALUES (?, {1})'.format(
+                    popolo_array, ', '.join('?' for _ in fields))
+                connection.executemany(insert, (
+                    [json.dumps(data)] +
+                    [column_value(data, f) for f in fields]
+                    for data in json_data.get(popolo_array, [])))
+    finally:
+        connection.close()
+
+
+class ReadOnlyError(TypeError):
+    '''Raised when trying to modify a read-only Popolo dataset'''
+
+
+class ObjectCache(object):
+    '''A small least-recently-used cache of Popolo objects by row id'''
+
+    def __init__(self, size):
+        self.size = size
+        self.objects = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, create):
+        with self.lock:
+            o = self.objects.pop(key, None)
+            if o is None:
+                o = create()
+            self.objects[key] = o
+            if len(self.objects) > self.size:
+                self.objects.popitem(last=False)
+            return o
+
+
+class SQLiteLookup(object):
+    '''A stand-in for lookup_from_key that queries the database by key
+
+    The key is the id, or for memberships the fingerprint.'''
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.key_field = KEY_FIELDS[collection.popolo_array]
+
+    def __getitem__(self, key):
+        found = self.collection.filter(**{self.key_field: key}).first
+        if found is None:
+            raise KeyError(key)
+        return found
+
+    def get(self, key, default=None):
+        if key is None:
+            return default
+        found = self.collection.filter(**{self.key_field: key}).first
+        return default if found is None else found
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+
+class SQLiteCollection(object):
+    '''A collection of Popolo objects whose data is in an SQLite table
+
+    This supports the same basic API as PopoloCollection, but filter()
+    on an indexed field adds a WHERE clause rather than scanning every
+    object, and nothing is loaded until it's needed. Other filters
+    are applied in Python as rows are read. Any other attribute of
+    the in-memory collection class (e.g. PersonCollection.names_at)
+    works too, by loading every matching object.'''
+
+    def __init__(self, all_popolo, popolo_array, conditions=(),
+                 python_conditions=()):
+        self.all_popolo = all_popolo
+        self.popolo_array = popolo_array
+        self.object_class, self.collection_class = \
+            COLLECTION_CLASSES[popolo_array]
+        self.conditions = tuple(conditions)
+        self.python_conditions = tuple(python_conditions)
+        self.lookup_from_key = SQLiteLookup(self)
+
+    def _query(self, columns, suffix='', params=(), where=None,
+               where_params=()):
+        sql = 'SELECT {0} FROM {1}'.format(columns, self.popolo_array)
+        clauses = ['{0} IS ?'.format(field) for field, _ in self.conditions]
+        if where is not None:
+            clauses.append(where)
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += suffix
+        all_params = tuple(v for _, v in self.conditions) + \
+            tuple(where_params) + tuple(params)
+        return self.all_popolo.connection.execute(sql, all_params)
+
+    def _object(self, rowid, data_json):
+        return self.all_popolo.object_cache.get(
+            (self.popolo_array, rowid),
+            lambda: self.object_class(json.loads(data_json), self.all_popolo))
+
+    def __iter__(self):
+        for rowid, data_json in self._query(
+                'rowid, data', ' ORDER BY rowid'):
+            o = self._object(rowid, data_json)
+            if all(getattr(o, k) == v for k, v in self.python_conditions):
+                yield o
+
+    def __len__(self):
+        if self.python_conditions:
+            return sum(1 for _ in self)
+        return self._query('COUNT(*)').fetchone()[0]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice) or self.python_conditions:
+            return list(self)[index]
+        if index < 0:
+            index += len(self)
+            if index < 0:
+                raise IndexError(index)
+        row = self._query(
+            'rowid, data', ' ORDER BY rowid LIMIT 1 OFFSET ?',
+            (index,)).fetchone()
+        if row is None:
+            raise IndexError(index)
+        return self._object(*row)
+
+    @property
+    def first(self):
+        for o in self:
+            return o
+        return None
+
+    def filter(self, **kwargs):
+        if any(k.endswith(NORMALIZED_SUFFIX) for k in kwargs):
+            return self.materialize().filter(**kwargs)
+        indexed = INDEXED_FIELDS[self.popolo_array]
+        conditions = list(self.conditions)
+        python_conditions = list(self.python_conditions)
+        for k, v in sorted(kwargs.items()):
+            if k in indexed:
+                conditions.append((k, v))
+            else:
+                python_conditions.append((k, v))
+        return self.__class__(
+            self.all_popolo, self.popolo_array, conditions, python_conditions)
+
+    def get(self, **kwargs):
+        matches = list(islice(self.filter(**kwargs), 2))
+        if not matches:
+            msg = "No {0} found matching {1}"
+            raise self.object_class.DoesNotExist(msg.format(
+                self.object_class, kwargs))
+        elif len(matches) > 1:
+            n = len(self.filter(**kwargs))
+            msg = "Multiple {0} objects ({1}) found matching {2}"
+            raise self.object_class.MultipleObjectsReturned(msg.format(
+                self.object_class, n, kwargs))
+        return matches[0]
+
+    def in_bulk(self, ids, missing='skip'):
+        '''Return a dict mapping each of ids to the object with that id
+
+        The objects are found with WHERE id IN (...) queries (or for
+        memberships, WHERE fingerprint IN (...)), so only the rows
+        asked for are loaded. missing is as for
+        PopoloCollection.in_bulk.'''
+        key_field = KEY_FIELDS[self.popolo_array]
+        wanted = unique_preserving_order(ids)
+        by_id = {}
+        for i in range(0, len(wanted), MAX_QUERY_PARAMETERS):
+            chunk = wanted[i:i + MAX_QUERY_PARAMETERS]
+            rows = self._query(
+                'rowid, data', ' ORDER BY rowid',
+                where='{0} IN ({1})'.format(
+                    key_field, ', '.join('?' for _ in chunk)),
+                where_params=chunk)
+            for rowid, data_json in rows:
+                o = self._object(rowid, data_json)
+                if all(getattr(o, k) == v
+                       for k, v in self.python_conditions):
+                    by_id.setdefault(getattr(o, key_field), o)
+        return find_in_bulk(ids, by_id.get, missing, self.object_class)
+
+    def get_many(self, ids, missing='skip'):
+        '''Return a list of the objects with each of ids, in that order'''
+        found = self.in_bulk(ids, missing)
+        return [found[key] for key in ids if key in found]
+
+    def _view(self, objects):
+        return self.collection_class(None, self.all_popolo, objects=objects)
+
+    def materialize(self):
+        '''Return an in-memory collection of every matching object'''
+        return self._view(list(self))
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.materialize(), name)
+
+
+class SQLiteEventCollection(SQLiteCollection):
+
+    @property
+    def elections(self):
+        return self.filter(classification='general election')
+
+    @property
+    def legislative_periods(self):
+        return self.filter(classification='legislative period')
+
+
+class SQLitePopolo(Popolo):
+    '''A read-only Popolo dataset stored in an SQLite database
+
+    Create the database with convert_to_sqlite. Only the records that
+    are used are loaded, and the most recently used objects are kept
+    in a cache of cache_size objects. The json_data attribute loads
+    everything, so avoid anything (like diff or the exporters) that
+    uses it on large databases.'''
+
+    def __init__(self, path, cache_size=DEFAULT_CACHE_SIZE):
+        self.path = path
+        # SQLite connections can't be shared between threads, so each
+        # thread gets its own:
+        self._local = threading.local()
+        self.object_cache = ObjectCache(cache_size)
+        # Objects are kept in object_cache instead of an identity map:
+        self._init_state(identity_policy=None, weak_references=False)
+
+    @property
+    def json_data(self):
+        return dict(
+            (popolo_array, [
+                json.loads(row[0]) for row in self.connection.execute(
+                    'SELECT data FROM {0} ORDER BY rowid'.format(
+                        popolo_array))])
+            for popolo_array in POPOLO_ARRAYS)
+
+    def _collection(self, popolo_array):
+        return SQLiteCollection(self, popolo_array)
+
+    @property
+    def persons(self):
+        return self._collection('persons')
+
+    @property
+    def organizations(self):
+        return self._collection('organizations')
+
+    @property
+    def memberships(self):
+        return self._collection('memberships')
+
+    @property
+    def areas(self):
+        return self._collection('areas')
+
+    @property
+    def posts(self):
+        return self._collection('posts')
+
+    @property
+    def events(self):
+        return SQLiteEventCollection(self, 'events')
+
+    def add(self, popolo_array, data):
+        raise ReadOnlyError("SQLite Popolo data is read-only")
+
+    def update(self, popolo_array, key, changes):
+        raise ReadOnlyError("SQLite Popolo data is read-only")
+
+    def remove(self, popolo_array, key):
+        raise ReadOnlyError("SQLite Popolo data is read-only")
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path)
+            self._local.connection = connection
+        return connection
+
+    def close(self):
+        '''Close the connection to the database in the current thread
+
+        Any other threads' connections are closed when they exit.'''
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
@@ -0,0 +1,182 @@
+from collections import namedtuple
+import re
+
+from approx_dates.models import ApproxDate
+from six.moves.urllib_parse import urlsplit
+import six
+
+from .compression import MAGIC_LENGTH, decompress_file, detect_compression
+from .lazy import LazyJSONData
+
+
+# Arrays are checked in this order, so that most foreign keys refer to
+# an array that has already been seen and can be checked at once.
+VALIDATION_ORDER = (
+    'persons', 'organizations', 'areas', 'posts', 'events', 'memberships')
+
+# The foreign key fields of each array, and the array they refer to.
+FOREIGN_KEYS = {
+    'memberships': (
+        ('person_id', 'persons'),
+        ('organization_id', 'organizations'),
+        ('on_behalf_of_id', 'organizations'),
+        ('post_id', 'posts'),
+        ('area_id', 'areas'),
+        ('legislative_period_id', 'events'),
+    ),
+    'organizations': (('parent_id', 'organizations'),),
+    'areas': (('parent_id', 'areas'),),
+    'posts': (('organization_id', 'organizations'), ('area_id', 'areas')),
+    'events': (('organization_id', 'organizations'),),
+}
+
+TWITTER_HOSTS = ('twitter.com', 'www.twitter.com', 'mobile.twitter.com')
+
+_TWITTER_USERNAME_RE = re.compile(r'^@?\w{1,15}$', re.UNICODE)
+
+
+class Problem(namedtuple('Problem', ['array', 'index', 'field', 'message'])):
+    '''A problem with the record at position index of a Popolo array
+
+    field is the field with the problem, or None if it's the record as
+    a whole.'''
+
+    __slots__ = ()
+
+    def __str__(self):
+        where = '{0}[{1}]'.format(self.array, self.index)
+        if self.field:
+            where += '.' + self.field
+        return '{0}: {1}'.format(where, self.message)
+
+
+def _check_dates(popolo_array, index, data, prefix=''):
+    parsed = {}
+    for field, value in data.items():
+        if not field.endswith('_date'):
+            continue
+        try:
+            parsed[field] = ApproxDate.from_iso8601(value)
+        except (ValueError, TypeError, AttributeError):
+            yield Problem(
+                popolo_array, index, prefix + field,
+                'malformed date {0!r}'.format(value))
+    start, end = parsed.get('start_date'), parsed.get('end_date')
+    if start and end and start.earliest_date > end.latest_date:
+        yield Problem(
+            popolo_array, index, prefix + 'end_date',
+            'end_date is before start_date')
+    # Names can have dates of their own, e.g. for a party's old name:
+    other_names = data.get('other_names')
+    if not prefix and isinstance(other_names, list):
+        for i, name in enumerate(other_names):
+            if isinstance(name, dict):
+                name_prefix = 'other_names[{0}].'.format(i)
+                for problem in _check_dates(
+                        popolo_array, index, name, name_prefix):
+                    yield problem
+
+
+def is_valid_twitter(value):
+    '''Check that value is a Twitter username or URL'''
+    if not isinstance(value, six.string_types):
+        return False
+    if '/' in value:
+        split_url = urlsplit(value)
+        path_parts = split_url.path.strip('/').split('/')
+        return split_url.netloc in TWITTER_HOSTS and \
+            bool(_TWITTER_USERNAME_RE.match(path_parts[0]))
+    return bool(_TWITTER_USERNAME_RE.match(value.strip()))
+
+
+def _check_twitter(popolo_array, index, data):
+    values = [
+        ('contact_details', c.get('value'))
+        for c in data.get('contact_details', [])
+        if c.get('type') == 'twitter']
+    values.extend(
+        ('links', link.get('url'))
+        for link in data.get('links', [])
+        if link.get('note') == 'twitter')
+    for field, value in values:
+        if not is_valid_twitter(value):
+            yield Problem(
+                popolo_array, index, field,
+                'malformed Twitter username or URL {0!r}'.format(value))
+
+
+def iter_problems(json_data, release=False):
+    '''Generate a Problem for everything wrong with some Popolo JSON data
+
+    This checks for duplicate or missing ids, foreign keys that don't
+    refer to an existing record, malformed dates (and end dates
+    before start dates), and malformed Twitter usernames or URLs.
+    Every record is looked at once; only the set of ids of each
+    array is kept, plus any foreign keys that refer to an array that
+    hasn't been seen yet. Problems are generated as they're found,
+    except for those deferred foreign keys, which come at the end.
+
+    Each array's data is only looked up when it's needed, and if
+    release is True it's deleted from json_data once it's been
+    checked, so with a LazyJSONData only one array is decoded at a
+    time (see validate_file).'''
+    ids = {}
+    deferred = []
+    for popolo_array in VALIDATION_ORDER:
+        records = json_data.get(popolo_array, [])
+        seen = set()
+        for index, data in enumerate(records):
+            if popolo_array != 'memberships':
+                record_id = data.get('id')
+                if record_id is None:
+                    yield Problem(popolo_array, index, 'id', 'missing id')
+                elif record_id in seen:
+                    yield Problem(
+                        popolo_array, index, 'id',
+                        'duplicate id {0!r}'.format(record_id))
+                else:
+                    seen.add(record_id)
+            for field, target in FOREIGN_KEYS.get(popolo_array, ()):
+                value = data.get(field)
+                if value is None:
+                    continue
+                if target in ids:
+                    if value not in ids[target]:
+                        yield Problem(
+                            popolo_array, index, field,
+                            'no {0} record with id {1!r}'.format(
+                                target, value))
+                else:
+                    deferred.append(
+                        (popolo_array, index, field, target, value))
+            for problem in _check_dates(popolo_array, index, data):
+                yield problem
+            if popolo_array == 'persons':
+                for problem in _check_twitter(popolo_array, index, data):
+                    yield problem
+        ids[popolo_array] = seen
+        records = None
+        if release and popolo_array in json_data:
+            del json_data[popolo_array]
+    for popolo_array, index, field, target, value in deferred:
+        if value not in ids[target]:
+            yield Problem(
+                popolo_array, index, field,
+                'no {0} record with id {1!r}'.format(target, value))
+
+
+def validate_file(filename):
+    '''Generate the Problems with a Popolo JSON file
+
+    Only one array of the file is decoded at a time, and each is
+    released once it's been checked, so this needs much less memory
+    than loading the whole file first. Compressed files are detected
+    and decompressed as for Popolo.from_filename.'''
+    with open(filename, 'rb') as f:
+        compression = detect_compression(f.read(MAGIC_LENGTH))
+        f.seek(0)
+        if compression is None:
+            text = f.read()
+        else:
+            text = decompress_file(f, compression)
+    return iter_problems(LazyJSONData(text), release=True)
@@ -18,5 +18,9 @@ setup(
         'approx_dates',
         'requests',
         'six >= 1.9.0',
-    ]
+    ],
+    extras_require={
+        'arrow': ['pyarrow'],
+        'zstd': ['zstandard'],
+    }
 )
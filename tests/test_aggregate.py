@@ -0,0 +1,158 @@
+from datetime import date
+from unittest import TestCase
+
+import pytest
+
+from popolo_data.importer import Popolo
+
+
+EXAMPLE_DATA = {
+    'persons': [
+        {'id': 'picard', 'gender': 'male'},
+        {'id': 'troi', 'gender': 'female'},
+        {'id': 'riker', 'gender': 'male'},
+        {'id': 'crusher', 'gender': 'female'},
+    ],
+    'organizations': [
+        {'id': 'starfleet', 'name': 'Starfleet', 'seats': 3},
+        {'id': 'betazed', 'name': 'Betazed', 'seats': 2},
+        {'id': 'council', 'name': 'Council'},
+    ],
+    'memberships': [
+        {
+            'person_id': 'picard',
+            'organization_id': 'council',
+            'on_behalf_of_id': 'starfleet',
+            'legislative_period_id': 'term/1',
+            'start_date': '2364-01-01',
+        },
+        {
+            'person_id': 'troi',
+            'organization_id': 'council',
+            'on_behalf_of_id': 'betazed',
+            'legislative_period_id': 'term/1',
+            'start_date': '2364-03-01',
+        },
+        {
+            'person_id': 'riker',
+            'organization_id': 'council',
+            'on_behalf_of_id': 'starfleet',
+            'legislative_period_id': 'term/1',
+            'start_date': '2364-02-01',
+        },
+        {
+            'person_id': 'riker',
+            'organization_id': 'council',
+            'on_behalf_of_id': 'starfleet',
+            'legislative_period_id': 'term/2',
+        },
+        {
+            'person_id': 'crusher',
+            'organization_id': 'council',
+            'legislative_period_id': 'term/2',
+            'start_date': '2366',
+        },
+    ],
+}
+
+
+class TestGroupBy(TestCase):
+
+    def setUp(self):
+        self.memberships = Popolo(EXAMPLE_DATA).memberships
+
+    def test_count_by_two_fields(self):
+        counts = self.memberships.group_by(
+            'legislative_period_id', 'on_behalf_of_id').count()
+        assert counts == {
+            ('term/1', 'starfleet'): 2,
+            ('term/1', 'betazed'): 1,
+            ('term/2', 'starfleet'): 1,
+            ('term/2', None): 1,
+        }
+
+    def test_count_by_joined_field(self):
+        counts = self.memberships.group_by(
+            'legislative_period_id', 'person.gender').count()
+        assert counts == {
+            ('term/1', 'male'): 2,
+            ('term/1', 'female'): 1,
+            ('term/2', 'male'): 1,
+            ('term/2', 'female'): 1,
+        }
+
+    def test_single_field_keys_are_values(self):
+        counts = self.memberships.group_by('on_behalf_of.name').count()
+        assert counts == {'Starfleet': 3, 'Betazed': 1, None: 1}
+
+    def test_min_and_max_dates(self):
+        grouped = self.memberships.group_by('legislative_period_id')
+        assert grouped.min('start_date') == {
+            'term/1': '2364-01-01', 'term/2': '2366'}
+        assert grouped.max('start_date') == {
+            'term/1': '2364-03-01', 'term/2': '2366'}
+
+    def test_sum_of_joined_field(self):
+        grouped = self.memberships.group_by('legislative_period_id')
+        assert grouped.sum('on_behalf_of.seats') == {'term/1': 8, 'term/2': 3}
+
+    def test_sum_rejects_non_numbers(self):
+        grouped = self.memberships.group_by('legislative_period_id')
+        with pytest.raises(TypeError):
+            grouped.sum('start_date')
+
+    def test_sum_days(self):
+        grouped = self.memberships.group_by('legislative_period_id')
+        assert grouped.sum_days(as_of=date(2366, 6, 30)) == {
+            'term/1': 912 + 852 + 881, 'term/2': 181}
+        assert grouped.sum_days(as_of=date(2365, 1, 1)) == {
+            'term/1': 367 + 307 + 336}
+
+    def test_sum_days_with_end_dates(self):
+        memberships = Popolo({'memberships': [
+            {'person_id': 'picard', 'start_date': '2364-01-01',
+             'end_date': '2364-01-31'},
+            {'person_id': 'picard', 'start_date': '2364-03',
+             'end_date': '2364-03'},
+            {'person_id': 'troi', 'start_date': '2365',
+             'end_date': '2364'},
+        ]}).memberships
+        grouped = memberships.group_by('person_id')
+        assert grouped.sum_days(as_of=date(2400, 1, 1)) == {
+            'picard': 31 + 31}
+
+    def test_callable_field(self):
+        grouped = self.memberships.group_by(
+            lambda data: data.get('start_date', '')[:4] or None)
+        assert grouped.count() == {'2364': 3, None: 1, '2366': 1}
+
+    def test_group_other_collections(self):
+        counts = Popolo(EXAMPLE_DATA).persons.group_by('gender').count()
+        assert counts == {'male': 2, 'female': 2}
+
+    def test_unknown_relation(self):
+        with pytest.raises(ValueError):
+            self.memberships.group_by('starship.name')
+
+    def test_no_fields(self):
+        with pytest.raises(ValueError):
+            self.memberships.group_by()
+
+    def test_no_objects_created(self):
+        for policy in ('strong', 'weak', None):
+            popolo = Popolo(EXAMPLE_DATA, identity_policy=policy)
+            memberships = popolo.memberships
+            grouped = memberships.group_by('person.gender', 'role')
+            grouped.count()
+            grouped.min('start_date')
+            assert memberships._object_list is None
+            if policy is not None:
+                assert len(popolo.identity_map) == 0
+
+    def test_objects_created_when_needed(self):
+        popolo = Popolo(EXAMPLE_DATA)
+        memberships = popolo.memberships
+        assert len(memberships) == 5
+        assert memberships._object_list is None
+        assert memberships[0].person_id == 'picard'
+        assert len(popolo.identity_map) == 5
@@ -0,0 +1,161 @@
+import csv
+from datetime import date
+import io
+import json
+import threading
+from unittest import TestCase
+
+import six
+
+from popolo_data.careers import compute_careers, write_careers_csv
+from popolo_data.importer import Popolo
+
+
+EXAMPLE_DATA = {
+    'persons': [{'id': 'riker'}, {'id': 'troi'}],
+    'memberships': [
+        {
+            'person_id': 'riker',
+            'organization_id': 'council',
+            'on_behalf_of_id': 'starfleet',
+            'legislative_period_id': 'term/2',
+            'start_date': '2000-01-01',
+            'end_date': '2000-12-31',
+        },
+        {
+            'person_id': 'riker',
+            'organization_id': 'council',
+            'on_behalf_of_id': 'maquis',
+            'legislative_period_id': 'term/1',
+            'start_date': '1999-01-01',
+            'end_date': '1999-12-31',
+        },
+        {
+            'person_id': 'riker',
+            'organization_id': 'council',
+            'on_behalf_of_id': 'starfleet',
+            'legislative_period_id': 'term/2',
+            'start_date': '2000-06-01',
+            'end_date': '2001-01-31',
+        },
+        {
+            'person_id': 'riker',
+            'organization_id': 'council',
+            'on_behalf_of_id': 'maquis',
+            'legislative_period_id': 'term/3',
+            'start_date': '2003',
+        },
+        {
+            'person_id': 'troi',
+            'organization_id': 'council',
+            'legislative_period_id': 'term/1',
+        },
+        {
+            'person_id': 'troi',
+            'organization_id': 'committee',
+            'start_date': '2003-01-01',
+        },
+    ],
+}
+
+AS_OF = date(2003, 12, 31)
+
+
+class TestCareers(TestCase):
+
+    def setUp(self):
+        self.careers = compute_careers(Popolo(EXAMPLE_DATA), as_of=AS_OF)
+
+    def test_intervals_merged(self):
+        riker = self.careers['riker']
+        assert riker.intervals == [
+            (date(1999, 1, 1), date(2001, 1, 31)),
+            (date(2003, 1, 1), date(2003, 12, 31)),
+        ]
+        assert riker.days_served == 365 + 366 + 31 + 365
+        assert riker.first_start == date(1999, 1, 1)
+        assert riker.last_end == AS_OF
+
+    def test_terms_and_parties(self):
+        riker = self.careers['riker']
+        assert riker.terms == ['term/1', 'term/2', 'term/3']
+        assert riker.parties == ['maquis', 'starfleet', 'maquis']
+        assert riker.party_switches == 2
+        assert riker.memberships == 4
+
+    def test_missing_start_dates(self):
+        troi = self.careers['troi']
+        assert troi.intervals == [(date(2003, 1, 1), AS_OF)]
+        assert troi.terms == ['term/1']
+        assert troi.parties == []
+        assert troi.party_switches == 0
+
+    def test_organization_filter(self):
+        careers = compute_careers(
+            Popolo(EXAMPLE_DATA), organization_id='committee', as_of=AS_OF)
+        assert list(careers) == ['troi']
+        assert careers['troi'].memberships == 1
+
+    def test_cached_on_popolo(self):
+        popolo = Popolo(EXAMPLE_DATA)
+        careers = popolo.careers(as_of=AS_OF)
+        assert popolo.careers(as_of=AS_OF) is careers
+        assert careers['riker'] == self.careers['riker']
+
+    def test_only_latest_as_of_cached(self):
+        popolo = Popolo(EXAMPLE_DATA)
+        for day in range(1, 31):
+            popolo.careers(as_of=date(2004, 1, day))
+            popolo.careers('committee', as_of=date(2004, 1, day))
+        slots = dict(
+            (k, v[0]) for k, v in popolo._caches.items()
+            if isinstance(k, tuple) and k[0] == 'careers')
+        assert slots == {
+            ('careers', 'committee'): date(2004, 1, 30),
+            ('careers', None): date(2004, 1, 30),
+        }
+
+    def test_threads_with_different_dates(self):
+        popolo = Popolo(EXAMPLE_DATA)
+        start = threading.Event()
+        errors = []
+
+        def run(i):
+            start.wait()
+            try:
+                for j in range(50):
+                    as_of = date(2004, 1, 1 + (i + j) % 3)
+                    careers = popolo.careers(as_of=as_of)
+                    assert careers['riker'].last_end == as_of
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        start.set()
+        for t in threads:
+            t.join()
+        assert errors == []
+
+    def test_as_dict(self):
+        exported = json.loads(json.dumps(self.careers['troi'].as_dict()))
+        assert exported == {
+            'person_id': 'troi',
+            'intervals': [['2003-01-01', '2003-12-31']],
+            'days_served': 365,
+            'terms': ['term/1'],
+            'parties': [],
+            'party_switches': 0,
+            'memberships': 2,
+        }
+
+    def test_write_csv(self):
+        f = io.BytesIO() if six.PY2 else io.StringIO()
+        write_careers_csv(self.careers, f)
+        f.seek(0)
+        rows = list(csv.reader(f))
+        assert rows[0][:3] == ['person_id', 'first_start', 'last_end']
+        assert rows[1] == [
+            'riker', '1999-01-01', '2003-12-31', '1127',
+            'term/1;term/2;term/3', 'maquis;starfleet;maquis', '2', '4']
@@ -0,0 +1,112 @@
+from copy import deepcopy
+from datetime import date
+from unittest import TestCase
+
+from popolo_data.composition import CompositionTimeline
+from popolo_data.importer import Popolo
+
+
+EXAMPLE_DATA = {
+    'persons': [
+        {'id': 'picard', 'name': 'Jean-Luc Picard'},
+        {'id': 'riker', 'name': 'William Riker'},
+        {'id': 'troi', 'name': 'Deanna Troi'},
+    ],
+    'organizations': [
+        {'id': 'council', 'name': 'Council'},
+        {'id': 'starfleet', 'name': 'Starfleet'},
+        {'id': 'other', 'name': 'Another council'},
+    ],
+    'areas': [{'id': 'earth', 'name': 'Earth'}],
+    'posts': [{'id': 'seat-1', 'label': 'Seat 1'}],
+    'memberships': [
+        {
+            'person_id': 'picard',
+            'organization_id': 'council',
+            'on_behalf_of_id': 'starfleet',
+            'area_id': 'earth',
+            'post_id': 'seat-1',
+            'start_date': '2364-01-01',
+            'end_date': '2367-12-31',
+        },
+        {
+            'person_id': 'riker',
+            'organization_id': 'council',
+            'start_date': '2368-01-01',
+        },
+        {
+            'person_id': 'troi',
+            'organization_id': 'council',
+            'start_date': '2366',
+            'end_date': '2368-06',
+        },
+        {
+            'person_id': 'troi',
+            'organization_id': 'other',
+        },
+    ],
+}
+
+
+class TestComposition(TestCase):
+
+    def setUp(self):
+        self.popolo = Popolo(deepcopy(EXAMPLE_DATA))
+        self.timeline = self.popolo.composition('council')
+
+    def person_ids_at(self, when, timeline=None):
+        timeline = timeline or self.timeline
+        return [seat.person.id for seat in timeline.at(when)]
+
+    def test_composition_at(self):
+        assert self.person_ids_at(date(2363, 12, 31)) == []
+        assert self.person_ids_at(date(2364, 1, 1)) == ['picard']
+        assert self.person_ids_at(date(2366, 1, 1)) == ['picard', 'troi']
+        assert self.person_ids_at(date(2367, 12, 31)) == ['picard', 'troi']
+        assert self.person_ids_at(date(2368, 1, 1)) == ['riker', 'troi']
+        assert self.person_ids_at(date(2368, 6, 30)) == ['riker', 'troi']
+        assert self.person_ids_at(date(2368, 7, 1)) == ['riker']
+        assert self.person_ids_at(date(3000, 1, 1)) == ['riker']
+
+    def test_seats_are_resolved(self):
+        seat = self.timeline.at(date(2365, 1, 1))[0]
+        assert seat.membership.person_id == 'picard'
+        assert seat.person.name == 'Jean-Luc Picard'
+        assert seat.party.name == 'Starfleet'
+        assert seat.area.name == 'Earth'
+        assert seat.post.label == 'Seat 1'
+
+    def test_agrees_with_current_at_for_any_interval(self):
+        for interval in (1, 2, 3):
+            timeline = CompositionTimeline('council', self.popolo, interval)
+            for year in range(2363, 2370):
+                for month in (1, 6, 7, 12):
+                    when = date(year, month, 1)
+                    expected = [
+                        m.person_id for m in self.popolo.memberships
+                        if m.organization_id == 'council' and
+                        m.current_at(when)]
+                    assert self.person_ids_at(when, timeline) == expected
+
+    def test_changes_between(self):
+        changes = self.timeline.changes_between(
+            date(2367, 6, 1), date(2368, 12, 31))
+        assert [(c.date, c.action, c.seat.person.id) for c in changes] == [
+            (date(2368, 1, 1), 'end', 'picard'),
+            (date(2368, 1, 1), 'start', 'riker'),
+            (date(2368, 7, 1), 'end', 'troi'),
+        ]
+
+    def test_organization_composition_is_cached(self):
+        council = self.popolo.organizations.get(id='council')
+        assert council.composition is self.timeline
+        self.popolo.add('memberships', {
+            'person_id': 'troi', 'organization_id': 'council',
+            'start_date': '2370'})
+        assert council.composition is not self.timeline
+        assert self.person_ids_at(
+            date(2371, 1, 1), council.composition) == ['riker', 'troi']
+
+    def test_other_organization(self):
+        timeline = self.popolo.composition('other')
+        assert self.person_ids_at(date(2000, 1, 1), timeline) == ['troi']
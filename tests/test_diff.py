@@ -0,0 +1,108 @@
+from unittest import TestCase
+
+from popolo_data.changes import Change
+from popolo_data.importer import Popolo
+
+
+OLD_DATA = {
+    'persons': [
+        {'id': 'picard', 'name': 'Jean-Luc Picard'},
+        {'id': 'riker', 'name': 'William Riker'},
+        {'id': 'yar', 'name': 'Tasha Yar'},
+    ],
+    'organizations': [
+        {'id': 'starfleet', 'name': 'Starfleet'},
+    ],
+    'memberships': [
+        {
+            'person_id': 'picard',
+            'organization_id': 'starfleet',
+            'start_date': '2323-12-01',
+        },
+        {
+            'person_id': 'riker',
+            'organization_id': 'starfleet',
+            'start_date': '2353',
+        },
+        {
+            'person_id': 'riker',
+            'organization_id': 'starfleet',
+            'start_date': '2353',
+        },
+    ],
+}
+
+NEW_DATA = {
+    'persons': [
+        {'id': 'picard', 'name': 'Jean-Luc Picard'},
+        {'id': 'riker', 'name': 'Will Riker', 'gender': 'male'},
+        {'id': 'data', 'name': 'Data'},
+    ],
+    'organizations': [
+        {'id': 'starfleet', 'name': 'Starfleet'},
+    ],
+    'memberships': [
+        {
+            'person_id': 'riker',
+            'organization_id': 'starfleet',
+            'start_date': '2353',
+        },
+        {
+            'person_id': 'picard',
+            'organization_id': 'starfleet',
+            'start_date': '2323-12-01',
+            'end_date': '2379',
+        },
+    ],
+}
+
+
+def copy_data(data):
+    return dict((k, [dict(r) for r in v]) for k, v in data.items())
+
+
+class TestDiff(TestCase):
+
+    def test_no_differences(self):
+        popolo_a = Popolo(copy_data(OLD_DATA))
+        popolo_b = Popolo(copy_data(OLD_DATA))
+        assert list(popolo_a.diff(popolo_b)) == []
+
+    def test_diff_is_a_generator(self):
+        popolo_a = Popolo(copy_data(OLD_DATA))
+        popolo_b = Popolo(copy_data(NEW_DATA))
+        changes = popolo_a.diff(popolo_b)
+        assert next(changes).array == 'persons'
+
+    def test_person_changes(self):
+        popolo_a = Popolo(copy_data(OLD_DATA))
+        popolo_b = Popolo(copy_data(NEW_DATA))
+        changes = [c for c in popolo_a.diff(popolo_b) if c.array == 'persons']
+        assert [(c.action, c.key) for c in changes] == [
+            ('update', 'riker'), ('add', 'data'), ('remove', 'yar')]
+        assert changes[0].fields == {
+            'name': ('William Riker', 'Will Riker'),
+            'gender': (None, 'male'),
+        }
+
+    def test_membership_changes(self):
+        popolo_a = Popolo(copy_data(OLD_DATA))
+        popolo_b = Popolo(copy_data(NEW_DATA))
+        changes = [
+            c for c in popolo_a.diff(popolo_b) if c.array == 'memberships']
+        assert [(c.action, c.old['person_id']) for c in changes] == [
+            ('update', 'picard'), ('remove', 'riker')]
+        assert changes[0].key == popolo_a.memberships[0].fingerprint
+        assert changes[0].fields == {'end_date': (None, '2379')}
+
+    def test_change_fields_for_add_and_remove(self):
+        change = Change('add', 'persons', 'data', None, {'id': 'data'})
+        assert change.fields == {'id': (None, 'data')}
+        change = Change('remove', 'persons', 'data', {'id': 'data'}, None)
+        assert change.fields == {'id': ('data', None)}
+
+    def test_applying_diff(self):
+        popolo_a = Popolo(copy_data(OLD_DATA))
+        popolo_b = Popolo(copy_data(NEW_DATA))
+        popolo_a.apply_changes(list(popolo_a.diff(popolo_b)))
+        assert list(popolo_a.diff(popolo_b)) == []
@@ -280,3 +280,15 @@ class TestEvents(TestCase):
             term = popolo.latest_term
             memberships = term.memberships
             assert len(memberships) == 2
+
+    def test_filtered_events_are_the_same_objects(self):
+        with example_file(EXAMPLE_MULTIPLE_EVENTS) as fname:
+            popolo = Popolo.from_filename(fname)
+            events = popolo.events
+            election = events.elections.first
+            assert election is events.get(id='Q16412592')
+            assert election is events.lookup_from_key['Q16412592']
+            lps = events.legislative_periods
+            assert all(any(lp is e for e in events) for lp in lps)
+            assert lps.filter(id='term/13').first is \
+                lps.lookup_from_key['term/13']
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import io
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import pytest
+import six
+
+from popolo_data.export import iter_chunks, iter_rows, to_arrow, write_csv, \
+    write_parquet
+from popolo_data.importer import Popolo
+
+
+EXAMPLE_DATA = {
+    'persons': [
+        {
+            'id': 'blackadder',
+            'name': u'Edmund Blackadder',
+            'identifiers': [{'scheme': 'wikidata', 'identifier': 'Q1'}],
+            'contact_details': [{'type': 'twitter', 'value': '@blackadder'}],
+        },
+        {'id': 'baldrick', 'name': u'Baldrick'},
+    ],
+    'organizations': [
+        {'id': 'commons', 'name': u'House of Commons', 'seats': 558},
+        {'id': 'adder', 'name': u'Adder Party', 'classification': 'party'},
+    ],
+    'areas': [
+        {'id': 'dunny', 'name': u'Dunny-on-the-Wold'},
+    ],
+    'memberships': [
+        {
+            'person_id': 'blackadder',
+            'organization_id': 'commons',
+            'on_behalf_of_id': 'adder',
+            'area_id': 'dunny',
+            'start_date': '1784-03-01',
+        },
+        {
+            'person_id': 'baldrick',
+            'organization_id': 'commons',
+            'area_id': u'löndon',
+        },
+    ],
+}
+
+
+class TestExport(TestCase):
+
+    def test_person_rows(self):
+        rows = list(iter_rows(Popolo(EXAMPLE_DATA), 'persons'))
+        assert rows[0] == (
+            'blackadder', u'Edmund Blackadder', None, None, None, None,
+            None, None, None, None, None, 'Q1', 'blackadder')
+
+    def test_membership_rows_resolve_foreign_keys(self):
+        rows = list(iter_rows(Popolo(EXAMPLE_DATA), 'memberships'))
+        assert rows[0][-6:] == (
+            u'Edmund Blackadder', u'House of Commons', u'Adder Party',
+            u'Dunny-on-the-Wold', None, None)
+        assert rows[1][-6:] == (
+            u'Baldrick', u'House of Commons', None, None, None, None)
+
+    def test_unknown_array(self):
+        with pytest.raises(ValueError):
+            list(iter_rows(Popolo(EXAMPLE_DATA), 'starships'))
+
+    def test_iter_chunks(self):
+        assert list(iter_chunks(range(5), 2)) == [[0, 1], [2, 3], [4]]
+
+    def test_write_csv(self):
+        f = io.BytesIO() if six.PY2 else io.StringIO()
+        write_csv(Popolo(EXAMPLE_DATA), 'memberships', f)
+        f.seek(0)
+        rows = list(csv.reader(f))
+        assert rows[0][:2] == ['person_id', 'organization_id']
+        assert rows[0][-1] == 'legislative_period_name'
+        assert len(rows) == 3
+        expected = u'löndon' if six.PY3 else 'l\xc3\xb6ndon'
+        assert rows[2][3] == expected
+
+
+class TestArrowExport(TestCase):
+
+    def setUp(self):
+        pytest.importorskip('pyarrow')
+
+    def test_to_arrow(self):
+        table = to_arrow(Popolo(EXAMPLE_DATA), 'organizations', chunk_size=1)
+        assert table.num_rows == 2
+        assert table.column('seats').to_pylist() == [558, None]
+
+    def test_to_arrow_empty(self):
+        table = to_arrow(Popolo({}), 'posts')
+        assert table.num_rows == 0
+        assert table.column_names == ['id', 'label', 'organization_id']
+
+    def test_write_parquet(self):
+        import pyarrow.parquet
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'memberships.parquet')
+            write_parquet(
+                Popolo(EXAMPLE_DATA), 'memberships', path, chunk_size=1)
+            parquet_file = pyarrow.parquet.ParquetFile(path)
+            assert parquet_file.num_row_groups == 2
+            table = parquet_file.read()
+            assert table.column('person_name').to_pylist() == \
+                [u'Edmund Blackadder', u'Baldrick']
+        finally:
+            shutil.rmtree(directory)
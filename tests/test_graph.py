@@ -0,0 +1,153 @@
+from unittest import TestCase
+
+import pytest
+
+from .helpers import example_file
+
+from popolo_data.importer import Popolo
+
+
+EXAMPLE_GRAPH_JSON = b'''
+{
+    "persons": [
+        {"id": "picard", "name": "Jean-Luc Picard"},
+        {"id": "riker", "name": "William Riker"},
+        {"id": "crusher", "name": "Wesley Crusher"},
+        {"id": "boothby", "name": "Boothby"},
+        {"id": "q", "name": "Q"}
+    ],
+    "organizations": [
+        {"id": "starfleet", "name": "Starfleet"},
+        {"id": "enterprise", "name": "USS Enterprise"},
+        {"id": "gardening-club", "name": "Boothby's Gardening Club"},
+        {"id": "federation", "name": "Federation", "classification": "party"},
+        {"id": "continuum", "name": "Q Continuum", "classification": "party"}
+    ],
+    "posts": [
+        {"id": "captain", "label": "Captain of the Enterprise"}
+    ],
+    "memberships": [
+        {
+            "person_id": "picard",
+            "organization_id": "enterprise",
+            "on_behalf_of_id": "federation",
+            "post_id": "captain",
+            "start_date": "2364"
+        },
+        {
+            "person_id": "riker",
+            "organization_id": "enterprise",
+            "on_behalf_of_id": "federation",
+            "post_id": "captain",
+            "start_date": "2379"
+        },
+        {
+            "person_id": "riker",
+            "organization_id": "starfleet",
+            "on_behalf_of_id": "continuum"
+        },
+        {
+            "person_id": "crusher",
+            "organization_id": "starfleet"
+        },
+        {
+            "person_id": "crusher",
+            "organization_id": "gardening-club"
+        },
+        {
+            "person_id": "boothby",
+            "organization_id": "gardening-club"
+        },
+        {
+            "person_id": "nobody",
+            "organization_id": "gardening-club"
+        }
+    ]
+}
+'''
+
+
+class TestGraph(TestCase):
+
+    def test_graph_is_built_once(self):
+        with example_file(EXAMPLE_GRAPH_JSON) as fname:
+            popolo = Popolo.from_filename(fname)
+            assert popolo.graph is popolo.graph
+
+    def test_person_neighbours(self):
+        with example_file(EXAMPLE_GRAPH_JSON) as fname:
+            graph = Popolo.from_filename(fname).graph
+            riker = graph.persons.get(id='riker')
+            neighbours = graph.neighbours(riker)
+            assert [o.id for o in neighbours] == [
+                'starfleet', 'enterprise', 'federation', 'continuum',
+                'captain']
+
+    def test_person_neighbours_for_one_relation(self):
+        with example_file(EXAMPLE_GRAPH_JSON) as fname:
+            graph = Popolo.from_filename(fname).graph
+            riker = graph.persons.get(id='riker')
+            parties = graph.neighbours(riker, 'on_behalf_of_id')
+            assert [o.name for o in parties] == ['Federation', 'Q Continuum']
+
+    def test_organization_neighbours(self):
+        with example_file(EXAMPLE_GRAPH_JSON) as fname:
+            graph = Popolo.from_filename(fname).graph
+            club = graph.collections['organizations'].get(
+                id='gardening-club')
+            # The membership for an unknown person is skipped:
+            assert [p.id for p in graph.neighbours(club)] == \
+                ['crusher', 'boothby']
+
+    def test_memberships_of_post(self):
+        with example_file(EXAMPLE_GRAPH_JSON) as fname:
+            graph = Popolo.from_filename(fname).graph
+            captain = graph.collections['posts'][0]
+            holders = [m.person_id for m in graph.memberships_of(captain)]
+            assert holders == ['picard', 'riker']
+
+    def test_co_members(self):
+        with example_file(EXAMPLE_GRAPH_JSON) as fname:
+            graph = Popolo.from_filename(fname).graph
+            riker = graph.persons.get(id='riker')
+            assert [p.id for p in graph.co_members(riker)] == \
+                ['picard', 'crusher']
+
+    def test_k_hop(self):
+        with example_file(EXAMPLE_GRAPH_JSON) as fname:
+            graph = Popolo.from_filename(fname).graph
+            picard = graph.persons.get(id='picard')
+            assert [p.id for p in graph.k_hop(picard, 2)] == \
+                ['riker', 'crusher']
+            assert [p.id for p in graph.k_hop(picard, 3)] == \
+                ['riker', 'crusher', 'boothby']
+
+    def test_shortest_path(self):
+        with example_file(EXAMPLE_GRAPH_JSON) as fname:
+            graph = Popolo.from_filename(fname).graph
+            picard = graph.persons.get(id='picard')
+            boothby = graph.persons.get(id='boothby')
+            path = graph.shortest_path(picard, boothby)
+            assert [o.id for o in path] == [
+                'picard', 'enterprise', 'riker', 'starfleet', 'crusher',
+                'gardening-club', 'boothby']
+
+    def test_shortest_path_to_self(self):
+        with example_file(EXAMPLE_GRAPH_JSON) as fname:
+            graph = Popolo.from_filename(fname).graph
+            picard = graph.persons.get(id='picard')
+            assert graph.shortest_path(picard, picard) == [picard]
+
+    def test_shortest_path_not_connected(self):
+        with example_file(EXAMPLE_GRAPH_JSON) as fname:
+            graph = Popolo.from_filename(fname).graph
+            picard = graph.persons.get(id='picard')
+            q = graph.persons.get(id='q')
+            assert graph.shortest_path(picard, q) is None
+
+    def test_unknown_relation(self):
+        with example_file(EXAMPLE_GRAPH_JSON) as fname:
+            graph = Popolo.from_filename(fname).graph
+            picard = graph.persons.get(id='picard')
+            with pytest.raises(ValueError):
+                graph.co_members(picard, 'spouse_id')
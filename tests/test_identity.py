@@ -0,0 +1,64 @@
+from copy import deepcopy
+import gc
+from unittest import TestCase
+
+import pytest
+
+from popolo_data.base import IdentityMap
+from popolo_data.importer import Popolo
+
+
+EXAMPLE_DATA = {
+    'persons': [
+        {'id': 'picard', 'name': 'Jean-Luc Picard'},
+        {'id': 'riker', 'name': 'William Riker'},
+    ],
+    'organizations': [{'id': 'starfleet', 'name': 'Starfleet'}],
+    'memberships': [
+        {'person_id': 'picard', 'organization_id': 'starfleet'},
+        {'person_id': 'riker', 'organization_id': 'starfleet'},
+    ],
+}
+
+
+class TestIdentityMap(TestCase):
+
+    def test_same_object_for_each_record(self):
+        popolo = Popolo(deepcopy(EXAMPLE_DATA))
+        assert popolo.persons[0] is popolo.persons[0]
+        membership = popolo.memberships[0]
+        assert membership.person is membership.person
+        assert membership.person is popolo.persons.get(id='picard')
+        assert popolo.memberships is popolo.memberships
+
+    def test_unchanged_records_keep_their_objects(self):
+        popolo = Popolo(deepcopy(EXAMPLE_DATA))
+        picard = popolo.persons[0]
+        riker = popolo.persons[1]
+        persons = popolo.persons
+        popolo.update('persons', 'riker', {'name': 'Thomas Riker'})
+        # The collection is updated in place:
+        assert popolo.persons is persons
+        assert popolo.persons[0] is picard
+        assert popolo.persons[1] is not riker
+        assert popolo.persons[1].name == 'Thomas Riker'
+        assert riker.name == 'William Riker'
+
+    def test_weak_policy(self):
+        popolo = Popolo(deepcopy(EXAMPLE_DATA), identity_policy='weak')
+        picard = popolo.persons[0]
+        assert popolo.persons is not popolo.persons
+        assert popolo.persons[0] is picard
+        assert popolo.memberships[0].person is picard
+        del picard
+        gc.collect()
+        assert len(popolo.identity_map) == 0
+
+    def test_no_identity_map(self):
+        popolo = Popolo(deepcopy(EXAMPLE_DATA), identity_policy=None)
+        assert popolo.persons[0] is not popolo.persons[0]
+        assert popolo.persons[0] == popolo.persons[0]
+
+    def test_unknown_policy(self):
+        with pytest.raises(ValueError):
+            IdentityMap('sometimes')
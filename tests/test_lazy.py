@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+from unittest import TestCase
+
+import pytest
+
+from popolo_data.lazy import LazyJSONData, find_top_level_value
+
+
+EXAMPLE_JSON = u'''
+{
+    "persons": [
+        {
+            "id": "picard",
+            "name": "Jean-Luc \\"Captain\\" Picard [Enterprise]",
+            "memberships": [{"organization_id": "starfleet"}]
+        }
+    ],
+    "events" : [{"id": "term/1", "name": "First Term — \\"events\\":"}],
+    "memberships": [{"person_id": "picard", "organization_id": "starfleet"}]
+}
+'''
+
+
+class TestLazyJSONData(TestCase):
+
+    def test_find_top_level_value(self):
+        start = find_top_level_value(EXAMPLE_JSON, 'events')
+        assert EXAMPLE_JSON[start:].startswith('[{"id": "term/1"')
+
+    def test_find_missing_key(self):
+        assert find_top_level_value(EXAMPLE_JSON, 'areas') is None
+
+    def test_find_ambiguous_key(self):
+        with pytest.raises(ValueError):
+            find_top_level_value(EXAMPLE_JSON, 'memberships')
+
+    def test_brackets_in_strings(self):
+        text = u'''{
+            "persons": [
+                {"name": "Bob ]]", "events": [{"id": "nested"}]}
+            ],
+            "memberships": [{"role": "[{ \\" ]"}]
+        }'''
+        with pytest.raises(ValueError):
+            find_top_level_value(text, 'events')
+        data = LazyJSONData(text)
+        assert 'events' not in data
+        assert data['memberships'][0]['role'] == u'[{ " ]'
+        assert data['persons'][0]['name'] == u'Bob ]]'
+
+    def test_only_requested_values_are_decoded(self):
+        data = LazyJSONData(EXAMPLE_JSON.encode('utf-8'))
+        assert data['events'][0]['name'] == u'First Term — "events":'
+        assert list(data.decoded) == ['events']
+        assert data.get('areas', []) == []
+        assert not data.is_decoded
+
+    def test_ambiguous_key_decodes_everything(self):
+        data = LazyJSONData(EXAMPLE_JSON)
+        assert data['memberships'][0]['person_id'] == 'picard'
+        assert data.is_decoded
+        assert data['persons'][0]['id'] == 'picard'
+
+    def test_keys_decode_everything(self):
+        data = LazyJSONData(EXAMPLE_JSON)
+        assert sorted(data) == ['events', 'memberships', 'persons']
+        assert data.is_decoded
+
+    def test_modification(self):
+        data = LazyJSONData(EXAMPLE_JSON)
+        data['areas'] = []
+        data.setdefault('events', []).append({'id': 'term/2'})
+        del data['persons']
+        assert 'persons' not in data
+        assert [e['id'] for e in data['events']] == ['term/1', 'term/2']
+        assert sorted(data) == ['areas', 'events', 'memberships']
@@ -1,3 +1,8 @@
+import bz2
+import gzip
+import io
+import json
+
 from mock import patch, Mock
 from unittest import TestCase
 
@@ -6,7 +11,9 @@ from six import text_type
 
 from .helpers import example_file
 
-from popolo_data.importer import Popolo
+from popolo_data.base import FieldNotLoaded
+from popolo_data.compression import detect_compression, iter_decompressed
+from popolo_data.importer import Popolo, StringInterner
 
 
 class TestLoading(TestCase):
@@ -29,3 +36,286 @@ class TestLoading(TestCase):
         faked_get.side_effect = lambda url: mock_response
         popolo = Popolo.from_url('http://example.org/popolo.json')
         assert popolo.persons.first.name == 'Joe Bloggs'
+
+    def test_can_create_lazily_from_a_filename(self):
+        with example_file(b'{"persons": [{"name": "Joe Bloggs"}]}') as fname:
+            popolo = Popolo.from_filename(fname, lazy=True)
+        assert len(popolo.organizations) == 0
+        assert popolo.persons.first.name == 'Joe Bloggs'
+
+    @patch('popolo_data.importer.requests.get')
+    def test_create_lazily_from_url(self, faked_get):
+        mock_response = Mock()
+        mock_response.content = b'{"persons": [{"name": "Joe Bloggs"}]}'
+        faked_get.side_effect = lambda url: mock_response
+        popolo = Popolo.from_url('http://example.org/popolo.json', lazy=True)
+        assert popolo.persons.first.name == 'Joe Bloggs'
+        assert not mock_response.json.called
+
+
+EXAMPLE_REPEATED_IDS = b'''
+{
+    "persons": [
+        {"id": "joe", "name": "Joe Bloggs"},
+        {"id": "jane", "name": "Jane Bloggs"}
+    ],
+    "organizations": [{"id": "house", "classification": "legislature"}],
+    "memberships": [
+        {"person_id": "joe", "organization_id": "house", "role": "member"},
+        {"person_id": "jane", "organization_id": "house", "role": "member"}
+    ]
+}
+'''
+
+
+class TestStringInterning(TestCase):
+
+    def check_interned(self, popolo):
+        m1, m2 = popolo.json_data['memberships']
+        assert m1['organization_id'] is m2['organization_id']
+        assert m1['role'] is m2['role']
+        house = popolo.json_data['organizations'][0]
+        assert m1['organization_id'] is house['id']
+        joe = popolo.json_data['persons'][0]
+        assert m1['person_id'] is joe['id']
+        assert popolo.memberships.first.person.name == 'Joe Bloggs'
+
+    def test_intern_strings_from_filename(self):
+        with example_file(EXAMPLE_REPEATED_IDS) as fname:
+            popolo = Popolo.from_filename(fname, intern_strings=True)
+        self.check_interned(popolo)
+        # Two person_ids, two organization_ids and a role are duplicates:
+        assert popolo.interner.duplicates == 5
+        assert popolo.interner.saved_bytes > 0
+
+    def test_intern_strings_lazily(self):
+        with example_file(EXAMPLE_REPEATED_IDS) as fname:
+            popolo = Popolo.from_filename(
+                fname, lazy=True, intern_strings=True)
+        self.check_interned(popolo)
+
+    def test_names_not_interned(self):
+        with example_file(EXAMPLE_REPEATED_IDS) as fname:
+            popolo = Popolo.from_filename(fname, intern_strings=True)
+        assert 'Joe Bloggs' not in popolo.interner.strings
+
+    def test_not_interned_by_default(self):
+        with example_file(EXAMPLE_REPEATED_IDS) as fname:
+            popolo = Popolo.from_filename(fname)
+        assert popolo.interner is None
+
+    def test_intern_decoded_data(self):
+        json_data = json.loads(EXAMPLE_REPEATED_IDS.decode('utf-8'))
+        interner = StringInterner()
+        self.check_interned(Popolo(interner.intern_data(json_data)))
+        assert interner.duplicates == 5
+
+
+EXAMPLE_LONG_FIELDS = b'''
+{
+    "persons": [
+        {
+            "id": "joe",
+            "name": "Joe Bloggs",
+            "gender": "male",
+            "biography": "A very long biography",
+            "images": [{"url": "http://example.org/joe.jpg"}]
+        }
+    ],
+    "memberships": [
+        {"person_id": "joe", "organization_id": "house", "role": "member"}
+    ]
+}
+'''
+
+
+class TestFieldProjection(TestCase):
+
+    def check_projected(self, popolo):
+        person = popolo.persons.first
+        assert person.id == 'joe'
+        assert person.name == 'Joe Bloggs'
+        assert 'biography' not in person.data
+        with pytest.raises(FieldNotLoaded) as excinfo:
+            person.gender
+        assert "'gender'" in text_type(excinfo.value)
+        with pytest.raises(FieldNotLoaded):
+            person.images
+        membership = popolo.memberships.first
+        assert membership.role == 'member'
+        assert membership.person is person
+
+    def test_fields_from_filename(self):
+        with example_file(EXAMPLE_LONG_FIELDS) as fname:
+            popolo = Popolo.from_filename(fname, fields={'persons': ['name']})
+        self.check_projected(popolo)
+
+    def test_fields_lazily(self):
+        with example_file(EXAMPLE_LONG_FIELDS) as fname:
+            popolo = Popolo.from_filename(
+                fname, lazy=True, fields={'persons': ['name']})
+        self.check_projected(popolo)
+
+    def test_unknown_array(self):
+        with example_file(EXAMPLE_LONG_FIELDS) as fname:
+            with pytest.raises(ValueError):
+                Popolo.from_filename(fname, fields={'starships': ['name']})
+
+    def load_projected(self):
+        with example_file(EXAMPLE_LONG_FIELDS) as fname:
+            return Popolo.from_filename(fname, fields={
+                'persons': ['name'],
+                'memberships': ['person_id', 'organization_id']})
+
+    def test_data_is_a_normal_dict(self):
+        data = self.load_projected().persons.first.data
+        assert data.get('gender') is None
+        assert data.get('gender', 'unknown') == 'unknown'
+        assert data['name'] == 'Joe Bloggs'
+        with pytest.raises(KeyError):
+            data['gender']
+
+    def test_validate_and_diff(self):
+        popolo = self.load_projected()
+        problems = [str(p) for p in popolo.validate()]
+        assert problems == [
+            "memberships[0].organization_id: no organizations record "
+            "with id 'house'"]
+        assert list(popolo.diff(popolo)) == []
+
+    def test_add_membership(self):
+        popolo = self.load_projected()
+        popolo.add('memberships', {
+            'person_id': 'joe', 'organization_id': 'senate'})
+        assert len(popolo.memberships) == 2
+
+    def test_graph_and_name_filter(self):
+        popolo = self.load_projected()
+        person = popolo.persons.first
+        assert popolo.graph.memberships_of(person) == \
+            [popolo.memberships.first]
+        with pytest.raises(FieldNotLoaded):
+            popolo.persons.filter(names__normalized='joe bloggs')
+        with pytest.raises(FieldNotLoaded):
+            popolo.memberships.first.end_date
+
+    def test_name_filter_with_other_names(self):
+        with example_file(EXAMPLE_LONG_FIELDS) as fname:
+            popolo = Popolo.from_filename(
+                fname, fields={'persons': ['name', 'other_names']})
+        found = popolo.persons.filter(names__normalized='joe bloggs')
+        assert found.first is popolo.persons.first
+
+    def test_membership_fingerprints_match_full_records(self):
+        with example_file(EXAMPLE_LONG_FIELDS) as fname:
+            full = Popolo.from_filename(fname)
+        popolo = self.load_projected()
+        fingerprint = full.memberships.first.fingerprint
+        assert popolo.memberships.first.fingerprint == fingerprint
+        assert popolo.memberships.in_bulk([fingerprint])[fingerprint] is \
+            popolo.memberships.first
+        assert [c.array for c in full.diff(popolo)] == ['persons']
+
+
+def compress(data, compression):
+    if compression == 'gzip':
+        f = io.BytesIO()
+        with gzip.GzipFile(fileobj=f, mode='wb') as gz:
+            gz.write(data)
+        return f.getvalue()
+    elif compression == 'bz2':
+        return bz2.compress(data)
+    elif compression == 'xz':
+        lzma = pytest.importorskip('lzma')
+        return lzma.compress(data)
+    zstandard = pytest.importorskip('zstandard')
+    return zstandard.ZstdCompressor().compress(data)
+
+
+EXAMPLE_SMALL_JSON = b'{"persons": [{"name": "Joe Bloggs"}]}'
+
+
+class TestCompressedInput(TestCase):
+
+    def check_from_filename(self, compression, **kwargs):
+        compressed = compress(EXAMPLE_SMALL_JSON, compression)
+        assert compressed != EXAMPLE_SMALL_JSON
+        with example_file(compressed) as fname:
+            popolo = Popolo.from_filename(fname, **kwargs)
+        assert popolo.persons.first.name == 'Joe Bloggs'
+
+    def test_gzip(self):
+        self.check_from_filename('gzip')
+
+    def test_gzip_lazily(self):
+        self.check_from_filename('gzip', lazy=True)
+
+    def test_bz2(self):
+        self.check_from_filename('bz2')
+
+    def test_xz(self):
+        self.check_from_filename('xz')
+
+    def test_zstd(self):
+        self.check_from_filename('zstd')
+
+    def test_detect_compression(self):
+        assert detect_compression(EXAMPLE_SMALL_JSON) is None
+        assert detect_compression(b'') is None
+        assert detect_compression(compress(b'{}', 'bz2')) == 'bz2'
+
+    def test_decompress_in_chunks(self):
+        data = EXAMPLE_SMALL_JSON * 1000
+        compressed = compress(data, 'gzip')
+        chunks = [compressed[i:i + 7] for i in range(0, len(compressed), 7)]
+        assert b''.join(iter_decompressed(chunks, 'gzip')) == data
+
+    def check_concatenated(self, compression):
+        # pigz and pbzip2 write several compressed streams one after
+        # another, as does joining compressed files with cat:
+        halves = [EXAMPLE_SMALL_JSON[:20], EXAMPLE_SMALL_JSON[20:]]
+        compressed = b''.join(compress(h, compression) for h in halves)
+        with example_file(compressed) as fname:
+            popolo = Popolo.from_filename(fname)
+        assert popolo.persons.first.name == 'Joe Bloggs'
+        for size in (1, 5, len(compressed)):
+            chunks = [
+                compressed[i:i + size]
+                for i in range(0, len(compressed), size)]
+            assert b''.join(iter_decompressed(chunks, compression)) == \
+                EXAMPLE_SMALL_JSON
+
+    def test_concatenated_gzip(self):
+        self.check_concatenated('gzip')
+
+    def test_multistream_bz2(self):
+        self.check_concatenated('bz2')
+
+    def test_concatenated_xz(self):
+        self.check_concatenated('xz')
+
+    def test_gzip_with_zero_padding(self):
+        compressed = compress(EXAMPLE_SMALL_JSON, 'gzip') + b'\x00' * 10
+        assert b''.join(iter_decompressed([compressed], 'gzip')) == \
+            EXAMPLE_SMALL_JSON
+
+    @patch('popolo_data.importer.requests.get')
+    def test_compressed_url(self, faked_get):
+        mock_response = Mock()
+        mock_response.content = compress(EXAMPLE_SMALL_JSON, 'gzip')
+        mock_response.json.side_effect = ValueError('Not JSON')
+        faked_get.side_effect = lambda url: mock_response
+        popolo = Popolo.from_url('http://example.org/popolo.json.gz')
+        assert popolo.persons.first.name == 'Joe Bloggs'
+        popolo = Popolo.from_url(
+            'http://example.org/popolo.json.gz', lazy=True)
+        assert popolo.persons.first.name == 'Joe Bloggs'
+
+    @patch('popolo_data.importer.requests.get')
+    def test_invalid_json_from_url(self, faked_get):
+        mock_response = Mock()
+        mock_response.content = b'Not JSON'
+        mock_response.json.side_effect = ValueError('Not JSON')
+        faked_get.side_effect = lambda url: mock_response
+        with pytest.raises(ValueError):
+            Popolo.from_url('http://example.org/popolo.json')
@@ -334,3 +334,72 @@ class TestPersonMemberships(TestCase):
             latest_starfleet_membership = \
                 starfleet_memberships.filter(start_date=date(2323, 12, 1))
             assert len(latest_starfleet_membership) == 1
+
+
+class TestBulkLookups(TestCase):
+
+    def test_in_bulk(self):
+        with example_file(EXAMPLE_MULTIPLE_MEMBERSHIPS) as fname:
+            popolo = Popolo.from_filename(fname)
+            found = popolo.persons.in_bulk(
+                ['SC-231-427', 'SP-937-215', 'no-such-person'])
+            assert set(found) == {'SC-231-427', 'SP-937-215'}
+            assert found['SC-231-427'].name == 'William Riker'
+            assert found['SP-937-215'] is popolo.persons.first
+
+    def test_in_bulk_missing_none(self):
+        with example_file(EXAMPLE_MULTIPLE_MEMBERSHIPS) as fname:
+            popolo = Popolo.from_filename(fname)
+            found = popolo.persons.in_bulk(
+                ['SC-231-427', 'no-such-person'], missing='none')
+            assert found['no-such-person'] is None
+            assert found['SC-231-427'].name == 'William Riker'
+
+    def test_in_bulk_missing_raise(self):
+        with example_file(EXAMPLE_MULTIPLE_MEMBERSHIPS) as fname:
+            popolo = Popolo.from_filename(fname)
+            with pytest.raises(popolo.persons.object_class.DoesNotExist):
+                popolo.persons.in_bulk(
+                    ['SC-231-427', 'no-such-person'], missing='raise')
+
+    def test_in_bulk_unknown_missing_option(self):
+        with example_file(EXAMPLE_MULTIPLE_MEMBERSHIPS) as fname:
+            popolo = Popolo.from_filename(fname)
+            with pytest.raises(ValueError):
+                popolo.persons.in_bulk(['SC-231-427'], missing='ignore')
+
+    def test_get_many_preserves_order(self):
+        with example_file(EXAMPLE_MULTIPLE_MEMBERSHIPS) as fname:
+            popolo = Popolo.from_filename(fname)
+            people = popolo.persons.get_many(
+                ['SC-231-427', 'no-such-person', 'SP-937-215'])
+            assert [p.name for p in people] == \
+                ['William Riker', 'Jean-Luc Picard']
+
+    def test_memberships_persons(self):
+        with example_file(EXAMPLE_MULTIPLE_MEMBERSHIPS) as fname:
+            popolo = Popolo.from_filename(fname)
+            people = popolo.memberships.persons()
+            assert [p.id for p in people] == ['SP-937-215', 'SC-231-427']
+            assert people.first is popolo.persons.first
+
+    def test_filtered_memberships_organizations(self):
+        with example_file(EXAMPLE_MULTIPLE_MEMBERSHIPS) as fname:
+            popolo = Popolo.from_filename(fname)
+            memberships = popolo.memberships.filter(person_id='SP-937-215')
+            organizations = memberships.organizations()
+            assert [o.id for o in organizations] == \
+                ['starfleet', 'gardening-club']
+
+    def test_related_skips_missing_fields(self):
+        with example_file(EXAMPLE_MULTIPLE_MEMBERSHIPS) as fname:
+            popolo = Popolo.from_filename(fname)
+            assert len(popolo.memberships.parties()) == 0
+            assert len(popolo.memberships.areas()) == 0
+
+    def test_memberships_in_bulk_by_fingerprint(self):
+        with example_file(EXAMPLE_MULTIPLE_MEMBERSHIPS) as fname:
+            popolo = Popolo.from_filename(fname)
+            membership = popolo.memberships[2]
+            found = popolo.memberships.in_bulk([membership.fingerprint])
+            assert found == {membership.fingerprint: membership}
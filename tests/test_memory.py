@@ -0,0 +1,111 @@
+import gc
+from unittest import TestCase
+import weakref
+
+import pytest
+
+from popolo_data.importer import Popolo
+from popolo_data.search import NameSearchIndex
+from popolo_data.shared import PopoloHandle
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def example_data(version, n_persons=1000):
+    return {
+        'persons': [
+            {'id': 'person-{0}'.format(i),
+             'name': 'Person {0} v{1}'.format(i, version)}
+            for i in range(n_persons)],
+        'organizations': [{'id': 'house', 'name': 'House'}],
+        'memberships': [
+            {'person_id': 'person-{0}'.format(i), 'organization_id': 'house'}
+            for i in range(n_persons)],
+    }
+
+
+class TestWeakReferences(TestCase):
+
+    def test_objects_keep_dataset_by_default(self):
+        popolo = Popolo(example_data(0, 2))
+        released = weakref.ref(popolo)
+        membership = popolo.memberships.first
+        del popolo
+        gc.collect()
+        assert released() is not None
+        assert membership.person.id == 'person-0'
+
+    def test_weak_references_release_dataset(self):
+        popolo = Popolo(example_data(0, 2), weak_references=True)
+        released = weakref.ref(popolo)
+        membership = popolo.memberships.first
+        assert membership.person.id == 'person-0'
+        persons = popolo.persons
+        del popolo
+        gc.collect()
+        assert released() is None
+        assert membership.person_id == 'person-0'
+        with pytest.raises(ReferenceError):
+            membership.person
+        with pytest.raises(ReferenceError):
+            persons.filter(id='person-0')
+
+    def test_released_without_garbage_collection(self):
+        gc.disable()
+        try:
+            popolo = Popolo(example_data(0, 2), weak_references=True)
+            released = weakref.ref(popolo)
+            graph = popolo.graph
+            assert graph.all_popolo is popolo
+            index = NameSearchIndex.from_popolo(popolo)
+            del popolo
+            assert released() is None
+            with pytest.raises(ReferenceError):
+                graph.all_popolo
+            with pytest.raises(ReferenceError):
+                index.all_popolo
+        finally:
+            gc.enable()
+
+    def test_reloads_do_not_leak_old_versions(self):
+        if tracemalloc is None:
+            pytest.skip('tracemalloc is needed to measure memory')
+        versions = iter(range(1000))
+
+        def load():
+            return Popolo(example_data(next(versions)), weak_references=True)
+
+        # A long-lived cache that keeps one person from every version:
+        kept = []
+        released = []
+
+        def reload_and_use(handle):
+            handle.reload()
+            popolo = handle.current
+            kept.append(popolo.memberships.first.person)
+            released.append(weakref.ref(popolo))
+
+        handle = PopoloHandle(load)
+        reload_and_use(handle)
+        gc.collect()
+        tracemalloc.start()
+        try:
+            reload_and_use(handle)
+            gc.collect()
+            baseline = tracemalloc.get_traced_memory()[0]
+            for _ in range(5):
+                reload_and_use(handle)
+            gc.collect()
+            after = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        # Only the current version is alive; the others were released
+        # even though objects from them are still in use:
+        assert [r() is not None for r in released] == [False] * 6 + [True]
+        assert kept[0].name == 'Person 0 v1'
+        # Each version is over a megabyte, so if any had leaked, memory
+        # use would have grown by far more than this:
+        assert after - baseline < 200 * 1024
@@ -0,0 +1,144 @@
+from unittest import TestCase
+
+from popolo_data.base import membership_fingerprint
+from popolo_data.importer import Popolo
+from popolo_data.merge import merge_popolo, merge_records, merge_sorted
+
+
+LOWER_HOUSE = {
+    'persons': [
+        {
+            'id': 'lower/picard',
+            'name': 'Jean-Luc Picard',
+            'identifiers': [{'scheme': 'wikidata', 'identifier': 'Q16341'}],
+        },
+        {'id': 'riker', 'name': 'William Riker'},
+    ],
+    'organizations': [
+        {'id': 'federation', 'name': 'Federation'},
+        {'id': 'lower', 'name': 'Lower House'},
+    ],
+    'memberships': [
+        {
+            'person_id': 'lower/picard',
+            'organization_id': 'lower',
+            'on_behalf_of_id': 'federation',
+            'start_date': '2364',
+        },
+        {
+            'person_id': 'riker',
+            'organization_id': 'lower',
+            'on_behalf_of_id': 'federation',
+        },
+    ],
+}
+
+SUPPLEMENTARY = {
+    'persons': [
+        {
+            'id': 'supplementary/picard',
+            'name': 'Picard',
+            'gender': 'male',
+            'identifiers': [
+                {'scheme': 'wikidata', 'identifier': 'Q16341'},
+                {'scheme': 'starfleet', 'identifier': 'SP-937-215'},
+            ],
+        },
+        {'id': 'riker', 'name': 'Will Riker', 'gender': 'male'},
+    ],
+    'organizations': [
+        {'id': 'federation', 'name': 'Federation', 'seats': 100},
+    ],
+    'memberships': [
+        {
+            'person_id': 'supplementary/picard',
+            'organization_id': 'lower',
+            'on_behalf_of_id': 'federation',
+            'start_date': '2364',
+            'end_date': '2379',
+        },
+        {
+            'person_id': 'riker',
+            'organization_id': 'lower',
+            'on_behalf_of_id': 'federation',
+        },
+    ],
+}
+
+
+class TestMerge(TestCase):
+
+    def test_merge_records(self):
+        merged = merge_records(
+            {'id': 'a', 'name': 'A', 'links': [{'url': 'x'}]},
+            {'id': 'b', 'gender': 'female', 'links': [
+                {'url': 'x'}, {'url': 'y'}]})
+        assert merged == {
+            'id': 'a', 'name': 'A', 'gender': 'female',
+            'links': [{'url': 'x'}, {'url': 'y'}]}
+
+    def test_persons_unified_by_id_and_wikidata(self):
+        popolo = merge_popolo([Popolo(LOWER_HOUSE), Popolo(SUPPLEMENTARY)])
+        assert [(p.id, p.name, p.gender) for p in popolo.persons] == [
+            ('lower/picard', 'Jean-Luc Picard', 'male'),
+            ('riker', 'William Riker', 'male'),
+        ]
+        picard = popolo.persons[0]
+        assert picard.identifier_value('starfleet') == 'SP-937-215'
+        assert popolo.organizations.get(id='federation').seats == 100
+
+    def test_memberships_deduplicated(self):
+        popolo = merge_popolo([Popolo(LOWER_HOUSE), Popolo(SUPPLEMENTARY)])
+        assert len(popolo.memberships) == 2
+        picard_membership = popolo.memberships[0]
+        assert picard_membership.person_id == 'lower/picard'
+        assert picard_membership.data['end_date'] == '2379'
+
+    def test_merge_without_identifier_schemes(self):
+        popolo = merge_popolo(
+            [Popolo(LOWER_HOUSE), Popolo(SUPPLEMENTARY)], schemes=())
+        assert len(popolo.persons) == 3
+        assert len(popolo.memberships) == 3
+
+    def test_sources_are_not_modified(self):
+        source = Popolo(SUPPLEMENTARY)
+        merge_popolo([Popolo(LOWER_HOUSE), source])
+        assert source.memberships[0].person_id == 'supplementary/picard'
+        assert source.persons[1].name == 'Will Riker'
+
+    def test_merge_sorted_streams(self):
+        stream_a = [
+            {'id': 'a', 'name': 'A'},
+            {'id': 'c', 'name': 'C'},
+        ]
+        stream_b = [
+            {'id': 'a', 'gender': 'female'},
+            {'id': 'b', 'name': 'B'},
+            {'id': 'b', 'gender': 'male'},
+        ]
+        merged = merge_sorted('persons', [iter(stream_a), iter(stream_b)])
+        assert list(merged) == [
+            {'id': 'a', 'name': 'A', 'gender': 'female'},
+            {'id': 'b', 'name': 'B', 'gender': 'male'},
+            {'id': 'c', 'name': 'C'},
+        ]
+
+    def test_merge_sorted_memberships(self):
+        memberships = [
+            m for m in LOWER_HOUSE['memberships'] +
+            SUPPLEMENTARY['memberships'] if m['person_id'] == 'riker']
+        streams = [[m] for m in memberships]
+        merged = list(merge_sorted('memberships', streams))
+        assert merged == [memberships[0]]
+        assert membership_fingerprint(merged[0]) == \
+            membership_fingerprint(memberships[1])
+
+    def test_merge_sorted_records_without_ids(self):
+        stream_a = [{'name': 'No id'}, {'id': 'a', 'name': 'A'}]
+        stream_b = [{'name': 'No id'}, {'id': 'a', 'gender': 'female'}]
+        merged = merge_sorted('persons', [iter(stream_a), iter(stream_b)])
+        assert list(merged) == [
+            {'name': 'No id'},
+            {'name': 'No id'},
+            {'id': 'a', 'name': 'A', 'gender': 'female'},
+        ]
@@ -0,0 +1,307 @@
+from copy import deepcopy
+from random import Random
+from unittest import TestCase
+
+import pytest
+
+from .helpers import example_file
+
+from popolo_data.base import membership_fingerprint
+from popolo_data.importer import Change, Popolo
+
+
+EXAMPLE_MUTATION_JSON = b'''
+{
+    "persons": [
+        {"id": "picard", "name": "Jean-Luc Picard"},
+        {"id": "riker", "name": "William Riker"},
+        {"id": "troi", "name": "Deanna Troi"}
+    ],
+    "organizations": [
+        {"id": "starfleet", "name": "Starfleet"}
+    ],
+    "memberships": [
+        {
+            "person_id": "picard",
+            "organization_id": "starfleet",
+            "start_date": "2323-12-01"
+        },
+        {
+            "person_id": "riker",
+            "organization_id": "starfleet",
+            "start_date": "2353"
+        }
+    ]
+}
+'''
+
+
+class TestMutation(TestCase):
+
+    def test_add_person(self):
+        with example_file(EXAMPLE_MUTATION_JSON) as fname:
+            popolo = Popolo.from_filename(fname)
+            change = popolo.add('persons', {'id': 'data', 'name': 'Data'})
+            assert change == Change(
+                'add', 'persons', 'data', None, {'id': 'data', 'name': 'Data'})
+            assert popolo.persons.get(id='data').name == 'Data'
+            assert popolo.change_log == [change]
+
+    def test_add_duplicate_person_fails(self):
+        with example_file(EXAMPLE_MUTATION_JSON) as fname:
+            popolo = Popolo.from_filename(fname)
+            with pytest.raises(ValueError):
+                popolo.add('persons', {'id': 'riker', 'name': 'Thomas Riker'})
+            assert popolo.change_log == []
+
+    def test_add_to_missing_array(self):
+        with example_file(b'{}') as fname:
+            popolo = Popolo.from_filename(fname)
+            popolo.add('areas', {'id': 'earth', 'name': 'Earth'})
+            assert popolo.areas[0].name == 'Earth'
+
+    def test_unknown_array(self):
+        with example_file(b'{}') as fname:
+            popolo = Popolo.from_filename(fname)
+            with pytest.raises(ValueError):
+                popolo.add('starships', {'id': 'ncc-1701-d'})
+
+    def test_update_person(self):
+        with example_file(EXAMPLE_MUTATION_JSON) as fname:
+            popolo = Popolo.from_filename(fname)
+            old_riker = popolo.persons.get(id='riker')
+            change = popolo.update('persons', 'riker', {'gender': 'male'})
+            assert change.old == {'id': 'riker', 'name': 'William Riker'}
+            assert popolo.persons.get(id='riker').gender == 'male'
+            # Objects wrapping the old data aren't changed:
+            assert old_riker.gender is None
+
+    def test_update_can_remove_fields(self):
+        with example_file(EXAMPLE_MUTATION_JSON) as fname:
+            popolo = Popolo.from_filename(fname)
+            popolo.update('persons', 'riker', {'name': None})
+            assert popolo.persons.get(id='riker').data == {'id': 'riker'}
+
+    def test_update_membership_end_date(self):
+        with example_file(EXAMPLE_MUTATION_JSON) as fname:
+            popolo = Popolo.from_filename(fname)
+            fingerprint = popolo.memberships[1].fingerprint
+            popolo.update('memberships', fingerprint, {'end_date': '2379'})
+            membership = popolo.memberships[1]
+            assert membership.data['end_date'] == '2379'
+            # The end date isn't part of the fingerprint, so the
+            # updated membership can still be found by it:
+            assert membership.fingerprint == fingerprint
+            popolo.update('memberships', fingerprint, {'role': 'captain'})
+            assert popolo.memberships[1].role == 'captain'
+
+    def test_update_changing_key(self):
+        with example_file(EXAMPLE_MUTATION_JSON) as fname:
+            popolo = Popolo.from_filename(fname)
+            popolo.update('persons', 'troi', {'id': 'counsellor-troi'})
+            popolo.update('persons', 'counsellor-troi', {'name': 'Troi'})
+            assert popolo.persons[2].data == \
+                {'id': 'counsellor-troi', 'name': 'Troi'}
+            with pytest.raises(KeyError):
+                popolo.update('persons', 'troi', {'name': 'Deanna'})
+
+    def test_update_to_existing_key_fails(self):
+        with example_file(EXAMPLE_MUTATION_JSON) as fname:
+            popolo = Popolo.from_filename(fname)
+            with pytest.raises(ValueError):
+                popolo.update('persons', 'riker', {'id': 'picard'})
+            assert popolo.persons[1].id == 'riker'
+            assert popolo.change_log == []
+            assert popolo.validate() == []
+
+    def test_update_missing_record(self):
+        with example_file(EXAMPLE_MUTATION_JSON) as fname:
+            popolo = Popolo.from_filename(fname)
+            with pytest.raises(KeyError):
+                popolo.update('persons', 'data', {'name': 'Data'})
+
+    def test_remove_person(self):
+        with example_file(EXAMPLE_MUTATION_JSON) as fname:
+            popolo = Popolo.from_filename(fname)
+            change = popolo.remove('persons', 'picard')
+            assert change.old['name'] == 'Jean-Luc Picard'
+            assert change.new is None
+            assert [p.id for p in popolo.persons] == ['riker', 'troi']
+            assert popolo.persons[1].id == 'troi'
+            # The records that moved can still be found by their keys:
+            popolo.remove('persons', 'troi')
+            assert [p.id for p in popolo.persons] == ['riker']
+            popolo.update('persons', 'riker', {'gender': 'male'})
+            assert popolo.persons[0].gender == 'male'
+
+    def test_remove_duplicate_membership(self):
+        with example_file(EXAMPLE_MUTATION_JSON) as fname:
+            popolo = Popolo.from_filename(fname)
+            data = dict(popolo.memberships[0].data)
+            popolo.add('memberships', data)
+            fingerprint = membership_fingerprint(data)
+            popolo.remove('memberships', fingerprint)
+            assert len(popolo.memberships) == 2
+            popolo.remove('memberships', fingerprint)
+            assert [m.person_id for m in popolo.memberships] == ['riker']
+            with pytest.raises(KeyError):
+                popolo.remove('memberships', fingerprint)
+
+    def test_graph_reflects_changes(self):
+        with example_file(EXAMPLE_MUTATION_JSON) as fname:
+            popolo = Popolo.from_filename(fname)
+            troi = popolo.persons.get(id='troi')
+            assert popolo.graph.co_members(troi) == []
+            popolo.add('memberships', {
+                'person_id': 'troi', 'organization_id': 'starfleet'})
+            assert [p.id for p in popolo.graph.co_members(troi)] == \
+                ['picard', 'riker']
+
+    def test_apply_change_log(self):
+        with example_file(EXAMPLE_MUTATION_JSON) as fname:
+            popolo_a = Popolo.from_filename(fname)
+            popolo_b = Popolo.from_filename(fname)
+        popolo_a.add('persons', {'id': 'data', 'name': 'Data'})
+        popolo_a.update('persons', 'riker', {'name': None, 'gender': 'male'})
+        popolo_a.remove('persons', 'picard')
+        popolo_b.apply_changes(popolo_a.change_log)
+        assert popolo_b.json_data == popolo_a.json_data
+        assert popolo_b.change_log == popolo_a.change_log
+
+
+def graph_summary(popolo):
+    '''Return everything the graph knows, as ids, for comparison'''
+    graph = popolo.graph
+    summary = []
+    for o in list(popolo.persons) + list(popolo.organizations):
+        summary.append((
+            o.id,
+            [n.id for n in graph.neighbours(o)],
+            [m.data for m in graph.memberships_of(o)]))
+    return summary
+
+
+class TestIncrementalUpdates(TestCase):
+
+    def setUp(self):
+        with example_file(EXAMPLE_MUTATION_JSON) as fname:
+            self.popolo = Popolo.from_filename(fname)
+
+    def assert_graph_correct(self):
+        rebuilt = Popolo(deepcopy(self.popolo.json_data))
+        assert graph_summary(self.popolo) == graph_summary(rebuilt)
+
+    def test_collection_and_lookup_updated_in_place(self):
+        persons = self.popolo.persons
+        lookup = persons.lookup_from_key
+        self.popolo.add('persons', {'id': 'data', 'name': 'Data'})
+        self.popolo.update('persons', 'riker', {'id': 'thomas-riker'})
+        assert self.popolo.persons is persons
+        assert persons.lookup_from_key is lookup
+        assert lookup['data'].name == 'Data'
+        assert 'riker' not in lookup
+        assert lookup['thomas-riker'] is persons[1]
+        self.popolo.remove('persons', 'picard')
+        assert 'picard' not in lookup
+        assert [p.id for p in persons] == ['thomas-riker', 'troi', 'data']
+
+    def test_indexes_see_changes(self):
+        persons = self.popolo.persons
+        assert persons.filter(name__normalized='troi').first is None
+        self.popolo.update('persons', 'troi', {'name': 'Troi'})
+        assert persons.filter(name__normalized='troi').first.id == 'troi'
+
+    def test_graph_updated_in_place(self):
+        graph = self.popolo.graph
+        self.popolo.add('organizations', {'id': 'enterprise'})
+        riker = self.popolo.memberships[1].fingerprint
+        self.popolo.update(
+            'memberships', riker, {'organization_id': 'enterprise'})
+        self.popolo.add('memberships', {
+            'person_id': 'troi', 'organization_id': 'enterprise'})
+        assert self.popolo.graph is graph
+        troi = self.popolo.persons.get(id='troi')
+        assert [p.id for p in graph.co_members(troi)] == ['riker']
+        self.assert_graph_correct()
+
+    def test_graph_links_records_added_later(self):
+        graph = self.popolo.graph
+        self.popolo.add('memberships', {
+            'person_id': 'data', 'organization_id': 'enterprise'})
+        self.popolo.add('memberships', {
+            'person_id': 'riker', 'organization_id': 'enterprise'})
+        self.popolo.add('persons', {'id': 'data', 'name': 'Data'})
+        self.popolo.add('organizations', {'id': 'enterprise'})
+        assert self.popolo.graph is graph
+        data = self.popolo.persons.get(id='data')
+        assert [p.id for p in graph.co_members(data)] == ['riker']
+        self.assert_graph_correct()
+
+    def test_graph_rebuilt_after_removal(self):
+        graph = self.popolo.graph
+        self.popolo.remove('persons', 'picard')
+        assert self.popolo.graph is not graph
+        self.assert_graph_correct()
+
+    def test_random_changes_keep_graph_correct(self):
+        random = Random(1701)
+        person_ids = ['picard', 'riker', 'troi', 'data', 'worf']
+        org_ids = ['starfleet', 'enterprise', 'klingons']
+        for step in range(200):
+            self.popolo.graph
+            action = random.choice(['add', 'add', 'update', 'remove'])
+            if action == 'add' and random.random() < 0.2:
+                array = random.choice(['persons', 'organizations'])
+                ids = person_ids if array == 'persons' else org_ids
+                record_id = random.choice(ids)
+                if record_id not in self.popolo._array_positions(array):
+                    self.popolo.add(array, {'id': record_id})
+            elif action == 'add' or not self.popolo.memberships:
+                self.popolo.add('memberships', {
+                    'person_id': random.choice(person_ids),
+                    'organization_id': random.choice(org_ids),
+                    'start_date': str(2300 + step)})
+            elif action == 'update':
+                membership = random.choice(self.popolo.memberships)
+                self.popolo.update('memberships', membership.fingerprint, {
+                    'organization_id': random.choice(org_ids)})
+            else:
+                membership = random.choice(self.popolo.memberships)
+                self.popolo.remove('memberships', membership.fingerprint)
+            if step % 20 == 0:
+                self.assert_graph_correct()
+        self.assert_graph_correct()
+
+    def test_only_dependent_caches_dropped(self):
+        careers = self.popolo.careers()
+        composition = self.popolo.composition('starfleet')
+        self.popolo.add('events', {'id': 'term/1'})
+        assert self.popolo.careers() is careers
+        assert self.popolo.composition('starfleet') is composition
+        self.popolo.add('persons', {'id': 'data'})
+        assert self.popolo.careers() is careers
+        assert self.popolo.composition('starfleet') is not composition
+        self.popolo.add('memberships', {
+            'person_id': 'data', 'organization_id': 'starfleet'})
+        assert 'data' in self.popolo.careers()
+
+    def test_earlier_ordered_views_unchanged(self):
+        view = self.popolo.persons.order_by('name')
+        self.popolo.remove('persons', 'picard')
+        self.popolo.add('persons', {'id': 'barclay', 'name': 'Barclay'})
+        assert [p.id for p in view] == ['troi', 'picard', 'riker']
+        assert [p.id for p in self.popolo.persons.order_by('name')] == \
+            ['barclay', 'troi', 'riker']
+
+    def test_order_by_sees_changes(self):
+        assert self.popolo.persons.order_by('name').first.id == 'troi'
+        self.popolo.add('persons', {'id': 'barclay', 'name': 'Barclay'})
+        assert self.popolo.persons.order_by('name').first.id == 'barclay'
+
+    def test_take_changes(self):
+        self.popolo.add('persons', {'id': 'data'})
+        self.popolo.remove('persons', 'data')
+        changes = self.popolo.take_changes()
+        assert [c.action for c in changes] == ['add', 'remove']
+        assert self.popolo.change_log == []
+        assert self.popolo.take_changes() == []
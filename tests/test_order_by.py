@@ -0,0 +1,89 @@
+from copy import deepcopy
+from datetime import date
+from unittest import TestCase
+
+from popolo_data.importer import Popolo
+
+
+EXAMPLE_DATA = {
+    'persons': [
+        {'id': 'troi', 'name': 'Deanna Troi', 'sort_name': 'Troi'},
+        {'id': 'data', 'name': 'Data'},
+        {'id': 'picard', 'name': 'Jean-Luc Picard', 'sort_name': 'Picard'},
+        {'id': 'riker', 'name': 'William Riker', 'sort_name': 'Riker'},
+    ],
+    'events': [
+        {
+            'id': 'term/2',
+            'classification': 'legislative period',
+            'start_date': '2364',
+        },
+        {
+            'id': 'election',
+            'classification': 'general election',
+            'start_date': '2370-01-01',
+        },
+        {
+            'id': 'term/3',
+            'classification': 'legislative period',
+            'start_date': '2366-05-01',
+        },
+        {
+            'id': 'term/1',
+            'classification': 'legislative period',
+            'start_date': '2360-01-01',
+        },
+    ],
+}
+
+
+class TestOrderBy(TestCase):
+
+    def test_order_by_sort_name(self):
+        view = Popolo(EXAMPLE_DATA).persons.order_by('sort_name')
+        assert [p.id for p in view] == ['picard', 'riker', 'troi', 'data']
+        assert len(view) == 4
+        assert view.first.id == 'picard'
+
+    def test_descending_missing_values_last(self):
+        view = Popolo(EXAMPLE_DATA).persons.order_by('-sort_name')
+        assert [p.id for p in view] == ['troi', 'riker', 'picard', 'data']
+
+    def test_top_k(self):
+        view = Popolo(EXAMPLE_DATA).events.order_by('-start_date')
+        assert [e.id for e in view[:2]] == ['election', 'term/3']
+        assert view[-1].id == 'term/1'
+
+    def test_between(self):
+        view = Popolo(EXAMPLE_DATA).events.order_by('start_date')
+        found = view.between(date(2364, 1, 1), date(2366, 12, 31))
+        assert [e.id for e in found] == ['term/2', 'term/3']
+        assert [e.id for e in view.between(end=date(2364, 7, 2))] == \
+            ['term/1', 'term/2']
+        assert view.between(start=date(2371, 1, 1)) == []
+
+    def test_between_descending(self):
+        view = Popolo(EXAMPLE_DATA).events.order_by('-start_date')
+        found = view.between(date(2366, 12, 31), date(2364, 1, 1))
+        assert [e.id for e in found] == ['term/3', 'term/2']
+
+    def test_order_cached_until_changed(self):
+        popolo = Popolo(deepcopy(EXAMPLE_DATA))
+        first_view = popolo.persons.order_by('sort_name')
+        second_view = popolo.persons.order_by('sort_name')
+        assert first_view.positions is second_view.positions
+        popolo.add('persons', {'id': 'crusher', 'sort_name': 'Crusher'})
+        view = popolo.persons.order_by('sort_name')
+        assert view.first.id == 'crusher'
+
+    def test_filtered_collection_does_not_replace_cache(self):
+        popolo = Popolo(EXAMPLE_DATA)
+        whole = popolo.persons.order_by('sort_name')
+        filtered = popolo.persons.filter(name='Data').order_by('sort_name')
+        assert [p.id for p in filtered] == ['data']
+        assert popolo.persons.order_by('sort_name').positions is \
+            whole.positions
+
+    def test_latest_legislative_period(self):
+        popolo = Popolo(EXAMPLE_DATA)
+        assert popolo.latest_legislative_period.id == 'term/3'
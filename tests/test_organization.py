@@ -272,3 +272,54 @@ class TestOrganizations(TestCase):
             o_b = Popolo.from_filename(fname).organizations[0]
             assert o_a == o_b
             assert not (o_a != o_b)
+
+    def test_filter_by_normalized_name(self):
+        popolo = Popolo({
+            'organizations': [
+                {'id': 'ac', 'name': u'Åländsk Center'},
+                {'id': 'ac-rf', 'name': u'Åländsk Center r.f.'},
+                {'id': 'ac-lower', 'name': u'Åländsk  center',
+                 'classification': 'party'},
+                {'id': 'ad', 'name': u'Åländsk Demokrati',
+                 'other_names': [{'name': u'Aländsk demokrati'}]},
+            ]
+        })
+        found = popolo.organizations.filter(name__normalized=u'ALANDSK CENTER')
+        assert [o.id for o in found] == ['ac', 'ac-lower']
+        found = popolo.organizations.filter(
+            name__normalized=u'alandsk center', classification='party')
+        assert [o.id for o in found] == ['ac-lower']
+        found = popolo.organizations.get(
+            names__normalized=u'ALÄNDSK DEMOKRATI')
+        assert found.id == 'ad'
+        assert popolo.organizations.filter(name__normalized='Nobody') \
+            .first is None
+
+    def test_unique_by_normalized_name(self):
+        popolo = Popolo({
+            'organizations': [
+                {'id': 'ac', 'name': u'Åländsk Center'},
+                {'id': 'af', 'name': u'Ålands Framtid'},
+                {'id': 'ac-lower', 'name': u'Åländsk center'},
+            ]
+        })
+        unique = popolo.organizations.unique_by_normalized_name()
+        assert [o.id for o in unique] == ['ac', 'af']
+        assert unique[0].normalized('name') == u'alandsk center'
+        assert unique[0].normalized_names == frozenset([u'alandsk center'])
+
+    def test_filter_returns_a_view(self):
+        popolo = Popolo({
+            'organizations': [
+                {'id': 'ac', 'name': u'Åländsk Center',
+                 'classification': 'party'},
+                {'id': 'lagting', 'classification': 'legislature'},
+            ]
+        })
+        organizations = popolo.organizations
+        parties = organizations.filter(classification='party')
+        assert parties[0] is organizations[0]
+        assert parties.data_list[0] is organizations.data_list[0]
+        assert parties.filter(id='ac').first is organizations.get(id='ac')
+        assert organizations.unique_by_normalized_name()[1] is \
+            organizations[1]
@@ -548,6 +548,86 @@ class TestPersons(TestCase):
             assert str(expected_substring) in \
                 str(excinfo)
 
+    def test_person_name_timeline(self):
+        with example_file(b'''
+{
+    "persons": [
+        {
+            "name": "Bob",
+            "other_names": [
+                {
+                    "name": "Bobby",
+                    "start_date": "1989-01-01",
+                    "end_date": "2012-12-31"
+                },
+                {
+                    "name": "Robert"
+                },
+                {
+                    "name": "Little Bob",
+                    "end_date": "1988-12-31"
+                }
+            ]
+        }
+    ]
+}
+''') as fname:
+            popolo = Popolo.from_filename(fname)
+            person = popolo.persons.first
+            assert person.name_timeline == [
+                ('0001-01-01', '1988-12-31', 'Little Bob'),
+                ('1989-01-01', '2012-12-31', 'Bobby'),
+            ]
+            assert person.name_at(date(1980, 1, 1)) == 'Little Bob'
+            assert person.name_at(date(1989, 1, 1)) == 'Bobby'
+            assert person.name_at(date(2013, 1, 1)) == 'Bob'
+
+    def test_person_collection_names_at(self):
+        with example_file(b'''
+{
+    "persons": [
+        {
+            "id": "bob",
+            "name": "Bob",
+            "other_names": [
+                {
+                    "name": "Robert",
+                    "start_date": "1989-01-01",
+                    "end_date": "1999-12-31"
+                },
+                {
+                    "name": "Bobby",
+                    "start_date": "1989-01-01",
+                    "end_date": "2012-12-31"
+                }
+            ]
+        },
+        {
+            "id": "alice",
+            "name": "Alice",
+            "other_names": [
+                {
+                    "name": "Alicia",
+                    "end_date": "2001-12-31"
+                }
+            ]
+        },
+        {
+            "id": "carol",
+            "name": "Carol"
+        }
+    ]
+}
+''') as fname:
+            popolo = Popolo.from_filename(fname)
+            bob, alice, carol = popolo.persons
+            names, conflicts = popolo.persons.names_at(date(1996, 1, 1))
+            assert names == {alice: 'Alicia', carol: 'Carol'}
+            assert conflicts == {bob: ['Robert', 'Bobby']}
+            names, conflicts = popolo.persons.names_at(date(2005, 1, 1))
+            assert names == {bob: 'Bobby', alice: 'Alice', carol: 'Carol'}
+            assert conflicts == {}
+
     def test_hash_magic_method(self):
         with example_file(EXAMPLE_TWO_PEOPLE) as fname:
             popolo_a = Popolo.from_filename(fname)
@@ -565,3 +645,51 @@ class TestPersons(TestCase):
             person = popolo.persons.first
             assert not (person == "a string, not a person")
             assert (person != "a string not a person")
+
+    def test_collection_contact_values(self):
+        popolo = Popolo({
+            'persons': [
+                {
+                    'id': 'john-q-public',
+                    'name': 'John Q Public',
+                    'contact_details': [
+                        {'type': 'twitter', 'value': '@JohnQPublic'},
+                        {'type': 'phone', 'value': '9304832'},
+                        {'type': 'fax', 'value': '9304833'},
+                    ],
+                    'links': [
+                        {
+                            'note': 'twitter',
+                            'url': 'https://twitter.com/JohnQPublic',
+                        },
+                        {
+                            'note': 'facebook',
+                            'url': 'https://facebook.com/john-q-public',
+                        },
+                    ],
+                },
+                {
+                    'id': 'jane-doe',
+                    'name': 'Jane Doe',
+                    'links': [
+                        {'note': 'twitter', 'url': 'janedoe'},
+                    ],
+                },
+                {'id': 'anon', 'name': 'Anonymous'},
+            ]
+        })
+        john, jane, anon = popolo.persons
+        handles = popolo.persons.twitter_handles()
+        assert handles == {john: ['JohnQPublic'], jane: ['janedoe']}
+        assert handles[john] == john.twitter_all
+        assert popolo.persons.facebook_urls() == \
+            {john: ['https://facebook.com/john-q-public']}
+        assert popolo.persons.phone_numbers() == {john: ['9304832']}
+        assert popolo.persons.fax_numbers() == {john: ['9304833']}
+        assert popolo.persons.find_by_twitter_handle('@johnqpublic') == [john]
+        assert popolo.persons.find_by_twitter_handle(
+            'https://twitter.com/JaneDoe/') == [jane]
+        assert popolo.persons.find_by_twitter_handle('nobody') == []
+        assert popolo.persons.find_by_contact('phone', '9304832') == [john]
+        with pytest.raises(ValueError):
+            popolo.persons.contact_values('email')
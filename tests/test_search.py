@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+from unittest import TestCase
+
+from popolo_data.base import normalize_name
+from popolo_data.importer import Popolo
+from popolo_data.search import NameSearchIndex, trigrams
+
+
+EXAMPLE_DATA = {
+    'persons': [
+        {
+            'id': 'aaltonen',
+            'name': u'Aaltonen Carina',
+            'given_name': u'Carina',
+            'family_name': u'Aaltonen',
+        },
+        {
+            'id': 'eriksson',
+            'name': u'Eriksson Viveka',
+            'other_names': [{'name': u'Viveka Erikson'}],
+        },
+        {
+            'id': 'karlstrom',
+            'name': u'Karlström Mikael',
+        },
+    ],
+    'organizations': [
+        {'id': 'center', 'name': u'Åländsk Center'},
+        {
+            'id': 'liberalerna',
+            'name': u'Liberalerna',
+            'other_names': [{'name': u'Liberalerna på Åland r.f.'}],
+        },
+    ],
+}
+
+
+class TestNameSearch(TestCase):
+
+    def test_normalize_name(self):
+        assert normalize_name(u'  Åländsk\tCENTER ') == u'alandsk center'
+        assert normalize_name(None) is None
+
+    def test_trigrams(self):
+        assert trigrams(u'ab c') == set(
+            [u'  a', u' ab', u'ab ', u'b  ', u'  c', u' c '])
+
+    def test_search_person_by_other_name(self):
+        index = NameSearchIndex.from_popolo(Popolo(EXAMPLE_DATA))
+        results = index.search(u'Viveka Eriksson')
+        assert [o.id for _, o in results] == ['eriksson']
+
+    def test_search_person_by_given_and_family_name(self):
+        index = NameSearchIndex.from_popolo(Popolo(EXAMPLE_DATA))
+        score, person = index.search(u'carina aaltonen')[0]
+        assert person.id == 'aaltonen'
+        assert score > 1
+
+    def test_search_ignores_accents_and_tolerates_typos(self):
+        index = NameSearchIndex.from_popolo(Popolo(EXAMPLE_DATA))
+        results = index.search(u'Karlstrom Mikeal')
+        assert [o.id for _, o in results] == ['karlstrom']
+        results = index.search(u'alandsk centre')
+        assert [o.id for _, o in results] == ['center']
+
+    def test_search_results_are_ranked(self):
+        index = NameSearchIndex.from_popolo(Popolo(EXAMPLE_DATA))
+        results = index.search(u'Åland', min_score=0.1)
+        assert [o.id for _, o in results] == ['liberalerna', 'center']
+        assert results[0][0] > results[1][0]
+
+    def test_no_results(self):
+        index = NameSearchIndex.from_popolo(Popolo(EXAMPLE_DATA))
+        assert index.search(u'Zebedee') == []
+        assert index.search(u'   ') == []
+
+    def test_incremental_updates(self):
+        popolo = Popolo(dict(
+            (k, [dict(r) for r in v]) for k, v in EXAMPLE_DATA.items()))
+        index = NameSearchIndex.from_popolo(popolo)
+        popolo.add('persons', {'id': 'sundback', 'name': u'Sundback Barbro'})
+        popolo.update('persons', 'karlstrom', {'name': u'Karlsson Mikael'})
+        popolo.remove('organizations', 'center')
+        index.apply_changes(popolo.change_log)
+        assert [o.id for _, o in index.search(u'Barbro Sundback')] == \
+            ['sundback']
+        assert index.search(u'Karlström') == []
+        assert [o.id for _, o in index.search(u'Karlsson')] == ['karlstrom']
+        assert index.search(u'Åländsk Center') == []
+        persons = popolo.persons.lookup_from_key
+        assert index.search(u'Barbro Sundback')[0][1] is persons['sundback']
+        assert index.search(u'Karlsson')[0][1] is persons['karlstrom']
+        assert set(index.trigram_postings) == set(
+            t for _, name, _, _ in index.entries.values()
+            for t in trigrams(name))
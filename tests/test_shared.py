@@ -0,0 +1,357 @@
+from datetime import date
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from mock import PropertyMock, patch
+
+from popolo_data.base import BuildCache, build_once
+from popolo_data.importer import Popolo
+from popolo_data.lazy import LazyJSONData
+from popolo_data.shared import PopoloHandle, SharedPopolo, \
+    approximate_size, copy_popolo
+
+
+THREADS = 8
+
+
+def example_data(n_persons=50):
+    persons = [
+        {
+            'id': 'person-{0}'.format(i),
+            'name': u'Person {0}'.format(i),
+            'contact_details': [
+                {'type': 'twitter', 'value': '@person{0}'.format(i)}],
+        }
+        for i in range(n_persons)]
+    memberships = [
+        {'person_id': p['id'], 'organization_id': 'house'}
+        for p in persons]
+    return {
+        'persons': persons,
+        'organizations': [{'id': 'house', 'name': 'House'}],
+        'memberships': memberships,
+    }
+
+
+def run_threads(target, n=THREADS):
+    '''Run target(i) in n threads, starting them all at once
+
+    Returns a list of the values returned, and re-raises the first
+    exception that any thread raised.'''
+    start = threading.Event()
+    results = [None] * n
+    errors = []
+
+    def run(i):
+        start.wait()
+        try:
+            results[i] = target(i)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    start.set()
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+class TestConcurrentReads(TestCase):
+
+    def test_graph_built_once(self):
+        popolo = Popolo(example_data())
+        graphs = run_threads(lambda i: popolo.graph)
+        assert all(g is graphs[0] for g in graphs)
+
+    def test_contact_index_shared(self):
+        popolo = Popolo(example_data())
+        persons = popolo.persons
+
+        def find(i):
+            found = []
+            for j in range(50):
+                handle = 'person{0}'.format((i + j) % 50)
+                found.extend(
+                    p.id for p in persons.find_by_twitter_handle(handle))
+            return found
+
+        for i, found in enumerate(run_threads(find)):
+            assert found == [
+                'person-{0}'.format((i + j) % 50) for j in range(50)]
+        assert len(persons.twitter_handles()) == 50
+
+    def test_normalized_filter(self):
+        popolo = Popolo(example_data())
+        persons = popolo.persons
+        results = run_threads(
+            lambda i: persons.filter(name__normalized=u'PERSON 7').first.id)
+        assert results == ['person-7'] * THREADS
+
+    def test_lazy_data(self):
+        text = json.dumps(example_data())
+        popolo = Popolo(LazyJSONData(text))
+        results = run_threads(
+            lambda i: (len(popolo.persons), len(popolo.memberships)))
+        assert results == [(50, 50)] * THREADS
+
+    def _start_slow_build(self, popolo, key):
+        building = threading.Event()
+        finish = threading.Event()
+
+        def build():
+            building.set()
+            finish.wait(10)
+            return 'built'
+
+        thread = threading.Thread(
+            target=build_once, args=(popolo._caches, key, build))
+        thread.start()
+        assert building.wait(10)
+        return thread, finish
+
+    def test_datasets_build_indexes_independently(self):
+        slow = Popolo(example_data())
+        other = Popolo(example_data())
+        thread, finish = self._start_slow_build(slow, 'graph')
+        try:
+            started = time.time()
+            results = run_threads(
+                lambda i: len(other.composition('house').at(date.today())))
+            assert results == [50] * THREADS
+            assert time.time() - started < 5
+            assert 'graph' not in slow._caches
+        finally:
+            finish.set()
+            thread.join()
+        assert slow._caches['graph'] == 'built'
+
+    def test_other_keys_build_while_one_is_building(self):
+        popolo = Popolo(example_data())
+        thread, finish = self._start_slow_build(popolo, 'slow')
+        try:
+            assert len(popolo.graph.persons) == 50
+        finally:
+            finish.set()
+            thread.join()
+        assert popolo._caches['slow'] == 'built'
+        assert popolo._caches._locks == {}
+
+    def test_build_once_shares_result(self):
+        cache = BuildCache()
+        calls = []
+
+        def build():
+            calls.append(1)
+            time.sleep(0.01)
+            return object()
+
+        results = run_threads(lambda i: build_once(cache, 'key', build))
+        assert len(calls) == 1
+        assert all(r is results[0] for r in results)
+
+
+class TestSharedPopolo(TestCase):
+
+    def test_copy_is_independent(self):
+        original = Popolo(example_data(2))
+        copied = copy_popolo(original)
+        copied.remove('persons', 'person-0')
+        assert len(original.persons) == 2
+        assert len(copied.persons) == 1
+
+    def test_publish(self):
+        shared = SharedPopolo(Popolo(example_data(1)))
+        new_popolo = Popolo(example_data(2))
+        assert shared.publish(new_popolo) == 1
+        assert shared.snapshot() == (1, new_popolo)
+        assert shared.current is new_popolo
+
+    def test_modify(self):
+        original = Popolo(example_data(1))
+        shared = SharedPopolo(original)
+        shared.modify(lambda p: p.add('persons', {'id': 'new'}))
+        assert shared.version == 1
+        assert len(shared.current.persons) == 2
+        assert len(original.persons) == 1
+        assert shared.current.change_log[0].key == 'new'
+
+    def test_readers_see_consistent_snapshots(self):
+        shared = SharedPopolo(Popolo(example_data()))
+        writes = 30
+
+        def add_person(n):
+            def add(popolo):
+                person_id = 'added-{0}'.format(n)
+                popolo.add('persons', {'id': person_id})
+                popolo.add('memberships', {
+                    'person_id': person_id, 'organization_id': 'house'})
+            return add
+
+        def work(i):
+            if i == 0:
+                for n in range(writes):
+                    shared.modify(add_person(n))
+                return None
+            seen = set()
+            while shared.version < writes:
+                version, popolo = shared.snapshot()
+                # Each version adds exactly one person and membership,
+                # and the indexes built from it must agree:
+                assert len(popolo.persons) == 50 + version
+                assert len(popolo.memberships) == 50 + version
+                house = popolo.organizations.first
+                assert len(popolo.graph.memberships_of(house)) == \
+                    50 + version
+                seen.add(version)
+            return seen
+
+        run_threads(work)
+        assert len(shared.current.persons) == 50 + writes
+        assert len(shared.current.change_log) == 2 * writes
+
+
+class TestPopoloHandle(TestCase):
+
+    def loader(self, *datasets):
+        '''Return a loader that returns each dataset in turn'''
+        remaining = list(datasets)
+
+        def load():
+            data = remaining.pop(0)
+            if isinstance(data, Exception):
+                raise data
+            return Popolo(json.loads(json.dumps(data)))
+        return load
+
+    def test_initial_load(self):
+        handle = PopoloHandle(self.loader(example_data(3)))
+        assert handle.version == 0
+        assert len(handle.current.persons) == 3
+        assert handle.metrics.total_records == 7
+        assert handle.metrics.shared_records == 0
+        assert handle.metrics.approximate_bytes is None
+
+    def test_size_only_measured_when_changed(self):
+        changed = example_data(3)
+        changed['persons'][0]['name'] = 'Renamed'
+        loader = self.loader(example_data(3), example_data(3), changed)
+        with patch('popolo_data.shared.approximate_size',
+                   return_value=1234) as approximate:
+            handle = PopoloHandle(loader, measure_size=True)
+            assert handle.metrics.approximate_bytes == 1234
+            assert handle.reload().approximate_bytes == 1234
+            assert approximate.call_count == 1
+            handle.reload()
+            assert approximate.call_count == 2
+
+    def test_unchanged_reload_keeps_popolo(self):
+        handle = PopoloHandle(self.loader(example_data(3), example_data(3)))
+        original = handle.current
+        metrics = handle.reload()
+        assert handle.current is original
+        assert metrics.version == 0
+        assert metrics.shared_records == 7
+
+    def test_changed_reload_shares_records(self):
+        changed = example_data(3)
+        changed['persons'][0]['name'] = 'Renamed'
+        handle = PopoloHandle(self.loader(example_data(3), changed))
+        old = handle.current
+        metrics = handle.reload()
+        new = handle.current
+        assert metrics.version == 1
+        assert metrics.shared_records == 6
+        assert new.persons.first.name == 'Renamed'
+        assert old.persons.first.name == 'Person 0'
+        assert new.json_data['persons'][1] is old.json_data['persons'][1]
+        assert new.json_data['memberships'] is old.json_data['memberships']
+
+    def test_sqlite_reload(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'popolo.sqlite')
+            Popolo(example_data(3)).to_sqlite(path)
+            loaded = []
+
+            def load():
+                loaded.append(Popolo.from_sqlite(path))
+                return loaded[-1]
+
+            with patch('popolo_data.sqlite.SQLitePopolo.json_data',
+                       new_callable=PropertyMock) as json_data:
+                handle = PopoloHandle(load, measure_size=True)
+                handle.reload()
+                metrics = handle.reload()
+                assert not json_data.called
+            assert handle.current is loaded[-1]
+            assert metrics.version == 2
+            assert metrics.shared_records == 0
+            assert metrics.total_records == 7
+            assert metrics.approximate_bytes is None
+            assert handle.current.persons.first.name == 'Person 0'
+        finally:
+            for popolo in loaded:
+                popolo.close()
+            shutil.rmtree(directory)
+
+    def test_reload_in_background(self):
+        loading = threading.Event()
+        proceed = threading.Event()
+        datasets = [example_data(1), example_data(2)]
+
+        def load():
+            if len(datasets) == 1:
+                loading.set()
+                proceed.wait()
+            return Popolo(datasets.pop(0))
+
+        warmed = []
+        handle = PopoloHandle(load, warm=lambda p: warmed.append(p.graph))
+        old = handle.current
+        thread = handle.reload_in_background()
+        loading.wait()
+        assert handle.reload_in_background() is thread
+        # Queries carry on using the old version while the new one loads:
+        assert handle.current is old
+        proceed.set()
+        thread.join()
+        assert handle.version == 1
+        assert len(handle.current.persons) == 2
+        assert len(old.persons) == 1
+        assert warmed[-1] is handle.current.graph
+
+    def test_failed_reload(self):
+        error = IOError('Download failed')
+        handle = PopoloHandle(self.loader(example_data(1), error))
+        handle.reload_in_background().join()
+        assert handle.last_error is error
+        assert handle.version == 0
+
+    def test_periodic_reload(self):
+        handle = PopoloHandle(self.loader(
+            example_data(1), example_data(2), example_data(2)))
+        thread = handle.start(0.01)
+        while handle.version == 0:
+            time.sleep(0.01)
+        handle.stop()
+        thread.join()
+        assert len(handle.current.persons) == 2
+
+
+class TestApproximateSize(TestCase):
+
+    def test_shared_objects_counted_once(self):
+        record = {'id': 'x' * 1000}
+        other = {'id': 'y' * 1000}
+        assert approximate_size([record, record]) + 1000 < \
+            approximate_size([record, other])
+        assert approximate_size([record]) > 1000
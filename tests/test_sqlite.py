@@ -0,0 +1,171 @@
+from datetime import date
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import pytest
+
+from .helpers import example_file
+
+from popolo_data.base import Person
+from popolo_data.importer import Popolo
+from popolo_data.sqlite import ReadOnlyError, SQLitePopolo
+
+
+EXAMPLE_JSON = b'''
+{
+    "persons": [
+        {"id": "picard", "name": "Jean-Luc Picard", "gender": "male"},
+        {"id": "riker", "name": "William Riker", "gender": "male"},
+        {"id": "troi", "name": "Deanna Troi", "gender": "female"}
+    ],
+    "organizations": [
+        {"id": "starfleet", "name": "Starfleet"},
+        {"id": "federation", "name": "Federation", "classification": "party"}
+    ],
+    "events": [
+        {
+            "id": "term/1",
+            "classification": "legislative period",
+            "start_date": "2364-01-01",
+            "end_date": "2370-12-31"
+        },
+        {
+            "id": "term/2",
+            "classification": "legislative period",
+            "start_date": "2371-01-01"
+        },
+        {"id": "election/2370", "classification": "general election"}
+    ],
+    "memberships": [
+        {
+            "person_id": "picard",
+            "organization_id": "starfleet",
+            "on_behalf_of_id": "federation",
+            "legislative_period_id": "term/1"
+        },
+        {
+            "person_id": "riker",
+            "organization_id": "starfleet",
+            "legislative_period_id": "term/2"
+        },
+        {
+            "person_id": "picard",
+            "organization_id": "starfleet",
+            "legislative_period_id": "term/2"
+        }
+    ]
+}
+'''
+
+
+class TestSQLite(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        path = os.path.join(self.directory, 'popolo.sqlite')
+        with example_file(EXAMPLE_JSON) as fname:
+            Popolo.from_filename(fname).to_sqlite(path)
+        self.popolo = Popolo.from_sqlite(path)
+
+    def tearDown(self):
+        self.popolo.close()
+        shutil.rmtree(self.directory)
+
+    def test_from_sqlite(self):
+        assert isinstance(self.popolo, SQLitePopolo)
+        assert len(self.popolo.persons) == 3
+        assert len(self.popolo.posts) == 0
+        assert self.popolo.persons[0].name == 'Jean-Luc Picard'
+        assert self.popolo.persons[-1].name == 'Deanna Troi'
+        assert [p.id for p in self.popolo.persons[1:]] == ['riker', 'troi']
+        with pytest.raises(IndexError):
+            self.popolo.persons[3]
+
+    def test_filter_and_get(self):
+        found = self.popolo.persons.filter(gender='male', name='William Riker')
+        assert [p.id for p in found] == ['riker']
+        assert len(self.popolo.persons.filter(gender='male')) == 2
+        assert self.popolo.persons.get(id='troi').name == 'Deanna Troi'
+        with pytest.raises(Person.DoesNotExist):
+            self.popolo.persons.get(id='data')
+        with pytest.raises(Person.MultipleObjectsReturned):
+            self.popolo.persons.get(gender='male')
+
+    def test_filter_by_normalized_name(self):
+        found = self.popolo.persons.filter(name__normalized='deanna  TROI')
+        assert [p.id for p in found] == ['troi']
+
+    def test_relationships(self):
+        picard = self.popolo.persons.get(id='picard')
+        memberships = picard.memberships
+        assert len(memberships) == 2
+        assert memberships[0].on_behalf_of.name == 'Federation'
+        assert memberships[0].person is picard
+        assert [m.person_id for m in self.popolo.events[1].memberships] == \
+            ['riker', 'picard']
+
+    def test_events(self):
+        assert [e.id for e in self.popolo.elections] == ['election/2370']
+        assert len(self.popolo.legislative_periods) == 2
+        assert self.popolo.latest_term.id == 'term/2'
+        assert self.popolo.terms[0].current_at(date(2365, 1, 1))
+
+    def test_in_memory_collection_methods(self):
+        names, conflicts = self.popolo.persons.names_at(date(2370, 1, 1))
+        assert len(names) == 3
+
+    def test_json_data_and_read_only(self):
+        with example_file(EXAMPLE_JSON) as fname:
+            assert self.popolo.json_data['memberships'] == \
+                Popolo.from_filename(fname).json_data['memberships']
+        with pytest.raises(ReadOnlyError):
+            self.popolo.add('persons', {'id': 'data'})
+        with pytest.raises(ReadOnlyError):
+            self.popolo.remove('persons', 'picard')
+
+    def test_shared_state(self):
+        assert self.popolo.weak_reference() is self.popolo
+        assert self.popolo.identity_map is None
+        assert self.popolo.change_log == []
+
+    def test_in_bulk(self):
+        found = self.popolo.persons.in_bulk(['troi', 'picard', 'data'])
+        assert sorted(found) == ['picard', 'troi']
+        assert found['troi'].name == 'Deanna Troi'
+        males = self.popolo.persons.filter(gender='male')
+        assert list(males.in_bulk(['troi', 'riker'])) == ['riker']
+        assert [p.id for p in males.get_many(['riker', 'picard'])] == \
+            ['riker', 'picard']
+        with pytest.raises(Person.DoesNotExist):
+            self.popolo.persons.in_bulk(['data'], missing='raise')
+
+    def test_in_bulk_many_ids(self):
+        ids = ['missing-{0}'.format(i) for i in range(2000)] + ['riker']
+        assert list(self.popolo.persons.in_bulk(ids)) == ['riker']
+
+    def test_related_objects(self):
+        memberships = self.popolo.memberships
+        assert [p.id for p in memberships.persons()] == ['picard', 'riker']
+        assert [o.id for o in memberships.parties()] == ['federation']
+        fingerprint = memberships[1].fingerprint
+        assert memberships.in_bulk([fingerprint])[fingerprint].person_id == \
+            'riker'
+
+    def test_membership_lookup(self):
+        memberships = self.popolo.memberships
+        membership = memberships[1]
+        lookup = memberships.lookup_from_key
+        assert lookup[membership.fingerprint] is membership
+        assert membership.fingerprint in lookup
+        assert lookup.get('missing') is None
+        assert memberships.filter(person_id='picard').lookup_from_key.get(
+            membership.fingerprint) is None
+
+    def test_composition(self):
+        seats = self.popolo.composition('starfleet').at(date(2365, 1, 1))
+        assert [s.person.id for s in seats] == ['picard', 'riker', 'picard']
+        assert seats[0].party.name == 'Federation'
+        assert seats[0].post is None
+        assert self.popolo.persons.lookup_from_key.get('data') is None
@@ -0,0 +1,131 @@
+import bz2
+import json
+from unittest import TestCase
+
+from .helpers import example_file
+
+from popolo_data.importer import Popolo
+from popolo_data.validation import is_valid_twitter, validate_file
+
+
+EXAMPLE_BAD_DATA = {
+    'persons': [
+        {
+            'id': 'picard',
+            'birth_date': '2305-07-13',
+            'contact_details': [{'type': 'twitter', 'value': '@jlpicard'}],
+            'links': [
+                {'note': 'twitter', 'url': 'https://twitter.com/jlpicard'}],
+        },
+        {
+            'id': 'riker',
+            'birth_date': 'last Tuesday',
+            'contact_details': [
+                {'type': 'twitter', 'value': 'not a username'}],
+            'links': [
+                {'note': 'twitter', 'url': 'https://example.com/riker'}],
+        },
+        {'id': 'picard'},
+        {'name': 'Nobody'},
+    ],
+    'organizations': [
+        {'id': 'starfleet'},
+        {
+            'id': 'section-31',
+            'parent_id': 'starfleet',
+            'other_names': [
+                {'name': 'Bureau', 'start_date': 'bad',
+                 'end_date': '2000-13-01'},
+                {'name': 'Office', 'start_date': '2370',
+                 'end_date': '2360'},
+                {'name': 'Section 31', 'start_date': '2150'},
+            ],
+        },
+        {'id': 'maquis', 'parent_id': 'federation'},
+    ],
+    'memberships': [
+        {
+            'person_id': 'picard',
+            'organization_id': 'starfleet',
+            'start_date': '2323',
+            'end_date': '2379-12-31',
+        },
+        {
+            'person_id': 'riker',
+            'organization_id': 'enterprise',
+            'legislative_period_id': 'term/1',
+            'start_date': '2379',
+            'end_date': '2370',
+        },
+    ],
+}
+
+
+class TestValidation(TestCase):
+
+    def expected_problems(self):
+        return [
+            'persons[1].birth_date: malformed date {0!r}'.format(
+                u'last Tuesday'),
+            'persons[1].contact_details: malformed Twitter username or '
+            'URL {0!r}'.format(u'not a username'),
+            'persons[1].links: malformed Twitter username or URL '
+            '{0!r}'.format(u'https://example.com/riker'),
+            'persons[2].id: duplicate id {0!r}'.format(u'picard'),
+            'persons[3].id: missing id',
+            'organizations[1].other_names[0].start_date: malformed date '
+            '{0!r}'.format(u'bad'),
+            'organizations[1].other_names[0].end_date: malformed date '
+            '{0!r}'.format(u'2000-13-01'),
+            'organizations[1].other_names[1].end_date: end_date is before '
+            'start_date',
+            'memberships[1].organization_id: no organizations record '
+            'with id {0!r}'.format(u'enterprise'),
+            'memberships[1].legislative_period_id: no events record '
+            'with id {0!r}'.format(u'term/1'),
+            'memberships[1].end_date: end_date is before start_date',
+            'organizations[2].parent_id: no organizations record '
+            'with id {0!r}'.format(u'federation'),
+        ]
+
+    def test_validate(self):
+        data = json.loads(json.dumps(EXAMPLE_BAD_DATA))
+        problems = Popolo(data).validate()
+        assert [str(p) for p in problems] == self.expected_problems()
+        assert problems[0].array == 'persons'
+        assert problems[0].index == 1
+        assert problems[0].field == 'birth_date'
+
+    def test_valid_data(self):
+        data = {
+            'persons': [{'id': 'picard'}],
+            'memberships': [{'person_id': 'picard'}],
+        }
+        assert Popolo(data).validate() == []
+
+    def test_validate_file(self):
+        text = json.dumps(EXAMPLE_BAD_DATA).encode('utf-8')
+        with example_file(text) as fname:
+            problems = list(validate_file(fname))
+        assert [str(p) for p in problems] == self.expected_problems()
+
+    def test_validate_compressed_file(self):
+        text = json.dumps(EXAMPLE_BAD_DATA).encode('utf-8')
+        with example_file(bz2.compress(text)) as fname:
+            problems = list(validate_file(fname))
+        assert [str(p) for p in problems] == self.expected_problems()
+
+    def test_validate_lazy_popolo_keeps_data(self):
+        text = json.dumps(EXAMPLE_BAD_DATA).encode('utf-8')
+        with example_file(text) as fname:
+            popolo = Popolo.from_filename(fname, lazy=True)
+        assert len(popolo.validate()) == len(self.expected_problems())
+        assert len(popolo.persons) == 4
+
+    def test_is_valid_twitter(self):
+        assert is_valid_twitter('jlpicard')
+        assert is_valid_twitter('@jl_picard ')
+        assert is_valid_twitter('http://www.twitter.com/jlpicard/')
+        assert not is_valid_twitter('https://twitter.com/')
+        assert not is_valid_twitter('an-invalid-handle-that-is-too-long')
+        assert not is_valid_twitter(None)